@@ -22,6 +22,9 @@ if "bpy" in locals():
     importlib.reload(ui)
     importlib.reload(display)
     importlib.reload(helpers)
+    importlib.reload(tracing)
+    importlib.reload(hashing)
+    importlib.reload(cache)
     importlib.reload(geotags)
     importlib.reload(uv)
     importlib.reload(sets)
@@ -31,6 +34,8 @@ if "bpy" in locals():
     importlib.reload(sets_export)
     importlib.reload(export)
     importlib.reload(baker)
+    importlib.reload(workers)
+    importlib.reload(batch)
 
 import bpy
 from . import enums
@@ -39,6 +44,9 @@ from . import settings
 from . import ui
 from . import display
 from . import helpers
+from . import tracing
+from . import hashing
+from . import cache
 from . import geotags
 from . import uv
 from . import sets
@@ -48,14 +56,16 @@ from . import sets_cage
 from . import sets_export
 from . import export
 from . import baker
+from . import workers
+from . import batch
 
     
 modules = [
-    data, settings, ui, display, helpers,
+    data, settings, ui, display, helpers, tracing, hashing, cache,
     geotags,
     uv, 
     sets, sets_low, sets_high, sets_cage, sets_export,
-    export, baker]
+    export, baker, workers, batch]
     
 def register():
     print("-------Registering gflow-------")
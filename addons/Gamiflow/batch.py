@@ -0,0 +1,166 @@
+import bpy
+import os
+import sys
+import json
+import time
+import argparse
+import addon_utils
+from . import sets_low
+from . import sets_high
+from . import sets_cage
+from . import sets_export
+from . import export
+from . import uv
+from . import helpers
+from . import workers
+from . import tracing
+
+# Headless entry point, e.g.:
+#   blender --background --python-expr "import bl_ext.user_default.gamiflow_full.batch as b; b.main()" -- --files a.blend b.blend --output ./out --report report.json
+# The module is bl_ext.<repository>.gamiflow_full when installed as an extension (user_default for "Install from Disk"), or Gamiflow as a legacy add-on.
+# Every file is opened in turn and each of its scenes goes through the requested stages.
+# The report lists the duration, object count and written files of every stage, and failures don't stop the other files from being processed.
+
+STAGES = ["unwrap", "low", "high", "cage", "painter_export", "export", "final_export"]
+
+def countObjects(collection):
+    if collection is None: return 0
+    return len(collection.all_objects)
+
+def runUnwrap(context, outputFolder):
+    udims = range(0, len(context.scene.gflow.udims))
+    if not workers.unwrapInWorkers(context, udims): uv.autoUnwrap(context, udims)
+    unwrappables, collections = uv.filterUnwrappableOrPackableObjects(context.scene.gflow.workingCollection.all_objects)
+    return len(unwrappables), []
+def runLow(context, outputFolder):
+    with tracing.session(context, "low"):
+        if not workers.generateInWorkers(context, 'LOW'): sets_low.generatePainterLow(context)
+    return countObjects(context.scene.gflow.painterLowCollection), []
+def runHigh(context, outputFolder):
+    with tracing.session(context, "high"):
+        if not workers.generateInWorkers(context, 'HIGH'): sets_high.generatePainterHigh(context)
+    return countObjects(context.scene.gflow.painterHighCollection), []
+def runCage(context, outputFolder):
+    if not context.scene.gflow.useCage: return 0, []
+    # The low set already generates the cage, and the cage can't exist without it
+    if countObjects(context.scene.gflow.painterCageCollection) == 0:
+        if countObjects(context.scene.gflow.painterLowCollection) == 0: sets_low.generatePainterLow(context)
+        else: sets_cage.generatePainterCage(context)
+    return countObjects(context.scene.gflow.painterCageCollection), []
+def runPainterExport(context, outputFolder):
+    files = export.exportPainter(context, outputFolder)
+    return len(files), files
+def runExport(context, outputFolder):
+    with tracing.session(context, "export"):
+        if not workers.generateInWorkers(context, 'EXPORT'): sets_export.generateExport(context)
+    return countObjects(context.scene.gflow.exportCollection), []
+def runFinalExport(context, outputFolder):
+    # Exporting to the blender library means that the export set itself is the output
+    if context.scene.gflow.exportTarget == 'BLENDER_LIB': return 0, []
+    files = export.exportFinal(context, outputFolder)
+    return len(files), files
+
+STAGE_FUNCTIONS = {
+    "unwrap": runUnwrap,
+    "low": runLow,
+    "high": runHigh,
+    "cage": runCage,
+    "painter_export": runPainterExport,
+    "export": runExport,
+    "final_export": runFinalExport,
+}
+
+def ensureRegistered():
+    # Importing the module from the command line doesn't necessarily mean the addon is enabled
+    if not hasattr(bpy.types.Scene, "gflow"):
+        addon_utils.enable(__package__, default_set=False)
+
+def processScene(scene, stages, outputFolder):
+    report = {"scene": scene.name, "stages": [], "files": [], "error": None}
+    if not scene.gflow.workingCollection:
+        report["error"] = "No working collection"
+        return report
+    with bpy.context.temp_override(scene=scene, view_layer=scene.view_layers[0]):
+        context = bpy.context
+        if context.object and context.object.mode != 'OBJECT': bpy.ops.object.mode_set(mode='OBJECT')
+        for stage in stages:
+            start = time.perf_counter()
+            try:
+                count, files = STAGE_FUNCTIONS[stage](context, outputFolder)
+            except Exception as e:
+                report["error"] = stage+": "+repr(e)
+                print("GamiFlow: "+stage+" failed on scene "+scene.name+":\n"+repr(e))
+                break
+            report["stages"].append({"name": stage, "seconds": round(time.perf_counter()-start, 4), "objects": count})
+            report["files"] += files
+    return report
+
+def processFile(filepath, sceneNames, stages, outputFolder=None, save=False):
+    report = {"file": filepath, "scenes": [], "error": None}
+    start = time.perf_counter()
+    try:
+        bpy.ops.wm.open_mainfile(filepath=filepath)
+    except Exception as e:
+        report["error"] = repr(e)
+        return report
+    ensureRegistered()
+
+    folder = outputFolder if outputFolder else os.path.dirname(bpy.data.filepath)
+    os.makedirs(folder, exist_ok=True)
+
+    scenes = [s for s in bpy.data.scenes if s.gflow.workingCollection]
+    if sceneNames: scenes = [s for s in bpy.data.scenes if s.name in sceneNames]
+    for scene in scenes:
+        report["scenes"].append(processScene(scene, stages, folder))
+
+    if save:
+        try:
+            bpy.ops.wm.save_mainfile()
+        except Exception as e:
+            report["error"] = repr(e)
+    report["seconds"] = round(time.perf_counter()-start, 4)
+    return report
+
+def run(files, sceneNames=None, stages=STAGES, outputFolder=None, reportPath=None, save=False):
+    ensureRegistered()
+    start = time.perf_counter()
+    report = {"version": ".".join(str(v) for v in bpy.app.version), "stages": list(stages), "files": []}
+    for f in files:
+        report["files"].append(processFile(os.path.abspath(f), sceneNames, stages, outputFolder, save))
+    report["seconds"] = round(time.perf_counter()-start, 4)
+    report["success"] = all(f["error"] is None and all(s["error"] is None for s in f["scenes"]) for f in report["files"])
+
+    text = json.dumps(report, indent=2)
+    if reportPath:
+        with open(reportPath, "w") as f: f.write(text)
+    else:
+        print(text)
+    return report
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--")+1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(prog="gamiflow", description="Process GamiFlow scenes without the UI")
+    parser.add_argument("--files", nargs="+", required=True, help="Blend files to process")
+    parser.add_argument("--scenes", nargs="*", default=None, help="Scenes to process (default: every scene with a working collection)")
+    parser.add_argument("--stages", nargs="*", default=STAGES, choices=STAGES, help="Stages to run, in order")
+    parser.add_argument("--output", default=None, help="Output folder (default: next to each blend file)")
+    parser.add_argument("--report", default=None, help="Where to write the JSON report (default: stdout)")
+    parser.add_argument("--save", action="store_true", help="Save the blend files once processed")
+    args = parser.parse_args(argv)
+
+    report = run(args.files, args.scenes, args.stages, args.output, args.report, args.save)
+    if bpy.app.background: sys.exit(0 if report["success"] else 1)
+    return report
+
+
+classes = []
+
+def register():
+    for c in classes:
+        bpy.utils.register_class(c)
+    pass
+def unregister():
+    for c in reversed(classes):
+        helpers.safeUnregisterClass(c)
+    pass
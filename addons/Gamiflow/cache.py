@@ -0,0 +1,242 @@
+import bpy
+import os
+from . import helpers
+
+# Persistent cache of processed meshes, tagged with the content hash of whatever they were generated from
+# The meshes are either kept in the blend file as fake-user datablocks, or written as small libraries in a folder next to it
+CACHE_KEY_PROPERTY = "gflow_cache_key"
+CACHE_KIND_PROPERTY = "gflow_cache_kind"
+CACHE_SCENE_PROPERTY = "gflow_cache_scene"
+CACHE_MATERIALS_PROPERTY = "gflow_cache_materials"
+CACHE_SOURCE_PROPERTY = "gflow_cache_source"
+CACHE_VERSION = 1
+CACHE_FOLDER = "//gamiflow_cache"
+# Processed collection instance templates of the export set are kept as objects of this (unlinked) collection
+TEMPLATE_COLLECTION = "GFLOW_ExportTemplates"
+
+# When the sets are generated by several processes, each of them only sees part of the cache
+# so nothing can be pruned until they are all done. The usage is reported instead.
+deferPruning = False
+deferredReports = {}
+
+def isCachedMesh(mesh):
+    return CACHE_KEY_PROPERTY in mesh.keys()
+
+def getCacheFolder():
+    if not bpy.data.is_saved or CACHE_FOLDER is None: return None
+    return bpy.path.abspath(CACHE_FOLDER)
+
+class MeshCache:
+    def __init__(self, scene, kind, useFolder=False):
+        self.scene = scene.name
+        self.kind = kind
+        self.folder = getCacheFolder() if useFolder else None
+        self.prefix = bpy.path.clean_name(self.scene)+"_"+kind+"_"
+        self.entries = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+        if self.folder:
+            if os.path.isdir(self.folder):
+                for f in os.listdir(self.folder):
+                    if f.startswith(self.prefix) and f.endswith(".blend"):
+                        self.entries[f[len(self.prefix):-len(".blend")]] = os.path.join(self.folder, f)
+        else:
+            for m in bpy.data.meshes:
+                if m.get(CACHE_KIND_PROPERTY) != kind or m.get(CACHE_SCENE_PROPERTY) != self.scene: continue
+                self.entries[m[CACHE_KEY_PROPERTY]] = m
+
+    # Returns a new mesh from the cache, or None if we've never seen the key before
+    def fetch(self, key, name=None):
+        if key is None: return None
+        cached = self.entries.get(key)
+        if cached is None:
+            self.misses += 1
+            return None
+
+        if self.folder:
+            mesh = self.loadFromFile(cached)
+            if mesh is None:
+                self.misses += 1
+                return None
+        else:
+            mesh = cached.copy()
+        self.hits += 1
+        self.used.add(key)
+
+        mesh.use_fake_user = False
+        for p in [CACHE_KEY_PROPERTY, CACHE_KIND_PROPERTY, CACHE_SCENE_PROPERTY]:
+            if p in mesh.keys(): del mesh[p]
+        if name: mesh.name = name
+        return mesh
+
+    def loadFromFile(self, path):
+        try:
+            with bpy.data.libraries.load(path, link=False) as (dataFrom, dataTo):
+                dataTo.meshes = dataFrom.meshes[:1]
+        except Exception as e:
+            print("GamiFlow: Could not read cached mesh "+path+":\n"+repr(e))
+            return None
+        if len(dataTo.meshes) == 0 or dataTo.meshes[0] is None: return None
+        mesh = dataTo.meshes[0]
+        # The materials were not saved with the mesh to avoid appending duplicates
+        materialNames = mesh.get(CACHE_MATERIALS_PROPERTY, [])
+        for materialName in materialNames:
+            mesh.materials.append(bpy.data.materials.get(materialName))
+        if CACHE_MATERIALS_PROPERTY in mesh.keys(): del mesh[CACHE_MATERIALS_PROPERTY]
+        return mesh
+
+    def store(self, key, mesh):
+        if key is None: return
+        cached = mesh.copy()
+        cached.name = "GFLOW_"+self.kind+"_"+key[:12]
+        cached[CACHE_KEY_PROPERTY] = key
+        cached[CACHE_KIND_PROPERTY] = self.kind
+        cached[CACHE_SCENE_PROPERTY] = self.scene
+        self.used.add(key)
+
+        if self.folder:
+            cached[CACHE_MATERIALS_PROPERTY] = [m.name if m else "" for m in cached.materials]
+            cached.materials.clear()
+            path = os.path.join(self.folder, self.prefix+key+".blend")
+            try:
+                os.makedirs(self.folder, exist_ok=True)
+                bpy.data.libraries.write(path, {cached}, fake_user=True, compress=True)
+                self.entries[key] = path
+            except Exception as e:
+                print("GamiFlow: Could not write cached mesh "+path+":\n"+repr(e))
+            bpy.data.meshes.remove(cached)
+        else:
+            old = self.entries.get(key)
+            if old: bpy.data.meshes.remove(old)
+            cached.use_fake_user = True
+            self.entries[key] = cached
+
+    # Remove everything that wasn't used during this generation, it can't be valid anymore
+    def prune(self):
+        if deferPruning:
+            deferredReports[self.kind] = {"used": sorted(self.used), "hits": self.hits, "misses": self.misses}
+            return
+        for key in list(self.entries.keys()):
+            if key in self.used: continue
+            if self.folder:
+                try:
+                    os.remove(self.entries[key])
+                except OSError:
+                    pass
+            else:
+                bpy.data.meshes.remove(self.entries[key])
+            del self.entries[key]
+        print("GamiFlow: "+self.kind+" cache: "+str(self.hits)+" hits, "+str(self.misses)+" misses")
+
+# Combines what the worker processes used and removes the rest
+def mergeDeferredReports(scene, kind, reports, useFolder=False):
+    # The workers send back their own copy of the entries they used, which can duplicate the ones we already have
+    seen = set()
+    for m in sorted(bpy.data.meshes, key=lambda m: m.name):
+        if m.get(CACHE_KIND_PROPERTY) != kind or m.get(CACHE_SCENE_PROPERTY) != scene.name: continue
+        if m[CACHE_KEY_PROPERTY] in seen: bpy.data.meshes.remove(m)
+        else: seen.add(m[CACHE_KEY_PROPERTY])
+
+    meshCache = MeshCache(scene, kind, useFolder)
+    for r in reports:
+        meshCache.used.update(r["used"])
+        meshCache.hits += r["hits"]
+        meshCache.misses += r["misses"]
+    meshCache.prune()
+
+# Export-ready copies of the collections used as instances, keyed by the content hash of the collection
+class TemplateCache:
+    def __init__(self, scene):
+        self.scene = scene.name
+        self.collection = bpy.data.collections.get(TEMPLATE_COLLECTION)
+        self.entries = {} # source collection name: (key, objects)
+        self.hits = 0
+        self.misses = 0
+        if self.collection:
+            for o in self.collection.objects:
+                if o.get(CACHE_SCENE_PROPERTY) != self.scene: continue
+                key, objects = self.entries.setdefault(o[CACHE_SOURCE_PROPERTY], (o[CACHE_KEY_PROPERTY], []))
+                if key == o[CACHE_KEY_PROPERTY]: objects.append(o)
+
+    # Returns the template objects, or None if the collection changed since they were made
+    def fetch(self, key, source):
+        entry = self.entries.get(source.name)
+        if entry is None or entry[0] != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return list(entry[1])
+
+    # Takes ownership of the objects, they are moved out of the scene
+    def store(self, key, source, objects):
+        self.remove(source.name)
+        if self.collection is None:
+            self.collection = bpy.data.collections.new(TEMPLATE_COLLECTION)
+            self.collection.use_fake_user = True
+        for o in objects:
+            for c in list(o.users_collection): c.objects.unlink(o)
+            self.collection.objects.link(o)
+            o[CACHE_KEY_PROPERTY] = key
+            o[CACHE_SCENE_PROPERTY] = self.scene
+            o[CACHE_SOURCE_PROPERTY] = source.name
+        self.entries[source.name] = (key, list(objects))
+
+    def remove(self, sourceName):
+        entry = self.entries.pop(sourceName, None)
+        if entry is None: return
+        for o in entry[1]: helpers.deleteObject(o)
+
+    # A template can only become outdated through its collection changing (handled by store) or disappearing
+    def prune(self):
+        for sourceName in list(self.entries.keys()):
+            if sourceName not in bpy.data.collections: self.remove(sourceName)
+        print("GamiFlow: Template cache: "+str(self.hits)+" hits, "+str(self.misses)+" misses")
+
+# Objects copied from a cached template must not look like cache entries themselves
+def untag(idBlock):
+    for p in [CACHE_KEY_PROPERTY, CACHE_KIND_PROPERTY, CACHE_SCENE_PROPERTY, CACHE_SOURCE_PROPERTY]:
+        if p in idBlock.keys(): del idBlock[p]
+
+def getSalt(kind):
+    return kind+"_"+str(CACHE_VERSION)+"_"+str(bpy.app.version)
+
+def clearCache(scene=None):
+    for m in list(bpy.data.meshes):
+        if not isCachedMesh(m): continue
+        if scene and m.get(CACHE_SCENE_PROPERTY) != scene.name: continue
+        bpy.data.meshes.remove(m)
+    templates = bpy.data.collections.get(TEMPLATE_COLLECTION)
+    if templates:
+        for o in list(templates.objects):
+            if scene and o.get(CACHE_SCENE_PROPERTY) != scene.name: continue
+            helpers.deleteObject(o)
+    folder = getCacheFolder()
+    if folder and os.path.isdir(folder):
+        prefix = bpy.path.clean_name(scene.name)+"_" if scene else ""
+        for f in os.listdir(folder):
+            if f.startswith(prefix) and f.endswith(".blend"):
+                try:
+                    os.remove(os.path.join(folder, f))
+                except OSError:
+                    pass
+
+class GFLOW_OT_ClearCache(bpy.types.Operator):
+    bl_idname      = "gflow.clear_cache"
+    bl_label       = "Clear Cache"
+    bl_description = "Delete all the cached meshes of this scene, the next generation will process everything again"
+    bl_options = {"REGISTER", "UNDO"}
+    def execute(self, context):
+        clearCache(context.scene)
+        return {"FINISHED"}
+
+classes = [GFLOW_OT_ClearCache]
+
+def register():
+    for c in classes:
+        bpy.utils.register_class(c)
+    pass
+def unregister():
+    for c in reversed(classes):
+        helpers.safeUnregisterClass(c)
+    pass
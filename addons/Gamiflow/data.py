@@ -116,6 +116,10 @@ class GFlowObject(bpy.types.PropertyGroup):
     exportActionShapekeySlotName: bpy.props.StringProperty(name="Pose Slot (Shape key)", default='')
     maxLod: bpy.props.IntProperty(name="Final LoD", min=0, max=3, default=3, subtype='FACTOR', description="Lod level after which the object stops being included.")
 
+    # Incremental generation
+    exportSourceRoot: bpy.props.PointerProperty(type=bpy.types.Object, name="Export source (internal)", description="Root of the working set hierarchy this export object was generated from")
+    exportHash: bpy.props.StringProperty(name="Export hash (internal)", default="", description="Content hash of the working set hierarchy when this export object was generated")
+
 # Per scene
 gUV_PACK_METHODS = [("FAST", "Fast", "", 0), ("REASONABLE", "Reasonable", "", 1), ("ACCURATE", "Accurate", "", 2)]
 class GFlowUdim(bpy.types.PropertyGroup):
@@ -132,8 +136,14 @@ class GFlowDisplay(bpy.types.PropertyGroup):
     
 class GFlowLod(bpy.types.PropertyGroup):
     decimate: bpy.props.BoolProperty(name="Decimate", default=False)
+    decimateMode: bpy.props.EnumProperty(name="Decimation target", default="RATIO", items=[
+        ("RATIO", "Ratio", "Keep the same fraction of the faces of every object"),
+        ("BUDGET", "Budget", "Decimate every exported asset (root object and its children) down to a number of triangles"),
+    ])
     decimateAmount: bpy.props.FloatProperty(name="Decimation ratio", subtype='FACTOR', default=1.0, min=0.0, max=1.0, description="How many vertices to keep")    
+    triangleBudget: bpy.props.IntProperty(name="Triangles", default=5000, min=1, description="Maximum number of triangles of each asset at this level of detail")
     decimatePreserveSeams: bpy.props.BoolProperty(name="Preserve seams", default=False)
+    decimatePreserveUvBoundaries: bpy.props.BoolProperty(name="Preserve UV boundaries", default=False, description="Don't decimate the vertices where the UVs are split, even if the edge isn't marked as a seam")
     
 class GFlowLods(bpy.types.PropertyGroup):
     current : bpy.props.IntProperty(name="LoD", default=0, subtype='FACTOR', min=0, max=3, update=onLodChange, description="The current LoD")
@@ -153,6 +163,13 @@ class GFlowScene(bpy.types.PropertyGroup):
     useCage : bpy.props.BoolProperty(name="Generate cage", default=False, description="If enabled, cage objects will generated")    
     cageOffset : bpy.props.FloatProperty(name="Default offset", subtype='DISTANCE', default=0.01, min=0.0, soft_max=0.5, update=onDefaultCageOffsetChanged, description="How much the cage mesh will be inflated")
     
+    # Cache
+    useCache : bpy.props.BoolProperty(name="Cache", default=True, description="Keep the processed meshes of the bake sets and the instanced collections of the export set in the file so that unchanged objects don't have to be processed again")
+    highCacheLocation : bpy.props.EnumProperty(name="High cache", default="BLEND", description="Where the evaluated high-poly meshes are kept between generations", items=[
+        ("BLEND", "Blend file", "Keep the evaluated meshes inside the blend file. Fast, but dense meshes make the file much bigger"),
+        ("FOLDER", "Side folder", "Write the evaluated meshes to a gamiflow_cache folder next to the blend file. Falls back to the blend file if it has never been saved"),
+    ])
+    
     # UVs
     uvResolution : bpy.props.EnumProperty(name="Resolution", default='2048', items=enums.gUV_RESOLUTION, description="Default resolution in pixels")
     uvMargin : bpy.props.EnumProperty(name="Margin", default='8', items=enums.gUV_MARGIN, description="Margin between UV islands (in pixels)")
@@ -188,10 +205,14 @@ class GFlowScene(bpy.types.PropertyGroup):
     vertexChannelR: bpy.props.EnumProperty(name="Red", default='ONE', items=enums.gVERTEX_CHANNEL)
     vertexChannelG: bpy.props.EnumProperty(name="Green", default='ONE', items=enums.gVERTEX_CHANNEL)
     vertexChannelB: bpy.props.EnumProperty(name="Blue", default='ONE', items=enums.gVERTEX_CHANNEL)
+    incrementalExport: bpy.props.BoolProperty(name="Incremental", default=True, description="Only regenerate the export objects whose working set hierarchy changed since the last generation")
 
     # Lodding
     lod : bpy.props.PointerProperty(type=GFlowLods, name="LoDs")
     
+    # Profiling
+    traceGeneration: bpy.props.BoolProperty(name="Trace", default=False, description="Record how long every phase and object of the set generation takes and write it as a Chrome trace (chrome://tracing or ui.perfetto.dev)")
+    
     # Overlays
     overlays : bpy.props.PointerProperty(type=GFlowDisplay, name="Overlays")
     
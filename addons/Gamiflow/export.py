@@ -1,11 +1,16 @@
 import bpy
 from bpy_extras.io_utils import ExportHelper
 import os
+import time
+import json
+import contextlib
 from . import sets_low
 from . import sets_high
 from . import sets
 from . import helpers
 from . import settings
+from . import workers
+from . import hashing
 from enum import Enum
 
 class ExportType(Enum):
@@ -15,6 +20,58 @@ class ExportType(Enum):
     FINAL = 0
 
 
+# Manifest of the files written in an output folder and the hash of what produced them
+# Files whose content hash didn't change are not written again, which saves the game engines a reimport
+MANIFEST_FILENAME = "gamiflow_manifest.json"
+
+class ExportManifest:
+    def __init__(self, folder):
+        self.filepath = os.path.join(folder, MANIFEST_FILENAME)
+        self.entries = {}
+        self.hasher = hashing.ContentHasher()
+        self.written = []
+        self.skipped = []
+        if os.path.exists(self.filepath):
+            try:
+                with open(self.filepath) as f: self.entries = json.load(f).get("files", {})
+            except (OSError, ValueError) as e:
+                print("GamiFlow: Ignoring unreadable export manifest "+self.filepath+":\n"+repr(e))
+    def isUpToDate(self, filepath, contentHash):
+        return self.entries.get(os.path.basename(filepath)) == contentHash and os.path.exists(filepath)
+    def record(self, filepath, contentHash):
+        self.entries[os.path.basename(filepath)] = contentHash
+        self.written.append(filepath)
+    def save(self):
+        try:
+            with open(self.filepath, "w") as f: json.dump({"files": self.entries}, f, indent=1, sort_keys=True)
+        except OSError as e:
+            print("GamiFlow: Could not write the export manifest "+self.filepath+":\n"+repr(e))
+    def report(self, operator):
+        for f in self.written: print(" Written: "+os.path.basename(f))
+        for f in self.skipped: print(" Unchanged: "+os.path.basename(f))
+        operator.report({'INFO'}, "Wrote "+str(len(self.written))+" files, skipped "+str(len(self.skipped))+" unchanged")
+
+currentManifest = None
+
+# While active, exportObjects skips the files that are already up to date
+@contextlib.contextmanager
+def manifestSession(folder):
+    global currentManifest
+    currentManifest = ExportManifest(folder)
+    try:
+        yield currentManifest
+    finally:
+        currentManifest.save()
+        currentManifest = None
+
+def getExtension(fFormat):
+    return ".fbx" if fFormat == "FBX" else ".gltf"
+
+def getContentHash(context, manifest, objects, fFormat, exportTarget, flip, exportType):
+    animations = context.scene.gflow.exportAnimations and exportType is ExportType.FINAL
+    exportSettings = (fFormat, exportTarget, flip, exportType.name, animations, context.scene.render.fps, context.scene.frame_start, context.scene.frame_end)
+    return manifest.hasher.exportContent(objects, exportSettings, allActions=animations and fFormat == "FBX")
+
 def getAxis(baseAxis, flipped):
     if flipped:
         dic = {  "X": "-X", 
@@ -27,23 +84,33 @@ def getAxis(baseAxis, flipped):
     return baseAxis
 
 def exportCollection(context, collection, filename, fFormat, exportTarget = "UNITY", flip=False, exportType=ExportType.FINAL):
-    exportObjects(context, collection.all_objects, filename, fFormat, exportTarget, flip, exportType=exportType)
-    return
+    return exportObjects(context, collection.all_objects, filename, fFormat, exportTarget, flip, exportType=exportType)
     
 def exportTextureSets(context, collection, baseFilename, fFormat, exportType):
+    files = []
     for (i, texset) in enumerate(context.scene.gflow.udims):
         objs = [o for o in collection.all_objects if o.gflow.textureSet == i]
-        exportObjects(context, objs, baseFilename+"_"+texset.name, fFormat, exportType=exportType)
+        files.append(exportObjects(context, objs, baseFilename+"_"+texset.name, fFormat, exportType=exportType))
+    return files
     
-def exportObjects(context, objects, filename, fFormat, exportTarget = "UNITY", flip=False, exportType=ExportType.FINAL):
+# The content hash can be given if the caller already computed it
+def exportObjects(context, objects, filename, fFormat, exportTarget = "UNITY", flip=False, exportType=ExportType.FINAL, contentHash=None):
+    manifest = currentManifest
+    if manifest:
+        if contentHash is None: contentHash = getContentHash(context, manifest, objects, fFormat, exportTarget, flip, exportType)
+        if manifest.isUpToDate(filename+getExtension(fFormat), contentHash):
+            manifest.skipped.append(filename+getExtension(fFormat))
+            return filename+getExtension(fFormat)
     # select all relevant objects
     bpy.ops.object.select_all(action='DESELECT')
     for o in objects:
         helpers.setSelected(context, o)
     if fFormat == "FBX":
-        exportselectedFbx(context, objects, filename, exportTarget = exportTarget, flip=flip, exportType=exportType)
+        filepath = exportselectedFbx(context, objects, filename, exportTarget = exportTarget, flip=flip, exportType=exportType)
     else:
-        exportSelectedGltf(context, objects, filename, exportTarget = exportTarget, flip=flip, exportType=exportType)
+        filepath = exportSelectedGltf(context, objects, filename, exportTarget = exportTarget, flip=flip, exportType=exportType)
+    if manifest: manifest.record(filepath, contentHash)
+    return filepath
     
 def exportSelectedGltf(context, objects, filename, exportTarget = "UNITY", flip=False, exportType=ExportType.FINAL):
     bpy.ops.export_scene.gltf(
@@ -59,6 +126,7 @@ def exportSelectedGltf(context, objects, filename, exportTarget = "UNITY", flip=
         # Materials
         export_materials = 'EXPORT',
     )
+    return filename+".gltf"
     
 def exportselectedFbx(context, objects, filename, exportTarget = "UNITY", flip=False, exportType=ExportType.FINAL):
     simplify = context.scene.render.use_simplify
@@ -125,8 +193,30 @@ def exportselectedFbx(context, objects, filename, exportTarget = "UNITY", flip=F
     
     context.scene.render.use_simplify = simplify
         
-    return
+    return filename+".fbx"
     
+# Writes the low, high and cage sets in the given folder and returns the list of files
+def exportPainter(context, folder):
+    name = sets.getSetName(context)
+    baseName = os.path.join(folder,name)
+    gflow = context.scene.gflow
+    files = []
+    if gflow.painterLowCollection and len(gflow.painterLowCollection.all_objects)>0:
+        sets.setCollectionVisibility(context, gflow.painterLowCollection, True)
+        files.append(exportCollection(context, gflow.painterLowCollection, baseName+"_low", "FBX", exportType=ExportType.BAKE_LOW))
+    if gflow.painterHighCollection and len(gflow.painterHighCollection.all_objects)>0:
+        sets.setCollectionVisibility(context, gflow.painterHighCollection, True)
+        files.append(exportCollection(context, gflow.painterHighCollection, baseName+"_high", "FBX", exportType=ExportType.BAKE_HIGH))
+    
+    if gflow.painterCageCollection and len(gflow.painterCageCollection.objects)>0:
+        sets.setCollectionVisibility(context, gflow.painterCageCollection, True)
+        # Because of the way painter matches the geometry, we have to export one cage per texture set
+        if not gflow.mergeUdims:
+            files += exportTextureSets(context, gflow.painterCageCollection, baseName+"_cage", "FBX", exportType=ExportType.BAKE_CAGE)
+        else:
+            files.append(exportCollection(context, gflow.painterCageCollection, baseName+"_cage", "FBX", exportType=ExportType.BAKE_CAGE))
+    return files
+
 class GFLOW_OT_ExportPainter(bpy.types.Operator, ExportHelper):
     """Exports both the low and high-poly for Painter."""
     bl_idname = "gflow.export_painter" 
@@ -150,24 +240,9 @@ class GFLOW_OT_ExportPainter(bpy.types.Operator, ExportHelper):
             return False            
         return True
     def execute(self, context):
-        name = sets.getSetName(context)
-        folder = os.path.dirname(self.filepath)
-        baseName = os.path.join(folder,name)
-        gflow = context.scene.gflow
-        if len(gflow.painterLowCollection.all_objects)>0:
-            sets.setCollectionVisibility(context, gflow.painterLowCollection, True)
-            exportCollection(context, gflow.painterLowCollection, baseName+"_low", "FBX", exportType=ExportType.BAKE_LOW)
-        if len(gflow.painterHighCollection.all_objects)>0:
-            sets.setCollectionVisibility(context, gflow.painterHighCollection, True)
-            exportCollection(context, gflow.painterHighCollection, baseName+"_high", "FBX", exportType=ExportType.BAKE_HIGH)
-        
-        if gflow.painterCageCollection and len(gflow.painterCageCollection.objects)>0:
-            sets.setCollectionVisibility(context, gflow.painterCageCollection, True)
-            # Because of the way painter matches the geometry, we have to export one cage per texture set
-            if not gflow.mergeUdims:
-                exportTextureSets(context, gflow.painterCageCollection, baseName+"_cage", "FBX", exportType=ExportType.BAKE_CAGE)
-            else:
-                exportCollection(context, gflow.painterCageCollection, baseName+"_cage", "FBX", exportType=ExportType.BAKE_CAGE)
+        with manifestSession(os.path.dirname(self.filepath)) as manifest:
+            exportPainter(context, os.path.dirname(self.filepath))
+        manifest.report(self)
         return {'FINISHED'}
 
 def findRoots(objectsList):
@@ -175,6 +250,79 @@ def findRoots(objectsList):
     return roots
 
 
+def getKitFilename(folder, root):
+    cleanname = root.name
+    suffix = settings.getSettings().exportsuffix
+    if suffix and cleanname.endswith(suffix):
+        cleanname = cleanname[:-len(suffix)]
+    return os.path.join(folder, cleanname)
+
+# Exports each root of the kit in its own file, a failed root doesn't stop the others
+# Returns one entry per root: {root, file, seconds, error}
+# hashes can give the already known content hash of the roots, by name
+def exportKitRoots(context, folder, roots, hashes=None):
+    gflow = context.scene.gflow
+    results = []
+    for o in roots:
+        start = time.perf_counter()
+        result = {"root": o.name, "file": "", "seconds": 0.0, "error": ""}
+        try:
+            objects = list(o.children_recursive)
+            objects.append(o)
+            result["file"] = exportObjects(context, objects, getKitFilename(folder, o), gflow.exportFormat, exportTarget=gflow.exportTarget, flip=gflow.exportFlip, exportType=ExportType.FINAL,
+                contentHash=hashes.get(o.name) if hashes else None)
+        except Exception as e:
+            result["error"] = repr(e)
+        result["seconds"] = time.perf_counter()-start
+        results.append(result)
+    return results
+
+# Writes the export set in the given folder and returns the list of files
+# In kit mode, the details of every file are added to the report list if one is given
+def exportFinal(context, folder, report=None):
+    name = sets.getSetName(context)
+    stgs = settings.getSettings()
+
+    gflow = context.scene.gflow
+
+    collection = gflow.exportCollection
+    sets.setCollectionVisibility(context, collection, True)
+    files = []
+    
+    # Simple export
+    if gflow.exportMethod == 'SINGLE':
+        baseName = os.path.join(folder,name)
+        files.append(exportCollection(context, gflow.exportCollection, baseName, gflow.exportFormat, exportTarget=gflow.exportTarget, flip=gflow.exportFlip, exportType=ExportType.FINAL))
+    # Kit export: each root object gets exported separately
+    if gflow.exportMethod == 'KIT':
+        roots = findRoots(gflow.exportCollection.objects)
+        manifest = currentManifest
+        hashes = None
+        if manifest:
+            # Only the roots that changed are given to the workers
+            hashes = {}
+            changed = []
+            for o in roots:
+                objects = list(o.children_recursive)+[o]
+                hashes[o.name] = getContentHash(context, manifest, objects, gflow.exportFormat, gflow.exportTarget, gflow.exportFlip, ExportType.FINAL)
+                filepath = getKitFilename(folder, o)+getExtension(gflow.exportFormat)
+                if manifest.isUpToDate(filepath, hashes[o.name]):
+                    manifest.skipped.append(filepath)
+                    files.append(filepath)
+                else:
+                    changed.append(o)
+            roots = changed
+        results = workers.exportKitInWorkers(context, folder, roots)
+        if results is not None and manifest:
+            for r in results:
+                if not r["error"]: manifest.record(r["file"], hashes[r["root"]])
+        if results is None: results = exportKitRoots(context, folder, roots, hashes)
+        for r in results:
+            if r["error"]: print("GamiFlow: Failed to export "+r["root"]+":\n"+r["error"])
+            else: files.append(r["file"])
+        if report is not None: report += results
+    return files
+
 class GFLOW_OT_ExportFinal(bpy.types.Operator, ExportHelper):
     """Exports the final mesh"""
     bl_idname = "gflow.export_final" 
@@ -196,31 +344,16 @@ class GFLOW_OT_ExportFinal(bpy.types.Operator, ExportHelper):
          
         return True
     def execute(self, context):
-        name = sets.getSetName(context)
-        folder = os.path.dirname(self.filepath)
-        stgs = settings.getSettings()
-
-        gflow = context.scene.gflow
-
-        collection = gflow.exportCollection
-        sets.setCollectionVisibility(context, collection, True)
-        
-        # Simple export
-        if gflow.exportMethod == 'SINGLE':
-            baseName = os.path.join(folder,name)
-            exportCollection(context, gflow.exportCollection, baseName, gflow.exportFormat, exportTarget=gflow.exportTarget, flip=gflow.exportFlip, exportType=ExportType.FINAL)
-        # Kit export: each root object gets exported separately
-        if gflow.exportMethod == 'KIT':
-            roots = findRoots(gflow.exportCollection.objects)
-            for o in roots:
-                cleanname = o.name
-                if cleanname.endswith(stgs.exportsuffix):
-                    cleanname = cleanname[:-len(stgs.exportsuffix)]
-                filename = os.path.join(folder, cleanname)
-                objects = list(o.children_recursive)
-                objects.append(o)
-                exportObjects(context, objects, filename, gflow.exportFormat, exportTarget=gflow.exportTarget, flip=gflow.exportFlip, exportType=ExportType.FINAL)
-
+        report = []
+        with manifestSession(os.path.dirname(self.filepath)) as manifest:
+            exportFinal(context, os.path.dirname(self.filepath), report)
+        manifest.report(self)
+        if len(report) > 0:
+            for r in sorted(report, key=lambda r: -r["seconds"]):
+                print(" "+r["root"]+": "+("FAILED" if r["error"] else os.path.basename(r["file"]))+" in "+str(round(r["seconds"], 3))+"s")
+            failed = [r for r in report if r["error"]]
+            if failed:
+                self.report({'WARNING'}, str(len(failed))+" of "+str(len(report))+" kit files failed to export, see the console")
         return {'FINISHED'}
   
 classes = [GFLOW_OT_ExportPainter, GFLOW_OT_ExportFinal,
@@ -45,13 +45,19 @@ GEO_FACE_MIRROR_Z = 4
 GEO_LOOP_CAGE_OFFSET_NAME = "gflow_cage_tightness"
 
 
+# Layers that only make sense in the working set
+GEO_OBJECT_LAYERS = [GEO_FACE_MIRROR_NAME, GEO_FACE_GRIDIFY_NAME, GEO_FACE_UV_SCALE_NAME, GEO_FACE_LEVEL_NAME, GEO_EDGE_LEVEL_NAME]
+
+def removeBmeshLayers(bm):
+    removeMirrorLayer(bm)
+    removeGridifyLayer(bm)  
+    removeUvScaleLayer(bm)
+    removeDetailFaceLayer(bm)
+    removeDetailEdgeLayer(bm)
 def removeObjectLayers(o):
+    if not any(name in o.data.attributes for name in GEO_OBJECT_LAYERS): return
     with helpers.objectModeBmesh(o) as bm:
-        removeMirrorLayer(bm)
-        removeGridifyLayer(bm)  
-        removeUvScaleLayer(bm)
-        removeDetailFaceLayer(bm)
-        removeDetailEdgeLayer(bm)
+        removeBmeshLayers(bm)
 def removeObjectCageLayers(o):
     removeCageDisplacementMap(o)
 
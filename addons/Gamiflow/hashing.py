@@ -0,0 +1,331 @@
+import bpy
+import hashlib
+import numpy as np
+from . import helpers
+from . import settings
+from . import geotags
+
+# Content hashing of the working set
+# Used to figure out which objects actually changed since the last time a set was generated
+
+ATTRIBUTE_LAYOUTS = helpers.ATTRIBUTE_LAYOUTS
+
+# Properties that only affect the UI or the internal bookkeeping and should never trigger a rebuild
+IGNORED_PROPERTIES = {'rna_type', 'registered', 'generated', 'exportSourceRoot', 'exportHash', 'current', 'overlays', 'incrementalExport', 'useCache',
+    'highCacheLocation', 'workerCount', 'batchModifiers', 'traceGeneration', # only change how the sets are generated, not what they contain
+    'painterLowCollection', 'painterHighCollection', 'painterCageCollection', 'exportCollection', # outputs of the generation, not inputs
+    'show_expanded', 'show_in_editmode', 'show_on_cage', 'is_active', 'is_override_data_local', 'persistent_uid', 'use_pin_to_last'}
+
+def readArray(collection, attribute, width, dtype):
+    a = np.empty(len(collection)*width, dtype=dtype)
+    collection.foreach_get(attribute, a)
+    return a
+
+def updateWithArray(h, a):
+    h.update(str(a.dtype).encode())
+    h.update(str(a.shape).encode())
+    h.update(a.tobytes())
+def updateWithValue(h, value):
+    h.update(repr(value).encode())
+
+def updateWithRna(h, struct, depth=0):
+    if struct is None or depth > 4:
+        updateWithValue(h, None)
+        return
+    for p in struct.bl_rna.properties:
+        name = p.identifier
+        if name in IGNORED_PROPERTIES or name.startswith("ui_"): continue
+        try:
+            value = getattr(struct, name)
+        except:
+            continue
+        h.update(name.encode())
+        if p.type == 'POINTER':
+            if isinstance(value, bpy.types.ID): updateWithValue(h, value.name)
+            elif value is not None and not p.is_readonly: updateWithRna(h, value, depth+1)
+            elif isinstance(value, bpy.types.PropertyGroup): updateWithRna(h, value, depth+1)
+        elif p.type == 'COLLECTION':
+            if not isinstance(struct, bpy.types.PropertyGroup): continue # only follow our own collections
+            updateWithValue(h, len(value))
+            for item in value: updateWithRna(h, item, depth+1)
+        elif p.type in ('BOOLEAN', 'INT', 'FLOAT') and p.array_length > 0:
+            updateWithValue(h, np.array(value).ravel().tolist())
+        elif isinstance(value, set):
+            updateWithValue(h, sorted(value)) # enum flags, the order of a set is not stable between sessions
+        else:
+            updateWithValue(h, value)
+
+def updateWithMatrix(h, matrix):
+    updateWithValue(h, tuple(tuple(round(v, 6) for v in row) for row in matrix))
+
+class ContentHasher:
+    def __init__(self):
+        self.meshes = {}
+        self.objects = {}
+        self.collections = {}
+        self.inProgress = set()
+
+    def mesh(self, mesh, withWeights=False):
+        key = (mesh.as_pointer(), withWeights)
+        if key in self.meshes: return self.meshes[key]
+
+        h = hashlib.sha1()
+        # Topology and the usual per-element flags
+        updateWithArray(h, readArray(mesh.vertices, "co", 3, np.float32))
+        updateWithArray(h, readArray(mesh.edges, "vertices", 2, np.int32))
+        updateWithArray(h, readArray(mesh.edges, "use_seam", 1, bool))
+        updateWithArray(h, readArray(mesh.edges, "use_edge_sharp", 1, bool))
+        updateWithArray(h, readArray(mesh.loops, "vertex_index", 1, np.int32))
+        updateWithArray(h, readArray(mesh.polygons, "loop_start", 1, np.int32))
+        updateWithArray(h, readArray(mesh.polygons, "material_index", 1, np.int32))
+        updateWithArray(h, readArray(mesh.polygons, "use_smooth", 1, bool))
+
+        # Generic attributes (UVs, colours and all the geotag layers)
+        for attribute in sorted(mesh.attributes, key=lambda a: a.name):
+            if attribute.name.startswith(".") or attribute.name == "position": continue
+            layout = ATTRIBUTE_LAYOUTS.get(attribute.data_type)
+            if layout is None: continue
+            h.update((attribute.name+attribute.domain+attribute.data_type).encode())
+            updateWithArray(h, readArray(attribute.data, layout[0], layout[1], layout[2]))
+        updateWithValue(h, [uvl.name for uvl in mesh.uv_layers])
+        updateWithValue(h, mesh.uv_layers.active.name if mesh.uv_layers.active else None)
+        updateWithValue(h, mesh.color_attributes.active_color_name)
+
+        # Custom normals are not exposed as an attribute
+        if mesh.has_custom_normals:
+            updateWithArray(h, helpers.getCornerNormals(mesh))
+
+        # Shape keys
+        if mesh.shape_keys:
+            for sk in mesh.shape_keys.key_blocks:
+                updateWithValue(h, (sk.name, sk.value, sk.mute, sk.relative_key.name, sk.vertex_group, sk.slider_min, sk.slider_max))
+                updateWithArray(h, readArray(sk.data, "co", 3, np.float32))
+            if mesh.shape_keys.animation_data and mesh.shape_keys.animation_data.action:
+                updateWithValue(h, mesh.shape_keys.animation_data.action.name)
+
+        # Vertex weights can't be accessed in bulk so we only look at them when they can matter
+        if withWeights:
+            for v in mesh.vertices:
+                for g in v.groups: updateWithValue(h, (v.index, g.group, round(g.weight, 5)))
+
+        updateWithValue(h, [m.name if m else None for m in mesh.materials])
+
+        digest = h.hexdigest()
+        self.meshes[key] = digest
+        return digest
+
+    def nodeTree(self, h, tree):
+        if tree is None:
+            updateWithValue(h, None)
+            return
+        updateWithValue(h, tree.name)
+        for n in tree.nodes:
+            updateWithValue(h, (n.bl_idname, n.name))
+            for i in n.inputs:
+                if hasattr(i, "default_value"):
+                    value = i.default_value
+                    if isinstance(value, bpy.types.ID): value = value.name
+                    elif hasattr(value, "__len__") and not isinstance(value, str): value = tuple(value)
+                    updateWithValue(h, (i.identifier, value))
+            if n.type == 'GROUP' and n.node_tree != tree: self.nodeTree(h, n.node_tree)
+        for l in tree.links:
+            updateWithValue(h, (l.from_node.name, l.from_socket.identifier, l.to_node.name, l.to_socket.identifier))
+
+    # Returns True if the result of the modifiers also depends on other objects
+    def modifiers(self, h, obj):
+        referencesOthers = False
+        for m in obj.modifiers:
+            updateWithValue(h, (m.type, m.name))
+            updateWithRna(h, m)
+            # Any object referenced by a modifier has an effect on the result
+            for p in m.bl_rna.properties:
+                if p.type != 'POINTER' or p.fixed_type is None or p.fixed_type.identifier != 'Object': continue
+                referenced = getattr(m, p.identifier, None)
+                if referenced is None or referenced == obj: continue
+                updateWithValue(h, self.object(referenced, withTransform=True))
+                referencesOthers = True
+            if m.type == 'NODES':
+                self.nodeTree(h, m.node_group)
+                for k in m.keys():
+                    value = m[k]
+                    if isinstance(value, bpy.types.Object):
+                        updateWithValue(h, self.object(value, withTransform=True))
+                        referencesOthers = True
+                    elif isinstance(value, bpy.types.ID):
+                        updateWithValue(h, value.name)
+                    else:
+                        try:
+                            value = tuple(value)
+                        except:
+                            pass
+                        updateWithValue(h, (k, value))
+        return referencesOthers
+
+    def object(self, obj, withTransform=True):
+        key = (obj.as_pointer(), withTransform)
+        if key in self.objects: return self.objects[key]
+        # Modifiers referencing each other would otherwise recurse forever
+        if key in self.inProgress: return obj.name
+        self.inProgress.add(key)
+
+        h = hashlib.sha1()
+        updateWithValue(h, (obj.name, obj.type))
+        if withTransform: updateWithMatrix(h, obj.matrix_world)
+        if obj.parent:
+            updateWithValue(h, (obj.parent.name, obj.parent_type, obj.parent_bone))
+
+        if obj.type == 'MESH':
+            updateWithValue(h, self.mesh(obj.data, withWeights=len(obj.vertex_groups)>0))
+            updateWithValue(h, [g.name for g in obj.vertex_groups])
+        elif obj.type == 'ARMATURE':
+            updateWithValue(h, [b.name for b in obj.data.bones])
+            updateWithArray(h, readArray(obj.data.bones, "matrix_local", 16, np.float32))
+            updateWithValue(h, obj.data.pose_position)
+            for pb in obj.pose.bones: updateWithMatrix(h, pb.matrix_basis)
+        elif obj.type == 'EMPTY':
+            updateWithValue(h, (obj.instance_type, obj.empty_display_type))
+            if obj.instance_type == 'COLLECTION' and obj.instance_collection:
+                updateWithValue(h, self.collection(obj.instance_collection))
+        elif obj.data:
+            updateWithValue(h, obj.data.name)
+
+        updateWithValue(h, [s.material.name if s.material else None for s in obj.material_slots])
+        updateWithValue(h, [s.link for s in obj.material_slots])
+        if obj.animation_data and obj.animation_data.action:
+            updateWithValue(h, obj.animation_data.action.name)
+        self.modifiers(h, obj)
+        updateWithRna(h, obj.gflow)
+
+        # Anchors are transforms we don't own but still depend on
+        for anchor in obj.gflow.exportAnchors:
+            if anchor.obj: updateWithMatrix(h, anchor.obj.matrix_world)
+        if obj.gflow.bakeAnchor: updateWithMatrix(h, obj.gflow.bakeAnchor.matrix_world)
+
+        digest = h.hexdigest()
+        self.inProgress.discard(key)
+        self.objects[key] = digest
+        return digest
+
+    # Key for the result of processing the mesh of an object on its own
+    def meshKey(self, obj, salt=""):
+        h = hashlib.sha1()
+        updateWithValue(h, salt)
+        updateWithValue(h, self.mesh(obj.data, withWeights=len(obj.vertex_groups)>0))
+        updateWithValue(h, [g.name for g in obj.vertex_groups])
+        referencesOthers = self.modifiers(h, obj)
+        updateWithRna(h, obj.gflow)
+        # The transform only matters for the partial symmetry and for modifiers using other objects
+        if referencesOthers or geotags.GEO_FACE_MIRROR_NAME in obj.data.attributes:
+            updateWithMatrix(h, obj.matrix_world)
+            updateWithValue(h, tuple(obj.location))
+        # Anything animated is evaluated at the current frame
+        isAnimated = obj.animation_data is not None or any(m.type == 'ARMATURE' for m in obj.modifiers)
+        if obj.data.shape_keys and obj.data.shape_keys.animation_data: isAnimated = True
+        if isAnimated: updateWithValue(h, bpy.context.scene.frame_current)
+        return h.hexdigest()
+
+    def collection(self, collection):
+        if collection in self.collections: return self.collections[collection]
+        self.collections[collection] = collection.name # guards against self-instancing
+        h = hashlib.sha1()
+        updateWithValue(h, collection.name)
+        # Instanced collections are realised relative to the collection origin so the transforms still matter
+        for o in sorted(collection.all_objects, key=lambda o: o.name):
+            updateWithValue(h, self.object(o, withTransform=True))
+        digest = h.hexdigest()
+        self.collections[collection] = digest
+        return digest
+
+    def hierarchy(self, root, salt=""):
+        h = hashlib.sha1()
+        updateWithValue(h, salt)
+        todo = [root]
+        while len(todo)>0:
+            o = todo.pop()
+            updateWithValue(h, self.object(o, withTransform=True))
+            todo += sorted(o.children, key=lambda c: c.name)
+        return h.hexdigest()
+
+    def material(self, h, material):
+        updateWithValue(h, (material.name, tuple(material.diffuse_color), material.use_backface_culling))
+        self.nodeTree(h, material.node_tree if material.use_nodes else None)
+
+    def action(self, h, action):
+        updateWithValue(h, (action.name, tuple(action.frame_range)))
+        for fc in getActionFCurves(action):
+            updateWithValue(h, (fc.data_path, fc.array_index, fc.mute))
+            for prop in ("co", "handle_left", "handle_right"):
+                updateWithArray(h, readArray(fc.keyframe_points, prop, 2, np.float32))
+
+    # Everything that ends up in an exported file: objects, meshes, materials, actions and the export settings
+    def exportContent(self, objects, exportSettings, allActions=False):
+        h = hashlib.sha1()
+        updateWithValue(h, exportSettings)
+        updateWithValue(h, bpy.app.version)
+        materials = {}
+        actions = {}
+        for o in sorted(objects, key=lambda o: o.name):
+            updateWithValue(h, self.object(o, withTransform=True))
+            for slot in o.material_slots:
+                if slot.material: materials[slot.material.name] = slot.material
+            animated = [o]
+            if o.type == 'MESH' and o.data.shape_keys: animated.append(o.data.shape_keys)
+            for a in animated:
+                if a.animation_data and a.animation_data.action: actions[a.animation_data.action.name] = a.animation_data.action
+        # Exporters that write every action of the file depend on all of them
+        if allActions:
+            for a in bpy.data.actions: actions[a.name] = a
+        for name in sorted(materials): self.material(h, materials[name])
+        for name in sorted(actions): self.action(h, actions[name])
+        return h.hexdigest()
+
+def getActionFCurves(action):
+    # Slotted actions keep their curves in the layers
+    if getattr(action, "layers", None):
+        return [fc for layer in action.layers for strip in layer.strips for bag in strip.channelbags for fc in bag.fcurves]
+    return action.fcurves
+
+# Identifies modifier stacks that would give the same result on the same mesh
+def modifiersHash(modifiers):
+    h = hashlib.sha1()
+    for m in modifiers:
+        updateWithValue(h, (m.type, m.name))
+        updateWithRna(h, m)
+    return h.hexdigest()
+
+def settingsHash(context):
+    h = hashlib.sha1()
+    updateWithRna(h, context.scene.gflow)
+    updateWithRna(h, settings.getSettings())
+    updateWithValue(h, bpy.app.version)
+    return h.hexdigest()
+
+# Scene and add-on settings that change the meshes kept by each mesh cache, as (scene settings, add-on settings)
+# Everything else (export, UVs, LODs, set collections) is applied after the cached part of the processing
+CACHE_SETTINGS = {
+    "LOW": (["mergeUdims"], []),
+    "HIGH": ([], ["idMap", "baker"]),
+}
+def cacheSettingsHash(context, kind):
+    h = hashlib.sha1()
+    sceneSettings, addonSettings = CACHE_SETTINGS[kind]
+    for name in sceneSettings: updateWithValue(h, (name, getattr(context.scene.gflow, name)))
+    stgs = settings.getSettings()
+    for name in addonSettings: updateWithValue(h, (name, getattr(stgs, name)))
+    return h.hexdigest()
+
+def findHierarchyRoot(obj):
+    while obj.parent: obj = obj.parent
+    return obj
+
+
+classes = []
+
+def register():
+    for c in classes:
+        bpy.utils.register_class(c)
+    pass
+def unregister():
+    for c in reversed(classes):
+        helpers.safeUnregisterClass(c)
+    pass
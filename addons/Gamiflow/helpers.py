@@ -1,9 +1,25 @@
 import bpy
 import bmesh
 import contextlib
+import numpy as np
 from . import uv
 
+# How to read each type of generic attribute in bulk: (property, components, dtype)
+ATTRIBUTE_LAYOUTS = {
+    'FLOAT': ('value', 1, np.float32),
+    'INT': ('value', 1, np.int32),
+    'INT8': ('value', 1, np.int32),
+    'BOOLEAN': ('value', 1, bool),
+    'FLOAT2': ('vector', 2, np.float32),
+    'INT32_2D': ('value', 2, np.int32),
+    'FLOAT_VECTOR': ('vector', 3, np.float32),
+    'FLOAT_COLOR': ('color', 4, np.float32),
+    'BYTE_COLOR': ('color', 4, np.float32),
+    'QUATERNION': ('value', 4, np.float32),
+}
+
 def findActive3dView(context):
+    if context.screen is None: return None # e.g. when running in the background
     for area in context.screen.areas:
         if area.type == 'VIEW_3D':
             return area.spaces.active
@@ -111,6 +127,15 @@ def editModeObserverBmesh(obj):
     
     yield bm
 
+def getCornerNormals(mesh):
+    normals = np.empty(len(mesh.loops)*3, dtype=np.float32)
+    if bpy.app.version >= (4, 1, 0):
+        mesh.corner_normals.foreach_get("vector", normals)
+    else:
+        mesh.calc_normals_split()
+        mesh.loops.foreach_get("normal", normals)
+    return normals
+
 def getScreenArea(context, areaType="VIEW_3D"):
     for a in context.screen.areas:
         if a.type == areaType: return a
@@ -159,10 +184,43 @@ def backupOtherModifiers(obj, modifiersToDiscard):
     for m in obj.modifiers:
         if m not in modifiersToDiscard: backedUp.append([m, m.show_viewport])
     return backedUp
+# Modifiers that never move the vertices, so the shape keys can be kept as they are
+NON_MOVING_MODIFIERS = ['TRIANGULATE', 'WEIGHTED_NORMAL', 'NORMAL_EDIT', 'DATA_TRANSFER', 'UV_PROJECT', 'UV_WARP', 'VERTEX_WEIGHT_EDIT', 'VERTEX_WEIGHT_MIX', 'VERTEX_WEIGHT_PROXIMITY']
+def readShapeKeys(obj):
+    keys = []
+    count = len(obj.data.vertices)
+    for sk in obj.data.shape_keys.key_blocks:
+        co = np.empty(count*3, dtype=np.float32)
+        sk.data.foreach_get("co", co)
+        keys.append({"name": sk.name, "co": co, "value": sk.value, "slider_min": sk.slider_min, "slider_max": sk.slider_max, 
+            "vertex_group": sk.vertex_group, "mute": sk.mute, "lock_shape": sk.lock_shape})
+    return keys
+def writeShapeKeys(obj, keys, coordinates):
+    baseObjBasisShapeKey = obj.shape_key_add(name=keys[0]["name"], from_mix=False)
+    for index, sk in enumerate(keys):
+        if index==0: continue
+        baseObjShapeKey = obj.shape_key_add(name=sk["name"], from_mix=False)
+        baseObjShapeKey.data.foreach_set("co", coordinates[index])
+        # Shapekey settings
+        baseObjShapeKey.relative_key = baseObjBasisShapeKey
+        for setting in ["value", "slider_min", "slider_max", "vertex_group", "mute", "lock_shape"]:
+            setattr(baseObjShapeKey, setting, sk[setting])
+    obj.data.update()
 def applyModifiers_shapeKeys(context, obj, modifiers):
-    # Make a backup copy that will retain all the shape key data until we're done
-    duplicate = copyObject(obj, context.collection)
     modifierNames = [mn.name for mn in modifiers if mn is not None]
+    keys = readShapeKeys(obj)
+    vertexCount = len(obj.data.vertices)
+    
+    # Keep the shape key animation around
+    animation = None
+    animationData = obj.data.shape_keys.animation_data
+    if animationData and animationData.action:
+        animation = (animationData.action, animationData.action_slot if bpy.app.version >= (4,4,0) else None)
+
+    # Harmless modifiers like triangulate or weighted normals don't touch the vertices: the keys can be copied over directly
+    nonMoving = all(m.type in NON_MOVING_MODIFIERS for m in modifiers if m is not None)
+    # Otherwise we need a backup copy that will retain all the shape key data until we're done
+    scratch = None if nonMoving else copyObject(obj, context.collection)
     
     # Remove all the shape keys on the main object
     obj.shape_key_clear()
@@ -170,87 +228,70 @@ def applyModifiers_shapeKeys(context, obj, modifiers):
     # Apply the modifiers to the main object as normally
     applyModifiers_simple(context, obj, modifiers)
     
-    baseObjBasisShapeKey = obj.shape_key_add(name=duplicate.data.shape_keys.key_blocks[0].name, from_mix=False)
-    
-    if len(obj.data.vertices) == len(duplicate.data.vertices):
-        # This should probably be redone completely and just apply one modifier at a time which is awful.
-        # How do we deal with harmless modifiers like triangulate or weighted normals? just skip them?
-        # We still have to try and respect the order of modifiers to avoid weird problems
-        # We also have the issue of one modifier being easy on its own, but decimate+mirror+array is getting difficult
-        # decimate: pretty cheap as we don't have to actually do anything crazy
-        #   we remove the shapekeys from obj, we apply the decimation to obj.
-        #   for each vertex in Obj, we find its counterpart in Duplicate with a kdtree
-        #   we lookup the shapekey for that particular vertex
-        # mirror: 
-        #   we remove the shapekeys from obj and apply the mirror to obj
-        #   ????
-        
-        # Re-apply the shape keys
-        for index, sk in enumerate(duplicate.data.shape_keys.key_blocks):
-            if index==0: continue
+    if len(obj.data.vertices) == vertexCount:
+        if nonMoving:
+            coordinates = [k["co"] for k in keys]
+        else:
+            # Evaluate the backup once per shape key, showing only that key and the modifiers we are applying
+            # We still have to respect the order of modifiers to avoid weird problems, so the key positions go through the whole stack
+            for m in scratch.modifiers: m.show_viewport = m.name in modifierNames
+            scratch.show_only_shape_key = True
+            coordinates = [None]
+            for index in range(1, len(keys)):
+                scratch.active_shape_key_index = index
+                depsgraph = context.evaluated_depsgraph_get()
+                evaluated = scratch.evaluated_get(depsgraph)
+                mesh = evaluated.to_mesh()
+                co = np.empty(len(mesh.vertices)*3, dtype=np.float32)
+                mesh.vertices.foreach_get("co", co)
+                evaluated.to_mesh_clear()
+                if len(co) != vertexCount*3: break
+                coordinates.append(co)
         
-            # Duplicate the backup again, but this time keep only one shape key
-            morphedObject = copyObject(duplicate, context.collection)
-            morphedObject.show_only_shape_key = True
-            morphedObject.active_shape_key_index = index
-            
-            # Apply the modifiers to the morph duplicate
-            modifiersList = []
-            for m in modifierNames:
-                modifiersList.append(morphedObject.modifiers[m])
-            applyModifiers_simple(context, morphedObject, modifiersList)
-            # Remove all the other modifiers
-            morphedObject.modifiers.clear()
-            
-            # Copy the vertices to a new shape key on the original object
-            baseObjShapeKey = obj.shape_key_add(name=sk.name, from_mix=False)
-            for (index, vertex) in enumerate(morphedObject.data.vertices):
-                baseObjShapeKey.data[index].co = vertex.co
-            
-            deleteObject(morphedObject)
-            
-            # Shapekey settings
-            baseObjShapeKey.relative_key = baseObjBasisShapeKey
-            baseObjShapeKey.value = sk.value
-            baseObjShapeKey.slider_min = sk.slider_min
-            baseObjShapeKey.slider_max = sk.slider_max
-            baseObjShapeKey.vertex_group = sk.vertex_group
-            baseObjShapeKey.mute = sk.mute
-            baseObjShapeKey.lock_shape = sk.lock_shape
+        if len(coordinates) == len(keys):
+            writeShapeKeys(obj, keys, coordinates)
+        else:
+            obj.shape_key_add(name=keys[0]["name"], from_mix=False)
+            obj.shape_key_add(name="Modifiers not compatible", from_mix=False)
 
         # Shapekey animations
-        if duplicate.data.shape_keys.animation_data and duplicate.data.shape_keys.animation_data.action:
+        if animation:
             if obj.data.shape_keys.animation_data is None: 
                 obj.data.shape_keys.animation_data_create()
-            obj.data.shape_keys.animation_data.action = duplicate.data.shape_keys.animation_data.action    
-            if bpy.app.version >= (4,4,0):
-                obj.data.shape_keys.animation_data.action_slot = duplicate.data.shape_keys.animation_data.action_slot
+            obj.data.shape_keys.animation_data.action = animation[0]
+            if animation[1] is not None:
+                obj.data.shape_keys.animation_data.action_slot = animation[1]
 
         ## TODO: Figure out drivers
     else:
         # make a dummy shape keywith an error message in it
+        obj.shape_key_add(name=keys[0]["name"], from_mix=False)
         obj.shape_key_add(name="Modifiers not compatible", from_mix=False)
 
     # Cleanup
-    deleteObject(duplicate)
+    if scratch: deleteObject(scratch)
 
     return
 
 def applyModifiers_simple(context, obj, modifiers):
     # Disable the other modifiers for now
+    modifiersToKeep = isolateModifiers(obj, modifiers)
+    depsgraph = context.evaluated_depsgraph_get()
+    evaluatedMesh = bpy.data.meshes.new_from_object(
+        obj.evaluated_get(depsgraph), 
+        preserve_all_data_layers=True, 
+        depsgraph=depsgraph)    
+    replaceWithEvaluatedMesh(obj, evaluatedMesh, modifiers, modifiersToKeep)
+    return
+def isolateModifiers(obj, modifiers):
     modifiersToKeep = backupOtherModifiers(obj, modifiers)
     for m, v, in modifiersToKeep:
         if m: m.show_viewport = False
-
     # Evaluate the mesh with only the selected modifiers
     for m in modifiers:
         if m: m.show_viewport = True
-    depsgraph = context.evaluated_depsgraph_get()
-    evaluatedMesh = bpy.data.meshes.new_from_object(
-        obj.evaluated_get(depsgraph), 
-        preserve_all_data_layers=True, 
-        depsgraph=depsgraph)    
-    
+    return modifiersToKeep
+def replaceWithEvaluatedMesh(obj, evaluatedMesh, modifiers, modifiersToKeep):
     # Delete the applied modifiers from the original object
     for m in modifiers:
         if m: obj.modifiers.remove(m)
@@ -267,70 +308,326 @@ def applyModifiers_simple(context, obj, modifiers):
         for ouv in originalMesh.uv_layers:
             uv.copyUvLayerToEnd(obj, ouv.name)
             
-        
-    bpy.data.meshes.remove(originalMesh)
+    # Other objects might still be using it if the mesh was shared
+    if originalMesh.users == 0: bpy.data.meshes.remove(originalMesh)
         
     # Re-enable the saved modifiers and hope for the best
     for m, v in modifiersToKeep:
         if m: m.show_viewport = v
+
+# Objects that the modifiers of an object read from (mirror and array offsets, data transfer sources, geometry nodes inputs...)
+MODIFIER_OBJECT_PROPERTIES = ["object", "offset_object", "mirror_object", "start_cap", "end_cap", "target", "auxiliary_target", "origin"]
+def getModifierReferences(obj):
+    references = []
+    for m in obj.modifiers:
+        for p in MODIFIER_OBJECT_PROPERTIES:
+            value = getattr(m, p, None)
+            if isinstance(value, bpy.types.Object): references.append(value)
+        if m.type == 'NODES' and m.node_group:
+            for i in m.node_group.interface.items_tree:
+                if i.item_type != 'SOCKET' or i.in_out != 'INPUT' or i.socket_type != "NodeSocketObject": continue
+                value = m.get(i.identifier)
+                if isinstance(value, bpy.types.Object): references.append(value)
+    return references
+
+# Splits the objects into successive groups where nothing depends on an object of the same or a later group
+def sortModifierWaves(objects):
+    objectSet = set(objects)
+    dependencies = {}
+    for o in objects:
+        # Follow the references through objects that aren't part of the batch too, their own modifiers may read from the batch
+        found = set()
+        visited = set([o])
+        todo = getModifierReferences(o)
+        while todo:
+            r = todo.pop()
+            if r in visited: continue
+            visited.add(r)
+            if r in objectSet: found.add(r)
+            todo += getModifierReferences(r)
+        dependencies[o] = found
+    
+    waves = []
+    done = set()
+    pending = list(objects)
+    while pending:
+        wave = [o for o in pending if dependencies[o] <= done]
+        if len(wave) == 0: wave = pending # circular references, nothing better to do
+        waves.append(wave)
+        done.update(wave)
+        pending = [o for o in pending if o not in done]
+    return waves
+
+# Same as calling applyModifiers on each (object, modifiers) pair, but the scene is only evaluated once per dependency level instead of once per object
+def applyModifiersBatch(context, jobs):
+    modifiersPerObject = {}
+    for obj, modifiers in jobs:
+        if obj.type != 'MESH' or modifiers is None: continue
+        modifiers = [m for m in modifiers if m is not None]
+        if len(modifiers) == 0: continue
+        # Only one shape key, we delete it and can apply the modifiers
+        if obj.data.shape_keys and len(obj.data.shape_keys.key_blocks) == 1:
+            obj.shape_key_remove(obj.data.shape_keys.key_blocks[0])
+        modifiersPerObject[obj] = modifiers
+    
+    for wave in sortModifierWaves(list(modifiersPerObject.keys())):
+        simple = [o for o in wave if o.data.shape_keys is None]
+        
+        # Set up every object and then evaluate everything in one go
+        backups = {}
+        for o in simple: backups[o] = isolateModifiers(o, modifiersPerObject[o])
+        if len(simple) > 0:
+            depsgraph = context.evaluated_depsgraph_get()
+            evaluatedMeshes = [bpy.data.meshes.new_from_object(o.evaluated_get(depsgraph), preserve_all_data_layers=True, depsgraph=depsgraph) for o in simple]
+            for o, evaluatedMesh in zip(simple, evaluatedMeshes):
+                replaceWithEvaluatedMesh(o, evaluatedMesh, modifiersPerObject[o], backups[o])
         
+        # Multiple shape keys, needs the hacky method
+        for o in wave:
+            if o not in backups: applyModifiers_shapeKeys(context, o, modifiersPerObject[o])
     return
 def applyModifiers_legacy(context, obj, modifiers):
     for m in modifiers[:]:
         if m: bpy.ops.object.modifier_apply(modifier=m.name)
 
-# Mesh islands code from https://blender.stackexchange.com/a/250139
-class BMRegion:
-    """Warning: this does not validate the BMesh, nor that the passed geometry belongs to same BMesh"""
-
-    def __init__(self, verts, edges, faces):
-        self.verts = verts
-        self.edges = edges
-        self.faces = faces
-def _bm_grow_tagged(vert):
-    """Flood fill untagged linked geometry starting from a vertex, tags and returns them"""
-    verts = [vert]
-    edges = []
-    faces = []
-
-    for vert in verts:
-        for link_face in vert.link_faces:
-            if link_face.tag:
-                continue
-            faces.append(link_face)
-            link_face.tag = True
-        for link_edge in vert.link_edges:
-            if link_edge.tag:
-                continue
-            link_edge.tag = True
-            edges.append(link_edge)
-            other_vert = link_edge.other_vert(vert)
-            if other_vert.tag:
-                continue
-            verts.append(other_vert)
-            other_vert.tag = True
-
-        vert.tag = True
-    return BMRegion(verts, edges, faces)
-def bm_loose_parts(bm):
-    # Clear tags
-    for v in bm.verts:
-        v.tag = False
-    for e in bm.edges:
-        e.tag = False
-    for f in bm.faces:
-        f.tag = False
-
-    loose_parts = []
-    for seed_vert in bm.verts:
-        if seed_vert.tag:
-            continue
-        # We could yield instead
-        # but tag could be modifed after yield
-        # so better to store results in a list
-        loose_parts.append(_bm_grow_tagged(seed_vert))
-
-    return loose_parts
+# Connected parts of a mesh
+def countTriangles(mesh):
+    # A polygon with n corners makes n-2 triangles
+    return len(mesh.loops) - 2*len(mesh.polygons)
+
+# Indices of the vertices on marked seams and/or where the active UV map is split
+def getUvBoundaryVertices(mesh, seams=True, uvSplits=True):
+    locked = np.zeros(len(mesh.vertices), dtype=bool)
+    if seams and len(mesh.edges) > 0:
+        edges = np.empty(len(mesh.edges)*2, dtype=np.int32)
+        mesh.edges.foreach_get("vertices", edges)
+        isSeam = np.empty(len(mesh.edges), dtype=bool)
+        mesh.edges.foreach_get("use_seam", isSeam)
+        locked[edges.reshape(-1, 2)[isSeam].ravel()] = True
+    if uvSplits and mesh.uv_layers.active and len(mesh.loops) > 0:
+        uvs = np.empty(len(mesh.loops)*2, dtype=np.float32)
+        mesh.uv_layers.active.data.foreach_get("uv", uvs)
+        uvs = uvs.reshape(-1, 2)
+        cornerVertices = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get("vertex_index", cornerVertices)
+        # A vertex is on a UV boundary if its corners don't all have the same UV
+        order = np.argsort(cornerVertices, kind='stable')
+        sortedVertices = cornerVertices[order]
+        starts = np.flatnonzero(np.r_[True, sortedVertices[1:] != sortedVertices[:-1]])
+        sortedUvs = uvs[order]
+        spread = np.maximum.reduceat(sortedUvs, starts, axis=0) - np.minimum.reduceat(sortedUvs, starts, axis=0)
+        locked[sortedVertices[starts[(spread > 1e-5).any(axis=1)]]] = True
+    return np.flatnonzero(locked)
+
+# Connected components of count elements linked by the pairs (a[i], b[i])
+# Returns the number of components and the component of every element, numbered in the order of their lowest element
+def labelComponents(count, a, b):
+    # Union-find: roots are always hooked to a smaller root, so every component ends up with its lowest element as root
+    parent = np.arange(count, dtype=np.int64)
+    while len(a) > 0:
+        pa, pb = parent[a], parent[b]
+        different = pa != pb
+        if not different.any(): break
+        np.minimum.at(parent, np.maximum(pa, pb)[different], np.minimum(pa, pb)[different])
+        # Path compression until every element points at its root
+        while True:
+            grandParent = parent[parent]
+            if np.array_equal(grandParent, parent): break
+            parent = grandParent
+    roots, labels = np.unique(parent, return_inverse=True)
+    return len(roots), labels.ravel()
+
+# Returns the number of islands and the island of every vertex, face and corner
+# The islands are numbered in the order of their lowest vertex index
+def getMeshIslands(mesh):
+    edges = np.empty(len(mesh.edges)*2, dtype=np.int64)
+    mesh.edges.foreach_get("vertices", edges)
+    edges = edges.reshape(-1, 2)
+    count, vertexIslands = labelComponents(len(mesh.vertices), edges[:, 0], edges[:, 1])
+    
+    cornerVertices = np.empty(len(mesh.loops), dtype=np.int64)
+    mesh.loops.foreach_get("vertex_index", cornerVertices)
+    loopIslands = vertexIslands[cornerVertices]
+    loopStarts = np.empty(len(mesh.polygons), dtype=np.int64)
+    mesh.polygons.foreach_get("loop_start", loopStarts)
+    faceIslands = loopIslands[loopStarts]
+    return count, vertexIslands, faceIslands, loopIslands
+
+# Triangulates the mesh in place, like a Triangulate modifier with its default settings
+# The custom normals are captured per corner beforehand and given back to the corners of the triangles they ended up in
+TRIANGULATION_CORNER_ATTRIBUTE = "gflow_source_corner"
+def triangulateMesh(mesh, quadMethod='SHORT_EDGE', ngonMethod='BEAUTY'):
+    loopTotals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loopTotals)
+    if not (loopTotals > 3).any(): return False
+    
+    normals = None
+    if mesh.has_custom_normals:
+        normals = getCornerNormals(mesh).reshape(-1, 3)
+        corners = mesh.attributes.new(TRIANGULATION_CORNER_ATTRIBUTE, 'INT', 'CORNER')
+        corners.data.foreach_set("value", np.arange(len(mesh.loops), dtype=np.int32))
+    
+    # Corner attributes are copied over to the new triangles, shape keys and vertex groups are kept as they are
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    bmesh.ops.triangulate(bm, faces=bm.faces[:], quad_method=quadMethod, ngon_method=ngonMethod)
+    bm.to_mesh(mesh)
+    bm.free()
+    
+    if normals is not None:
+        corners = mesh.attributes[TRIANGULATION_CORNER_ATTRIBUTE]
+        sources = np.empty(len(mesh.loops), dtype=np.int32)
+        corners.data.foreach_get("value", sources)
+        mesh.attributes.remove(corners)
+        if bpy.app.version < (4, 1, 0): mesh.use_auto_smooth = True
+        mesh.normals_split_custom_set(normals[sources])
+    mesh.update()
+    return True
+
+# Mesh joining without bpy.ops.object.join
+# Geometry that the arrays below cannot carry (vertex groups, shape keys, object materials, mirrored transforms) still needs the operator
+def canJoinMeshData(target, objects):
+    toTarget = target.matrix_world.inverted()
+    for o in objects:
+        if o.vertex_groups or o.data.shape_keys: return False
+        if any(slot.link == 'OBJECT' for slot in o.material_slots): return False
+        if (toTarget @ o.matrix_world).determinant() < 0.0: return False
+    return True
+
+DOMAIN_SIZES = {'POINT': lambda m: len(m.vertices), 'EDGE': lambda m: len(m.edges), 'FACE': lambda m: len(m.polygons), 'CORNER': lambda m: len(m.loops)}
+def readAttribute(attribute, count):
+    prop, width, dtype = ATTRIBUTE_LAYOUTS[attribute.data_type]
+    if attribute.data_type == 'BYTE_COLOR': prop = 'color_srgb' # avoids a lossy round trip through linear colours
+    values = np.empty(count*width, dtype=dtype)
+    attribute.data.foreach_get(prop, values)
+    return values
+def writeAttribute(attribute, values):
+    prop = ATTRIBUTE_LAYOUTS[attribute.data_type][0]
+    if attribute.data_type == 'BYTE_COLOR': prop = 'color_srgb'
+    attribute.data.foreach_set(prop, values)
+
+# Appends the geometry of the sources to the target (in the target's local space) and deletes the sources
+def joinMeshObjects(target, sources):
+    objects = [target]+sources
+    meshes = [o.data for o in objects]
+    toTarget = target.matrix_world.inverted()
+    matrices = [np.array(toTarget @ o.matrix_world, dtype=np.float64) for o in objects]
+
+    # Materials are matched by datablock, new ones are appended after the target's
+    materials = list(target.data.materials)
+    materialMaps = [np.arange(max(len(materials), 1))]
+    for m in meshes[1:]:
+        remap = []
+        for mat in m.materials:
+            if mat not in materials: materials.append(mat)
+            remap.append(materials.index(mat))
+        materialMaps.append(np.array(remap or [0]))
+
+    co, edges, loopVertices, loopEdges, loopStarts, materialIndices, seams = [], [], [], [], [], [], []
+    vertexOffset, edgeOffset, loopOffset = 0, 0, 0
+    for m, matrix, materialMap in zip(meshes, matrices, materialMaps):
+        positions = np.empty(len(m.vertices)*3, dtype=np.float32)
+        m.vertices.foreach_get("co", positions)
+        co.append(positions.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3])
+        a = np.empty(len(m.edges)*2, dtype=np.int32)
+        m.edges.foreach_get("vertices", a)
+        edges.append(a+vertexOffset)
+        a = np.empty(len(m.edges), dtype=bool)
+        m.edges.foreach_get("use_seam", a)
+        seams.append(a)
+        a = np.empty(len(m.loops), dtype=np.int32)
+        m.loops.foreach_get("vertex_index", a)
+        loopVertices.append(a+vertexOffset)
+        a = np.empty(len(m.loops), dtype=np.int32)
+        m.loops.foreach_get("edge_index", a)
+        loopEdges.append(a+edgeOffset)
+        a = np.empty(len(m.polygons), dtype=np.int32)
+        m.polygons.foreach_get("loop_start", a)
+        loopStarts.append(a+loopOffset)
+        a = np.empty(len(m.polygons), dtype=np.int32)
+        m.polygons.foreach_get("material_index", a)
+        materialIndices.append(materialMap[np.clip(a, 0, len(materialMap)-1)])
+        vertexOffset += len(m.vertices)
+        edgeOffset += len(m.edges)
+        loopOffset += len(m.loops)
+
+    # Generic attributes (UVs, colours, sharpness, geotags), the target decides the type of each name
+    layouts = {}
+    for m in meshes:
+        for attribute in m.attributes:
+            if attribute.name.startswith(".") or attribute.name in ("position", "material_index"): continue
+            if attribute.domain not in DOMAIN_SIZES or attribute.data_type not in ATTRIBUTE_LAYOUTS: continue
+            if attribute.name not in layouts: layouts[attribute.name] = (attribute.domain, attribute.data_type)
+    attributes = {}
+    for name, (domain, dataType) in layouts.items():
+        width, dtype = ATTRIBUTE_LAYOUTS[dataType][1:]
+        chunks = []
+        for m in meshes:
+            count = DOMAIN_SIZES[domain](m)
+            attribute = m.attributes.get(name)
+            if attribute is not None and attribute.domain == domain and attribute.data_type == dataType:
+                chunks.append(readAttribute(attribute, count))
+            else:
+                chunks.append(np.zeros(count*width, dtype=dtype))
+        attributes[name] = np.concatenate(chunks)
+
+    # Custom normals, as soon as one mesh has some the whole result needs them
+    normals = None
+    if any(m.has_custom_normals for m in meshes):
+        normals = []
+        for m, matrix in zip(meshes, matrices):
+            normalMatrix = np.linalg.inv(matrix[:3, :3]).T
+            n = getCornerNormals(m).reshape(-1, 3) @ normalMatrix.T
+            lengths = np.linalg.norm(n, axis=1, keepdims=True)
+            normals.append(n/np.maximum(lengths, 1e-8))
+        normals = np.concatenate(normals)
+
+    # Build the new mesh
+    oldMesh = target.data
+    mesh = bpy.data.meshes.new(oldMesh.name)
+    mesh.vertices.add(vertexOffset)
+    mesh.vertices.foreach_set("co", np.concatenate(co).astype(np.float32).ravel())
+    mesh.edges.add(edgeOffset)
+    mesh.edges.foreach_set("vertices", np.concatenate(edges))
+    mesh.loops.add(loopOffset)
+    mesh.loops.foreach_set("vertex_index", np.concatenate(loopVertices))
+    mesh.loops.foreach_set("edge_index", np.concatenate(loopEdges))
+    loopStarts = np.concatenate(loopStarts)
+    mesh.polygons.add(len(loopStarts))
+    mesh.polygons.foreach_set("loop_start", loopStarts)
+    for mat in materials: mesh.materials.append(mat)
+    mesh.polygons.foreach_set("material_index", np.concatenate(materialIndices))
+    mesh.edges.foreach_set("use_seam", np.concatenate(seams))
+    for name, (domain, dataType) in layouts.items():
+        attribute = mesh.attributes.get(name)
+        if attribute is None or attribute.domain != domain or attribute.data_type != dataType:
+            attribute = mesh.attributes.new(name, dataType, domain)
+        writeAttribute(attribute, attributes[name])
+    mesh.update()
+    if normals is not None:
+        if bpy.app.version < (4, 1, 0): mesh.use_auto_smooth = True
+        mesh.normals_split_custom_set(normals)
+
+    # Keep the same active layers as the target
+    if oldMesh.uv_layers.active: mesh.uv_layers.active = mesh.uv_layers.get(oldMesh.uv_layers.active.name)
+    for uvl in oldMesh.uv_layers:
+        if uvl.active_render and uvl.name in mesh.uv_layers: mesh.uv_layers[uvl.name].active_render = True
+    if oldMesh.color_attributes.active_color_name in mesh.color_attributes:
+        mesh.color_attributes.active_color_name = oldMesh.color_attributes.active_color_name
+    if oldMesh.color_attributes.default_color_name in mesh.color_attributes:
+        mesh.color_attributes.default_color_name = oldMesh.color_attributes.default_color_name
+
+    # Swap the meshes and get rid of the sources
+    name = oldMesh.name
+    target.data = mesh
+    if oldMesh.users == 0: bpy.data.meshes.remove(oldMesh)
+    mesh.name = name
+    # Like the operator, children of the removed objects are handed over to the target
+    for o in sources:
+        for c in o.children:
+            if c != target and c not in sources: setParent(c, target)
+        deleteObject(o)
+    return target
 
 def safeUnregisterClass(cl):
     try:
@@ -2,6 +2,7 @@ import bpy
 import bmesh
 import math
 import mathutils
+import numpy as np
 from . import helpers
 from . import geotags
 from . import data
@@ -210,6 +211,16 @@ def createCollection(context, name):
     parent.children.link(c)
     return c
 
+# Only keeps the objects belonging to the given hierarchies (by root name), used to split the generation into smaller jobs
+def filterByRoots(objects, rootNames=None):
+    if rootNames is None: return list(objects)
+    filtered = []
+    for o in objects:
+        root = o
+        while root.parent: root = root.parent
+        if root.name in rootNames: filtered.append(o)
+    return filtered
+
 def findRoots(collection):
     roots = []
     for o in collection.all_objects:
@@ -230,6 +241,10 @@ def duplicateObject(sourceObj, collection, prefix="", suffix="", workingSuffix="
     new_obj.gflow.generated = True
     return new_obj
     
+# Gives the object its own copy of a mesh it shares with other objects
+def makeSingleUser(obj):
+    if obj.type == 'MESH' and obj.data.users > 1: obj.data = obj.data.copy()
+    
 def setObjectAction(obj, action, slotName):
     if not action: return
     if not obj.animation_data: return
@@ -293,6 +308,16 @@ def applyModifiers(context, obj, modifiersTypesToKeep = []):
     if obj.type != 'MESH': return
     modifiers = [m for m in obj.modifiers if m.type not in modifiersTypesToKeep]
     helpers.applyModifiers(context, obj, modifiers) 
+# Same as calling applyModifiers on every object, but with a single scene evaluation for all the objects that don't depend on each other
+def applyModifiersBatch(context, objects, modifiersTypesToKeep = []):
+    jobs = [(o, [m for m in o.modifiers if m.type not in modifiersTypesToKeep]) for o in objects if o.type == 'MESH']
+    applyModifierJobs(context, jobs)
+# Applies a list of (object, modifiers) pairs
+def applyModifierJobs(context, jobs):
+    if settings.getSettings().batchModifiers:
+        helpers.applyModifiersBatch(context, jobs)
+    else:
+        for obj, modifiers in jobs: helpers.applyModifiers(context, obj, modifiers)
 def applyPainterModifiers(context, obj, isHighPoly):
     return # applying the armature on its own here is actually dangerous
     # for example if we have mirrors coming before, it will not work as expected, 
@@ -303,9 +328,7 @@ def applyPainterModifiers(context, obj, isHighPoly):
 def enforceModifiersOrder(context, obj):
     armature = getFirstModifierOfType(obj, 'ARMATURE')
     if armature:
-        bpy.ops.object.modifier_move_to_index(
-            modifier=armature.name,
-            index=len(obj.modifiers) - 1)
+        obj.modifiers.move(obj.modifiers.find(armature.name), len(obj.modifiers) - 1)
 
 def getTextureSetName(setNumber, mergeUdims=False):
     if mergeUdims: return bpy.context.scene.gflow.udims[0].name
@@ -329,59 +352,120 @@ def removeSharpEdges(obj):
     for edge in obj.data.edges:
         edge.use_edge_sharp = False
         
+def _dissolveEdgesForLevel(bm, level, keepPainter=False):
+    layer = geotags.getDetailEdgesLayer(bm, forceCreation=False)
+    if not layer: return 0
+    relevantEdges = []
+    for e in bm.edges:
+        if e[layer] == geotags.GEO_EDGE_LEVEL_DEFAULT: continue
+        relevant = False
+        if (not keepPainter) and e[layer] == geotags.GEO_EDGE_LEVEL_PAINTER: relevant = True
+        if e[layer] <= geotags.GEO_EDGE_LEVEL_LOD0+level: relevant = True
+        if relevant: relevantEdges.append(e)
+    if len(relevantEdges)>0: 
+        bmesh.ops.dissolve_edges(bm, edges=relevantEdges, use_verts=True, use_face_split=False)
+    return len(relevantEdges)
 def removeEdgesForLevel(context, obj, level, keepPainter=False):
     with helpers.objectModeBmesh(obj) as bm:
-        layer = geotags.getDetailEdgesLayer(bm, forceCreation=False)
-        if not layer: return 0
-        relevantEdges = []
-        for e in bm.edges:
-            if e[layer] == geotags.GEO_EDGE_LEVEL_DEFAULT: continue
-            relevant = False
-            if (not keepPainter) and e[layer] == geotags.GEO_EDGE_LEVEL_PAINTER: relevant = True
-            if e[layer] <= geotags.GEO_EDGE_LEVEL_LOD0+level: relevant = True
-            if relevant: relevantEdges.append(e)
-        if len(relevantEdges)>0: 
-            bmesh.ops.dissolve_edges(bm, edges=relevantEdges, use_verts=True, use_face_split=False)
-        return len(relevantEdges)
-
+        return _dissolveEdgesForLevel(bm, level, keepPainter)
+
+def _dissolveCageEdges(bm):
+    layer = geotags.getDetailEdgesLayer(bm, forceCreation=False)
+    if not layer: return
+    relevantEdges = []
+    for e in bm.edges:
+        if e[layer] == geotags.GEO_EDGE_LEVEL_CAGE: relevantEdges.append(e)        
+    if len(relevantEdges)>0: 
+        bmesh.ops.dissolve_edges(bm, edges=relevantEdges, use_verts=True, use_face_split=False)
 def removeCageEdges(obj):
     with helpers.objectModeBmesh(obj) as bm:
-        layer = geotags.getDetailEdgesLayer(bm, forceCreation=False)
-        if not layer: return
-        relevantEdges = []
-        for e in bm.edges:
-            if e[layer] == geotags.GEO_EDGE_LEVEL_CAGE: relevantEdges.append(e)        
-        if len(relevantEdges)>0: 
-            bmesh.ops.dissolve_edges(bm, edges=relevantEdges, use_verts=True, use_face_split=False)
-
+        _dissolveCageEdges(bm)
+
+def _collapseEdges(bm, level=0):
+    layer = geotags.getCollapseEdgesLayer(bm, forceCreation=False)
+    if not layer: return
+    relevantEdges = []
+    for e in bm.edges:
+        if e[layer] == geotags.GEO_EDGE_COLLAPSE_DEFAULT: continue
+        relevant = False
+        if e[layer] <= geotags.GEO_EDGE_COLLAPSE_LOD0+level: relevant = True
+        if relevant: relevantEdges.append(e)
+    
+    if len(relevantEdges)>0: 
+        bmesh.ops.collapse(bm, edges=relevantEdges, uvs=True)
 def collapseEdges(context, obj, level=0):
     with helpers.objectModeBmesh(obj) as bm:
-        layer = geotags.getCollapseEdgesLayer(bm, forceCreation=False)
-        if not layer: return
-        relevantEdges = []
-        for e in bm.edges:
-            if e[layer] == geotags.GEO_EDGE_COLLAPSE_DEFAULT: continue
-            relevant = False
-            if e[layer] <= geotags.GEO_EDGE_COLLAPSE_LOD0+level: relevant = True
-            if relevant: relevantEdges.append(e)
-        
-        if len(relevantEdges)>0: 
-            bmesh.ops.collapse(bm, edges=relevantEdges, uvs=True)
-
+        _collapseEdges(bm, level)
+
+def _deleteDetailFaces(bm, level=0):
+    faceDetailLayer = geotags.getDetailFacesLayer(bm, forceCreation=False)
+    if not faceDetailLayer: return
+    faces = [f for f in bm.faces 
+        if f[faceDetailLayer]!=geotags.GEO_FACE_LEVEL_DEFAULT 
+        and f[faceDetailLayer]<=geotags.GEO_FACE_LEVEL_LOD0+level] 
+    bmesh.ops.delete(bm, geom=faces, context="FACES")  
 def deleteDetailFaces(context, obj, level=0):
     with helpers.objectModeBmesh(obj) as bm:
-        faceDetailLayer = geotags.getDetailFacesLayer(bm, forceCreation=False)
-        if not faceDetailLayer: return
-        faces = [f for f in bm.faces 
-            if f[faceDetailLayer]!=geotags.GEO_FACE_LEVEL_DEFAULT 
-            and f[faceDetailLayer]<=geotags.GEO_FACE_LEVEL_LOD0+level] 
-        bmesh.ops.delete(bm, geom=faces, context="FACES")  
+        _deleteDetailFaces(bm, level)
+
+# Chains the geotag-based reductions so that they all happen in the same bmesh instead of converting the mesh back and forth for each of them
+# The steps are applied in the order they were added, e.g. sets.ReductionPlan().collapseEdges(0).dissolveEdges(0).deleteFaces(0).apply(obj)
+class ReductionPlan:
+    def __init__(self):
+        self.steps = []
+        self.layers = set() # mesh attributes that have to exist for the plan to do anything
+    def collapseEdges(self, level=0):
+        self.steps.append(lambda bm: _collapseEdges(bm, level))
+        self.layers.add(geotags.GEO_EDGE_COLLAPSE_NAME)
+        return self
+    def dissolveEdges(self, level=0, keepPainter=False):
+        self.steps.append(lambda bm: _dissolveEdgesForLevel(bm, level, keepPainter))
+        self.layers.add(geotags.GEO_EDGE_LEVEL_NAME)
+        return self
+    def dissolveCageEdges(self):
+        self.steps.append(_dissolveCageEdges)
+        self.layers.add(geotags.GEO_EDGE_LEVEL_NAME)
+        return self
+    def deleteFaces(self, level=0):
+        self.steps.append(lambda bm: _deleteDetailFaces(bm, level))
+        self.layers.add(geotags.GEO_FACE_LEVEL_NAME)
+        return self
+    def removeLayers(self):
+        self.steps.append(geotags.removeBmeshLayers)
+        self.layers.update(geotags.GEO_OBJECT_LAYERS)
+        return self
+    def apply(self, obj):
+        if obj.type != 'MESH' or len(self.steps) == 0: return
+        # Most meshes don't have any tags at all, no need to go through a bmesh for them
+        if not any(name in obj.data.attributes for name in self.layers): return
+        with helpers.objectModeBmesh(obj) as bm:
+            for step in self.steps: step(bm)
+    # Same thing for a mesh that isn't (yet) used by any object
+    def applyToMesh(self, mesh):
+        if len(self.steps) == 0 or not any(name in mesh.attributes for name in self.layers): return
+        bm = bmesh.new()
+        bm.from_mesh(mesh)
+        for step in self.steps: step(bm)
+        bm.to_mesh(mesh)
+        bm.free()
+
+# Returns the LOD levels (1 and above) at which the geotags of the mesh remove something
+# Everything at or below LOD0 is already gone from the export meshes
+def getReductionLevels(mesh):
+    levels = set()
+    for name, lod0 in [(geotags.GEO_EDGE_COLLAPSE_NAME, geotags.GEO_EDGE_COLLAPSE_LOD0), (geotags.GEO_FACE_LEVEL_NAME, geotags.GEO_FACE_LEVEL_LOD0), (geotags.GEO_EDGE_LEVEL_NAME, geotags.GEO_EDGE_LEVEL_LOD0)]:
+        attribute = mesh.attributes.get(name)
+        if attribute is None or len(attribute.data) == 0: continue
+        values = np.empty(len(attribute.data), dtype=np.int32)
+        attribute.data.foreach_get("value", values)
+        levels.update((np.unique(values[values > lod0]) - lod0).tolist())
+    return levels
+
+def needsPartialSymmetry(obj):
+    return obj.type == 'MESH' and geotags.GEO_FACE_MIRROR_NAME in obj.data.attributes
 
 def generatePartialSymmetryIfNeeded(context, obj, offsetUvs=False):
-    mirrorLayer = None
-    with helpers.objectModeBmesh(obj) as bm:
-        mirrorLayer = geotags.getMirrorLayer(bm)
-    if not mirrorLayer: return
+    if not needsPartialSymmetry(obj): return
 
     helpers.setSelected(context, obj)
     bpy.ops.object.mode_set(mode='EDIT')
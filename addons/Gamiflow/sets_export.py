@@ -5,9 +5,15 @@ from . import settings
 from . import uv
 from . import geotags
 from . import sets_cage
+from . import hashing
+from . import cache
+from . import workers
+from . import tracing
 import mathutils
 import random
+import collections
 import bmesh
+import numpy as np
 
 #BEGINTRIM -------------------------------------------------- 
 try:
@@ -43,10 +49,11 @@ def autoHideLods(context):
             if stgs.autoHideViewport: o.hide_set(not visible)
             if stgs.autoHideRender: o.hide_render = not visible
 
+# Modifiers that the game engine takes care of
+EXPORT_KEPT_MODIFIERS = ['ARMATURE', 'TRIANGULATE', 'WEIGHTED_NORMAL']
 def applyModifiers(context, obj, legacyMode=False):
     if obj.type != 'MESH': return
-    modsToKeep = ['ARMATURE', 'TRIANGULATE', 'WEIGHTED_NORMAL']
-    modifiers = [m for m in obj.modifiers if m.type not in modsToKeep]
+    modifiers = [m for m in obj.modifiers if m.type not in EXPORT_KEPT_MODIFIERS]
     if legacyMode: 
         helpers.applyModifiers_legacy(context, obj, modifiers)
     else:
@@ -54,7 +61,7 @@ def applyModifiers(context, obj, legacyMode=False):
         helpers.applyModifiers(context, obj, modifiers)
     
 # Handle modifiers for a clean export
-def processModifiers(context, generatorData, obj):
+def processModifiers(context, generatorData, obj, apply=True):
     helpers.setSelected(context, obj)
     
     sets.updateModifierDependencies(generatorData, obj)
@@ -65,7 +72,7 @@ def processModifiers(context, generatorData, obj):
     # NOTE: Currently no special cases for the Export Set :)
     
     # Apply all modifiers except armatures which are needed
-    applyModifiers(context, obj)
+    if apply: applyModifiers(context, obj)
  
     helpers.setDeselected(obj) 
 
@@ -90,6 +97,17 @@ def mergeHierarchy(obj, mergeList, todoList, mergeUdims, depth=0):
         else:
             todoList.append(c) 
     return mergeList, todoList
+# Splits the hierarchies into chunks in a single pass, non-mergeable children start their own chunk
+def planChunks(roots, mergeUdims):
+    chunks = []
+    todo = collections.deque(roots)
+    while todo:
+        root = todo.popleft()
+        merge, todo = mergeHierarchy(root, [], todo, mergeUdims)
+        chunk = Chunk()
+        chunk.objects = merge+[root]
+        chunks.append(chunk)
+    return chunks
 def findFirstNonCollapsedParent(obj, mergeUdims):
     if obj.parent is None: return obj
     parent = obj.parent
@@ -118,6 +136,11 @@ def getColorValue(source, aoValue, originalColor, randomValue):
         v = aoValue
     return v
     
+def readColors(attribute):
+    colors = np.empty(len(attribute.data)*4, dtype=np.float32)
+    attribute.data.foreach_get("color", colors)
+    return colors.reshape(-1, 4)
+    
 def bakeVertexAO(scene, obj):
     sGflow = scene.gflow
     aoAttribute = None
@@ -155,39 +178,42 @@ def bakeVertexColor(context, scene, obj):
     # Compute a random color
     rndColor = (random.random(), random.random(), random.random())
 
-    # Fill in the data
+    # Fill in the data, one whole channel at a time
     vertexColorAttribute = obj.data.color_attributes[gflowVertexColorName]
-    for index in range(0, len(vertexColorAttribute.data)):
-        aoValue = 1.0
-        originalColor = [0.0,0.0,0.0,1.0] 
-
-        if aoTarget: aoValue = aoTarget.data[index].color[0]
-        if originalColorAttribute: 
-            vi = index if sourceIsPerCorner else obj.data.loops[index].vertex_index
-            originalColor = originalColorAttribute.data[vi].color
-        
-        red = getColorValue(sGflow.vertexChannelR, aoValue, originalColor[0], rndColor[0])
-        green = getColorValue(sGflow.vertexChannelG, aoValue, originalColor[1], rndColor[1])
-        blue = getColorValue(sGflow.vertexChannelB, aoValue, originalColor[2], rndColor[2])
-        
-        vertexColorAttribute.data[index].color = [red, green, blue, 1.0]
+    cornerCount = len(vertexColorAttribute.data)
+    aoValue = 1.0
+    originalColor = np.zeros((cornerCount, 4), dtype=np.float32)
+    originalColor[:, 3] = 1.0
+    if aoTarget: aoValue = readColors(aoTarget)[:, 0]
+    if originalColorAttribute:
+        sourceColors = readColors(originalColorAttribute)
+        if sourceIsPerCorner:
+            originalColor = sourceColors
+        else:
+            vertexIndices = np.empty(len(obj.data.loops), dtype=np.int32)
+            obj.data.loops.foreach_get("vertex_index", vertexIndices)
+            originalColor = sourceColors[vertexIndices]
+
+    colors = np.ones((cornerCount, 4), dtype=np.float32)
+    colors[:, 0] = getColorValue(sGflow.vertexChannelR, aoValue, originalColor[:, 0], rndColor[0])
+    colors[:, 1] = getColorValue(sGflow.vertexChannelG, aoValue, originalColor[:, 1], rndColor[1])
+    colors[:, 2] = getColorValue(sGflow.vertexChannelB, aoValue, originalColor[:, 2], rndColor[2])
+    vertexColorAttribute.data.foreach_set("color", colors.ravel())
                    
     # Second pass for random color
-    if sGflow.vertexChannelR == 'ISLAND_RAND' or sGflow.vertexChannelG == 'ISLAND_RAND' or sGflow.vertexChannelB == 'ISLAND_RAND':
-        with helpers.objectModeBmesh(obj) as bm:        
-            parts = helpers.bm_loose_parts(bm)
-            colorLayer = bm.loops.layers.color[gflowVertexColorName]
-            for faceIsland in parts:
-                print("ISland")
-                rndColor = (random.random(), random.random(), random.random())
-                for face in faceIsland.faces:
-                    for loop in face.loops:
-                        if sGflow.vertexChannelR == 'ISLAND_RAND':
-                            loop[colorLayer][0] = rndColor[0]
-                        if sGflow.vertexChannelG == 'ISLAND_RAND':
-                            loop[colorLayer][1] = rndColor[1]
-                        if sGflow.vertexChannelB == 'ISLAND_RAND':
-                            loop[colorLayer][2] = rndColor[2]                        
+    islandChannels = [i for i, channel in enumerate([sGflow.vertexChannelR, sGflow.vertexChannelG, sGflow.vertexChannelB]) if channel == 'ISLAND_RAND']
+    if len(islandChannels) > 0:
+        islandCount, vertexIslands, faceIslands, cornerIslands = helpers.getMeshIslands(obj.data)
+        
+        # Same random sequence as always: three values per island, in island order
+        islandColors = np.array([(random.random(), random.random(), random.random()) for i in range(islandCount)], dtype=np.float32).reshape(-1, 3)
+        # The values are written as they are, without going through the linear to sRGB conversion
+        srgb = np.empty(cornerCount*4, dtype=np.float32)
+        vertexColorAttribute.data.foreach_get("color_srgb", srgb)
+        srgb = srgb.reshape(-1, 4)
+        for channel in islandChannels:
+            srgb[:, channel] = islandColors[cornerIslands, channel]
+        vertexColorAttribute.data.foreach_set("color_srgb", srgb.ravel())
 
                    
     obj.data.color_attributes.active_color_name = gflowVertexColorName
@@ -248,14 +274,20 @@ class Chunk:
         # Do the merge
         if len(meshobjs)>1:
             print(" Merge of "+root.name + " from "+str(len(meshobjs))+" objects")
-            # Make sure we do not have a shared mesh on the target object
-            if meshobjs[-1].data.users>1:
-                meshobjs[-1].data = meshobjs[-1].data.copy()
-            # Select everything in the right order and join
-            for m in meshobjs:
-                helpers.setSelected(context, m)
-            bpy.ops.object.join()
-            self.mergedObject = context.object
+            target = meshobjs[-1]
+            if helpers.canJoinMeshData(target, meshobjs):
+                # Concatenate the mesh data directly, no selection or operator involved
+                self.mergedObject = helpers.joinMeshObjects(target, meshobjs[:-1])
+            else:
+                # Make sure we do not have a shared mesh on the target object
+                if target.data.users>1:
+                    target.data = target.data.copy()
+                # Select everything in the right order and join
+                bpy.ops.object.select_all(action='DESELECT')
+                for m in meshobjs:
+                    helpers.setSelected(context, m)
+                bpy.ops.object.join()
+                self.mergedObject = context.object
         else:
             self.mergedObject = meshobjs[0]
         
@@ -287,18 +319,8 @@ def mergeObjects(context, objects):
         return chunks    
     
     bpy.ops.object.select_all(action='DESELECT')
-    todo = [o for o in objects if o.parent is None]
-        
     # Build a list of 'chunks' that can be merged together
-    while(len(todo)>0):
-        # Pick one object in the todo list and decide what to do with its children
-        root = todo[0]
-        todo.remove(root)
-        merge, todo = mergeHierarchy(root, [], todo, context.scene.gflow.mergeUdims)
-        #if len(merge)>0:
-        chunk = Chunk()
-        chunk.objects = merge+[root]
-        chunks.append(chunk)
+    chunks = planChunks([o for o in objects if o.parent is None], context.scene.gflow.mergeUdims)
     # Actually do the merge
     print("GamiFlow: Merge into "+str(len(chunks))+" groups")
     result = []
@@ -307,104 +329,230 @@ def mergeObjects(context, objects):
         result.append(chunk.mergedObject)
     return result
 
-def triangulateObject(context, obj, dependencies=None):
-    # there are bmesh and mesh approaches, but none of them preserve normals
-    # and bmesh can't even access loop normals for some obscure reason...
-
-    helpers.setSelected(context, obj)
-    if dependencies: # in case of linked duplicates, we have to first unlink one instance and apply the modifiers to it
-        obj.data = obj.data.copy()
-    tri = sets.triangulate(context, obj)
-    sets.enforceModifiersOrder(context, obj)
-    weightedNormal = sets.getFirstModifierOfType(obj, 'WEIGHTED_NORMAL')
-    if obj.data.shape_keys is None:
-        if weightedNormal: bpy.ops.object.modifier_apply(modifier=weightedNormal.name)
-        bpy.ops.object.modifier_apply(modifier=tri.name)
-    else:
-        helpers.applyModifiers_shapeKeys(context, obj, [weightedNormal, tri])
-    helpers.setDeselected(obj)
-    
-    if dependencies: # we can now give the triangulated mesh to the other duplicates
-        oldMesh = dependencies[0].data
-        for d in dependencies:
-            d.data = obj.data
-        obj.data.name = oldMesh.name
-        
-
 def triangulateObjects(context, objects):
-    todo = list(objects)
-    objectsUsingMesh = {}
+    todo = [o for o in objects if helpers.isObjectValidMesh(o)]
+    
+    # Weighted normals have to be computed on the original faces, so they are applied first
+    # Objects sharing a mesh and the same modifier only need it once
+    jobs = []
+    followers = []
+    for objs in groupSharedMeshes(todo, lambda o: [m for m in o.modifiers if m.type == 'WEIGHTED_NORMAL']):
+        weightedNormal = sets.getFirstModifierOfType(objs[0], 'WEIGHTED_NORMAL')
+        if weightedNormal is None: continue
+        jobs.append((objs[0], [weightedNormal]))
+        followers.append(objs)
+    sets.applyModifierJobs(context, jobs)
+    for objs in followers:
+        for d in objs[1:]:
+            oldMesh = d.data
+            d.data = objs[0].data
+            d.modifiers.remove(sets.getFirstModifierOfType(d, 'WEIGHTED_NORMAL'))
+            if oldMesh.users == 0: bpy.data.meshes.remove(oldMesh)
+    
+    # Every mesh is then triangulated once, in place, for all of its users
+    users = {}
     for o in todo:
-        if not helpers.isObjectValidMesh(o): continue
-        
-        if o.data.users == 1:
-            triangulateObject(context, o)
-        elif o.data.users > 1:
-            if o.data not in objectsUsingMesh:
-                objectsUsingMesh[o.data] = [o]
-            else:
-                objectsUsingMesh[o.data].append(o)
-                
-    # Handle shared meshes separately
-    for (mesh, objs) in objectsUsingMesh.items():
-        triangulateObject(context, objs[0], objs[1:])
+        if o.data not in users: users[o.data] = []
+        users[o.data].append(o)
+    for mesh, objs in users.items():
+        if mesh.users > len(objs): # also used outside of this set, so it gets its own copy
+            mesh = mesh.copy()
+            for o in objs: o.data = mesh
+        with tracing.span("Triangulate", objs[0]): helpers.triangulateMesh(mesh)
+    for o in todo: sets.enforceModifiersOrder(context, o)
+
+# Groups the objects that share a mesh and would do the same thing to it
+def groupSharedMeshes(objects, getModifiers):
+    groups = {}
+    for o in objects:
+        key = (o.data, hashing.modifiersHash(getModifiers(o))) if o.type == 'MESH' else o
+        if key not in groups: groups[key] = []
+        groups[key].append(o)
+    return list(groups.values())
+
+# Applies the modifiers of an object and hands the result over to the objects that share its mesh and modifiers
+def applySharedModifiers(context, objs, legacyMode=False):
+    leader = objs[0]
+    modifiers = [m for m in leader.modifiers if m.type not in EXPORT_KEPT_MODIFIERS] if leader.type == 'MESH' else []
+    if len(modifiers) == 0: return
+    oldMesh = leader.data
+    shared = oldMesh.users > 1
+    sets.makeSingleUser(leader)
+    helpers.setSelected(context, leader)
+    applyModifiers(context, leader, legacyMode)
+    helpers.setDeselected(leader)
+    for o in objs[1:]:
+        o.data = leader.data
+        for m in list(o.modifiers):
+            if m.type not in EXPORT_KEPT_MODIFIERS: o.modifiers.remove(m)
+    if shared and oldMesh.users == 0: bpy.data.meshes.remove(oldMesh)
 
-def decimate(context, obj, lodSettings, abortOnShapekeys=False):
+def decimate(context, obj, lodSettings, abortOnShapekeys=False, ratio=None):
     if not lodSettings.decimate: return
     if obj.type != 'MESH': return
     if not obj.gflow.allowDecimation: return
+    if ratio is None: ratio = lodSettings.decimateAmount
+    if ratio >= 1.0 and lodSettings.decimateMode == 'BUDGET': return # already within budget
     
     # remove all shape keys, otherwise the decimation won't work
     if obj.data.shape_keys:
-        if abortOnShapekeys: return
+        if abortOnShapekeys: 
+            print("GamiFlow: "+obj.name+" is not decimated because it has shape keys")
+            return
+        print("GamiFlow: Removing the shape keys of "+obj.name+" to decimate it")
         for shapekey in reversed(obj.data.shape_keys.key_blocks[:]):
             obj.shape_key_remove(shapekey) 
     
     # Add a basic decimator
     decimate = obj.modifiers.new(type="DECIMATE", name="LoD Decimation (GFlow)")
-    decimate.ratio = lodSettings.decimateAmount  
+    decimate.ratio = ratio
 
     # Preserve the seams to avoid the textures getting all messed up
-    if lodSettings.decimatePreserveSeams:
-        selectedVerts = []
-        for v in obj.data.vertices:
-            v.select = False
-        for e in obj.data.edges:
-            if e.use_seam: 
-                for v in e.vertices: selectedVerts.append(v)
+    if lodSettings.decimatePreserveSeams or lodSettings.decimatePreserveUvBoundaries:
+        lockedVertices = helpers.getUvBoundaryVertices(obj.data, seams=lodSettings.decimatePreserveSeams, uvSplits=lodSettings.decimatePreserveUvBoundaries)
         seamsMapName = "GFLOW_Seams"
         vxgroup = obj.vertex_groups.new(name=seamsMapName)
-        vxgroup.add(selectedVerts, 1.0, 'REPLACE')
+        vxgroup.add(lockedVertices.tolist(), 1.0, 'REPLACE')
         decimate.vertex_group = seamsMapName
         decimate.invert_vertex_group = True
+
+# Lowest ratio a triangle budget can ask for, anything below would only leave scraps of the decimated meshes
+MIN_BUDGET_RATIO = 0.05
+
+# Decimates the objects of each asset, either with the fixed ratio or with the ratio that fits the triangle budget of the level
+# objectsPerAsset is a list of lists of objects, each list being exported as one asset
+def decimateAssets(context, objectsPerAsset, lodSettings, abortOnShapekeys=False):
+    if not lodSettings.decimate: return
+    for objects in objectsPerAsset:
+        ratio = None
+        if lodSettings.decimateMode == 'BUDGET':
+            # The objects that can't be decimated still count towards the budget
+            fixed, reducible = 0, 0
+            for o in objects:
+                if o.type != 'MESH': continue
+                triangles = helpers.countTriangles(o.data)
+                canDecimate = o.gflow.allowDecimation and not (abortOnShapekeys and o.data.shape_keys)
+                if canDecimate: reducible += triangles
+                else: fixed += triangles
+            if reducible == 0: continue
+            if fixed >= lodSettings.triangleBudget:
+                # Decimating the rest to nothing would not help, the asset is left as it is
+                print("GamiFlow: Warning: "+objects[0].name+" can't fit in "+str(lodSettings.triangleBudget)+" triangles, "+str(fixed)+" of them can't be decimated. Skipping its decimation.")
+                continue
+            ratio = min((lodSettings.triangleBudget-fixed)/reducible, 1.0)
+            if ratio < MIN_BUDGET_RATIO:
+                print("GamiFlow: Warning: "+objects[0].name+" would need a decimation ratio of "+str(round(ratio, 4))+" to fit in "+str(lodSettings.triangleBudget)+" triangles, using "+str(MIN_BUDGET_RATIO)+" instead")
+                ratio = MIN_BUDGET_RATIO
+        for o in objects: decimate(context, o, lodSettings, abortOnShapekeys, ratio)
         
         
         
-def generateLod(context, obj, collection, level, originalObjects, lodSettings):
+# True if decimate() is going to change the mesh itself and not just add a modifier
+def decimationModifiesMesh(obj, lodSettings, abortOnShapekeys=False):
+    if not lodSettings.decimate or obj.type != 'MESH' or not obj.gflow.allowDecimation: return False
+    if obj.data.shape_keys and abortOnShapekeys: return False
+    return obj.data.shape_keys is not None or lodSettings.decimatePreserveSeams or lodSettings.decimatePreserveUvBoundaries
+
+# The LODs are built as a chain: the (not yet decimated) mesh of a level is the starting point of the next one,
+# so every level only has to remove its own tags, and levels without any tags simply reuse the previous mesh
+class LodChain:
+    def __init__(self):
+        self.meshes = {} # LOD0 mesh -> reduced mesh of the last level
+        self.levels = {} # LOD0 mesh -> levels at which its tags remove something
+        self.created = []
+    def reduce(self, mesh, level):
+        if mesh not in self.levels:
+            self.levels[mesh] = sets.getReductionLevels(mesh)
+            self.meshes[mesh] = mesh
+        if level in self.levels[mesh]:
+            reduced = self.meshes[mesh].copy()
+            sets.ReductionPlan().collapseEdges(level).deleteFaces(level).dissolveEdges(level, keepPainter=False).applyToMesh(reduced)
+            self.created.append(reduced)
+            self.meshes[mesh] = reduced
+        return self.meshes[mesh]
+    # Intermediate meshes that no level ended up using
+    def cleanup(self):
+        for m in self.created:
+            if m.users == 0: bpy.data.meshes.remove(m)
+
+# The new objects are added to the created list, they still have to be decimated
+def generateLod(context, obj, collection, level, originalObjects, lodSettings, sharedLods=None, chain=None, lod0Settings=None, created=None):
     stgs = settings.getSettings()
     lodsuffix = stgs.lodsuffix+str(level)
     if level>obj.gflow.maxLod: return None
+    if sharedLods is None: sharedLods = {}
+    if chain is None: chain = LodChain()
     newobj = None
     if (obj.type == 'MESH' or obj.type == 'EMPTY') and obj in originalObjects:
-        newobj = sets.duplicateObject(obj, collection, suffix=lodsuffix, workingSuffix="", link=False)
+        # Objects sharing a mesh also share its reduced version
+        newobj = sets.duplicateObject(obj, collection, suffix=lodsuffix, workingSuffix="", link=obj.type == 'MESH')
         newobj.name = newobj.name.replace(stgs.lodsuffix+"0", "") # hack to remove the original lod0 suffix
         if obj.type == 'MESH':
-            sets.collapseEdges(context, newobj, level)
-            sets.deleteDetailFaces(context, newobj, level)
-            sets.removeEdgesForLevel(context, newobj, level, keepPainter=False)
-            decimate(context, newobj, lodSettings)
+            sharedLod = sharedLods.get(obj.data)
+            if sharedLod:
+                newobj.data = sharedLod
+            else:
+                reduced = chain.reduce(obj.data, level)
+                # The chain meshes are shared between levels, so they must not be touched by the decimation
+                mustCopy = decimationModifiesMesh(newobj, lodSettings)
+                if reduced == obj.data and lod0Settings: mustCopy = mustCopy or decimationModifiesMesh(obj, lod0Settings, abortOnShapekeys=True)
+                newobj.data = reduced.copy() if mustCopy else reduced
+                if obj.data.users > 1: sharedLods[obj.data] = newobj.data
+        if created is not None: created.append(newobj)
     for c in obj.children:
-        newchild = generateLod(context, c, collection, level, originalObjects, lodSettings)
+        newchild = generateLod(context, c, collection, level, originalObjects, lodSettings, sharedLods, chain, lod0Settings, created)
         if not newchild: continue
         newchild.parent = newobj if newobj else obj
     return newobj
 
-def generateExport(context):
-    # Make sure we don't already have a filled export set
+# Deletes the export objects that are out of date and returns the working set roots that can be kept as they are
+def findReusableRoots(collection, rootHashes):
+    # Group the existing export objects by the working set hierarchy they came from
+    objectsPerRoot = {}
+    for o in collection.all_objects:
+        root = o.gflow.exportSourceRoot
+        if root not in objectsPerRoot: objectsPerRoot[root] = []
+        objectsPerRoot[root].append(o)
+    
+    reusable = set()
+    for root, objects in objectsPerRoot.items():
+        upToDate = root is not None and root in rootHashes
+        upToDate = upToDate and all(o.gflow.exportHash == rootHashes[root] for o in objects)
+        if upToDate: 
+            reusable.add(root)
+        else:
+            for o in objects: sets.deleteObject(o)
+    return reusable
+
+def generateExport(context, incremental=None, roots=None):
+    if incremental is None: incremental = context.scene.gflow.incrementalExport
+    
+    # Hash every hierarchy of the working set to know which ones need to be regenerated
+    workingObjects = sets.filterByRoots(context.scene.gflow.workingCollection.all_objects, roots)
+    tracing.phase("Hashing", workingObjects)
+    hasher = hashing.ContentHasher()
+    salt = hashing.settingsHash(context)
+    rootHashes = {}
+    for o in workingObjects:
+        root = hashing.findHierarchyRoot(o)
+        if root not in rootHashes: rootHashes[root] = hasher.hierarchy(root, salt)
+    
+    # Make sure we don't already have a filled export set (or at least not an outdated one)
     collection = getCollection(context, createIfNeeded=False)
-    if collection: sets.clearCollection(collection)
+    keptRoots = set()
+    if collection: 
+        if incremental: keptRoots = findReusableRoots(collection, rootHashes)
+        else: sets.clearCollection(collection)
     # But make we sure do have one
     collection = getCollection(context, createIfNeeded=True)
+    keptObjects = set(collection.all_objects)
+    if len(keptRoots)>0:
+        print("GamiFlow: Reusing "+str(len(keptObjects))+" export objects from "+str(len(keptRoots))+" unchanged hierarchies")
+    # All the passes below must only touch what we are regenerating
+    def freshObjects():
+        return [o for o in collection.all_objects if o not in keptObjects]
+    def freshRoots():
+        return [o for o in freshObjects() if o.parent is None]
     
     # Collection visibility
     sets.setCollectionVisibility(context, collection, True)
@@ -442,10 +590,20 @@ def generateExport(context):
     # A collection instance template has already been completely processed and merged
     # and is ready to be instanciated again
     collectionInstanceTemplate = {}
+    # Templates made by previous exports
+    templateCache = cache.TemplateCache(context.scene) if context.scene.gflow.useCache else None
     
 
     def prepareCollectionInstance(collection):
         if collection in collectionInstanceTemplate: return
+        if templateCache:
+            templateKey = hasher.collection(collection)+"_"+salt
+            cachedObjects = templateCache.fetch(templateKey, collection)
+            if cachedObjects is not None:
+                processedInstance = sets.GeneratorData()
+                for o in cachedObjects: processedInstance.register(o, None)
+                collectionInstanceTemplate[collection] = processedInstance
+                return
         print("GamiFlow: Preparing collection "+collection.name + " for instancing")
         
         # Generate all the objects as normal
@@ -462,12 +620,15 @@ def generateExport(context):
             o.matrix_world = mathutils.Matrix.Identity(4)
 
         collectionInstanceTemplate[collection] = processedInstance
+        if templateCache: templateCache.store(templateKey, collection, mergedObjects)
                                     
 
     def populateExportList(objectsToDuplicate, namePrefix=""):
         localgen = sets.GeneratorData()
         roots = []
         parented = []
+        meshLeaders = {} # mesh key: first export object made from it
+        followers = {} # first export object: the other ones sharing its mesh
         stgs = settings.getSettings()
 #BEGINTRIM --------------------------------------------------  
         useDecalMachine = settings.isDecalMachineEnabled(stgs)
@@ -479,10 +640,23 @@ def generateExport(context):
             if not (o.gflow.objType == 'STANDARD' or o.gflow.objType == 'NON_BAKED'): continue
             if not  o.gflow.exportable: continue
             
+            # Linked duplicates in the working set only need to be processed once
+            meshKey = None
+            leader = None
+            if o.type == 'MESH' and o.data.users > 1:
+                meshKey = hasher.meshKey(o, salt)
+                leader = meshLeaders.get(meshKey)
+            
             # Make a copy the object
-            newobj = sets.duplicateObject(o, collection, suffix=exportSuffix, workingSuffix=workingSuffix, link=o.type=='ARMATURE')
+            newobj = sets.duplicateObject(o, collection, suffix=exportSuffix, workingSuffix=workingSuffix, link=o.type=='ARMATURE' or leader is not None)
             newobj.name = namePrefix+newobj.name
             localgen.register(newobj, o)
+            if leader:
+                newobj.data = leader.data
+                followers[leader].append(newobj)
+            elif meshKey:
+                meshLeaders[meshKey] = newobj
+                followers[newobj] = []
             
             sets.setObjectAction(newobj, newobj.gflow.exportAction, newobj.gflow.exportActionObjectSlotName)
             sets.setShapekeyAction(newobj, newobj.gflow.exportAction, newobj.gflow.exportActionShapekeySlotName)
@@ -531,7 +705,6 @@ def generateExport(context):
             
             # remove cage control data
             if o.type == 'MESH': 
-                sets.removeCageEdges(newobj)
                 geotags.removeObjectCageLayers(newobj)
                 
             # Unparenting for now as the new parent might not yet exist
@@ -542,23 +715,31 @@ def generateExport(context):
             else:
                 roots.append(newobj)
                 
-            if o.type=='MESH':
-                sets.generatePartialSymmetryIfNeeded(context, newobj)
+            if o.type=='MESH' and leader:
+                # The mesh is already taken care of, and the modifiers will be applied to it only once
+                for m in list(newobj.modifiers):
+                    if m.type not in EXPORT_KEPT_MODIFIERS: newobj.modifiers.remove(m)
+            elif o.type=='MESH':
+                with tracing.span("Prepare", newobj):
+                    # The cage edges have to go before the symmetry, but the rest can be done in the same pass if there's no symmetry to generate
+                    reduction = sets.ReductionPlan().dissolveCageEdges()
+                    if sets.needsPartialSymmetry(newobj):
+                        reduction.apply(newobj)
+                        sets.generatePartialSymmetryIfNeeded(context, newobj)
+                        reduction = sets.ReductionPlan()
             
-                # Remove all detail edges
-                helpers.setSelected(context, newobj)
-                sets.collapseEdges(context, newobj)
-                sets.removeEdgesForLevel(context, newobj, 0, keepPainter=False)
-                sets.deleteDetailFaces(context, newobj)
+                    # Remove all detail edges
+                    helpers.setSelected(context, newobj)
+                    reduction.collapseEdges(0).dissolveEdges(0, keepPainter=False).deleteFaces(0).apply(newobj)
                 
-                # Set the material
-                if o.gflow.objType != 'NON_BAKED':
-                    material = sets.getTextureSetMaterial(o.gflow.textureSet, context.scene.gflow.mergeUdims)
-                    sets.setMaterial(newobj, material)
+                    # Set the material
+                    if o.gflow.objType != 'NON_BAKED':
+                        material = sets.getTextureSetMaterial(o.gflow.textureSet, context.scene.gflow.mergeUdims)
+                        sets.setMaterial(newobj, material)
                 
-                # Process modifiers
-                sets.removeLowModifiers(context, newobj)
-                helpers.setDeselected(newobj) 
+                    # Process modifiers
+                    sets.removeLowModifiers(context, newobj)
+                    helpers.setDeselected(newobj) 
             elif o.type == 'EMPTY':
                 newobj.instance_type = 'NONE'
                 # Realise the instance
@@ -573,6 +754,7 @@ def generateExport(context):
                         instgen = sets.GeneratorData()
                         for io in template.generated:
                             i = sets.duplicateObject(io, collection, suffix="_TMP_", workingSuffix=workingSuffix, link=True) # Should ideally use linked but causes issues when merging later
+                            cache.untag(i)
                             instgen.register(i, io)
                         for i in instgen.parented:
                             instgen.reparent(i)
@@ -595,7 +777,14 @@ def generateExport(context):
             
         # Now we can apply all the modifiers
         for newobj in localgen.generated:
-            processModifiers(context, localgen, newobj) 
+            processModifiers(context, localgen, newobj, apply=False) 
+        with tracing.span("Apply modifiers"):
+            sets.applyModifiersBatch(context, localgen.generated, EXPORT_KEPT_MODIFIERS)
+        for leader, others in followers.items():
+            for newobj in others:
+                oldMesh = newobj.data
+                newobj.data = leader.data
+                if oldMesh.users == 0: bpy.data.meshes.remove(oldMesh)
 
             
         # Do another pass to check that we are not parenting to something that will end up getting merged
@@ -606,14 +795,36 @@ def generateExport(context):
         return localgen
     
     print("GamiFlow: Populate Export Set")
-    gen = populateExportList(list(context.scene.gflow.workingCollection.all_objects))
+    tracing.phase("Populate")
+    gen = populateExportList([o for o in workingObjects if hashing.findHierarchyRoot(o) not in keptRoots])
 
+    tracing.phase("Source tagging", gen.generated)
     # Clean up all the instance templates
-    for it in collectionInstanceTemplate.values():
-        for o in it.generated:
-            sets.deleteObject(o)
+    if templateCache:
+        # The cached templates are kept, but the instances must stop sharing their meshes with them as they will be modified from now on
+        templateMeshes = set(o.data for it in collectionInstanceTemplate.values() for o in it.generated if o.type == 'MESH')
+        ownMeshes = {}
+        for o in freshObjects():
+            if o.type != 'MESH' or o.data not in templateMeshes: continue
+            if o.data not in ownMeshes: ownMeshes[o.data] = o.data.copy()
+            o.data = ownMeshes[o.data]
+        templateCache.prune()
+    else:
+        for it in collectionInstanceTemplate.values():
+            for o in it.generated:
+                sets.deleteObject(o)
+            
+    # Remember where each new object came from so that it can be reused next time
+    for o in freshObjects():
+        top = o
+        while top.parent: top = top.parent
+        source = gen.findSource(top)
+        root = hashing.findHierarchyRoot(source) if source else None
+        o.gflow.exportSourceRoot = root
+        o.gflow.exportHash = rootHashes.get(root, "")
 
     # Deal with the anchors
+    tracing.phase("Anchors", gen.generated)
     for o in list(gen.generated):
         for anchorId, anchor in enumerate(o.gflow.exportAnchors):
             if not anchor.obj: continue
@@ -621,20 +832,26 @@ def generateExport(context):
                 o.matrix_world = anchor.obj.matrix_world.copy()
             else:
                 # Make a copy of the object and place it
-                clone = sets.duplicateObject(o, collection, prefix="", suffix=anchor.obj.name, workingSuffix="", link=False)
+                clone = sets.duplicateObject(o, collection, prefix="", suffix=anchor.obj.name, workingSuffix="", link=True)
                 gen.register(clone, gen.findSource(o))
                 clone.matrix_world = anchor.obj.matrix_world.copy()
             
 
     # Lightmap UVs generation
     if context.scene.gflow.lightmapUvs:
+        tracing.phase("Lightmap unwrap", gen.generated)
+        # Every placement needs its own space in the lightmap
+        for o in freshObjects(): sets.makeSingleUser(o)
         uv.lightmapUnwrap(context, gen.generated)
         
     # Vertex color baking and double sided geo
+    tracing.phase("Vertex colours", gen.generated)
     bpy.ops.object.select_all(action='DESELECT')
     random.seed(0)
     for index, o in enumerate(gen.generated):
         if helpers.isObjectValidMesh(o):
+            # Baked colours depend on where the object is
+            if o.gflow.doubleSided or context.scene.gflow.exportVertexColors: sets.makeSingleUser(o)
 
             if o.gflow.doubleSided:
                 # Duplicate and flip normals
@@ -658,7 +875,7 @@ def generateExport(context):
                 helpers.setDeselected(context.object)
             else:
                 if context.scene.gflow.exportVertexColors:
-                    bakeVertexColor(context, context.scene, o)            
+                    with tracing.span("Vertex colours", o): bakeVertexColor(context, context.scene, o)            
                 
  
     # TODO: double sided geometry
@@ -673,21 +890,13 @@ def generateExport(context):
 
     
     if context.scene.gflow.lightmapUvs:
+        tracing.phase("Lightmap pack")
         if stgs.mergeExportMeshes:
             print("GamiFlow: Find mergeable meshes")
-            todo = sets.findRoots(collection)
+            todo = freshRoots()
             bpy.ops.object.select_all(action='DESELECT')
-            chunks = []
             # Build a list of 'chunks' that can be merged together
-            while(len(todo)>0):
-                # Pick one object in the todo list and decide what to do with its children
-                root = todo[0]
-                todo.remove(root)
-                merge, todo = mergeHierarchy(root, [], todo, context.scene.gflow.mergeUdims)
-                #if len(merge)>0:
-                chunk = Chunk()
-                chunk.objects = merge+[root]
-                chunks.append(chunk)
+            chunks = planChunks(todo, context.scene.gflow.mergeUdims)
          
             # Now that we know how objects will be grouped, we can uv pack them together
             groups = [chunk.objects for chunk in chunks]
@@ -695,62 +904,67 @@ def generateExport(context):
             #    groups.append(chunk.objects)
             uv.lightmapPack(context, groups)
         else:
-            groups = [[o] for o in collection.all_objects]
+            groups = [[o] for o in freshObjects()]
             uv.lightmapPack(context, groups)
         
      
     # Generate other levels of detail here
-    originalRoots = sets.findRoots(collection)[:]
-    originalObjects = collection.all_objects[:]
-    for level in range(1,len(context.scene.gflow.lod.lods)):
+    originalRoots = freshRoots()
+    originalObjects = freshObjects()
+    tracing.phase("LODs", originalObjects)
+    # Every level is done for all the roots at once, starting from the meshes of the previous level
+    lods = context.scene.gflow.lod.lods
+    chain = LodChain()
+    originalSet = set(originalObjects)
+    for level in range(1,len(lods)):
+        sharedLods = {}
+        objectsPerAsset = []
         for o in originalRoots:
-            generateLod(context, o, collection, level, originalObjects, context.scene.gflow.lod.lods[level]) 
+            with tracing.span("LOD"+str(level), o):
+                created = []
+                generateLod(context, o, collection, level, originalSet, lods[level], sharedLods, chain, lods[0], created)
+                objectsPerAsset.append(created)
+        decimateAssets(context, objectsPerAsset, lods[level])
+    chain.cleanup()
     
     # Decimate the first lod if needed too
-    for o in originalObjects:
-        decimate(context, o, context.scene.gflow.lod.lods[0], abortOnShapekeys=True)
+    decimateAssets(context, [[o for o in [r]+list(r.children_recursive) if o in originalSet] for r in originalRoots], lods[0], abortOnShapekeys=True)
         
     # Re apply all the new modifiers
-    for o in collection.all_objects:
-        helpers.setSelected(context, o)
-        applyModifiers(context, o, True)
-        helpers.setDeselected(o)
+    tracing.phase("Modifiers")
+    for objs in groupSharedMeshes(freshObjects(), lambda o: [m for m in o.modifiers if m.type not in EXPORT_KEPT_MODIFIERS]):
+        with tracing.span("Apply modifiers", objs[0]):
+            applySharedModifiers(context, objs, True)
         
     # Triangulate and apply 
     # Done after the rest because the DataTransfer modifier gets confused if the source object is triangulated but the current object is not
     # But needs special treatment because shared meshes don't like modifiers being applied
-    triangulateObjects(context, collection.all_objects)        
+    tracing.phase("Triangulation")
+    triangulateObjects(context, freshObjects())        
         
     # Merge all possible objects 
     if stgs.mergeExportMeshes:
+        tracing.phase("Merge")
         print("GamiFlow: Find mergeable meshes")
-        todo = sets.findRoots(collection)
+        todo = freshRoots()
         bpy.ops.object.select_all(action='DESELECT')
         
         # Build a list of 'chunks' that can be merged together
-        chunks = []
-        while(len(todo)>0):
-            # Pick one object in the todo list and decide what to do with its children
-            root = todo[0]
-            todo.remove(root)
-            merge, todo = mergeHierarchy(root, [], todo, context.scene.gflow.mergeUdims)
-            #if len(merge)>0:
-            chunk = Chunk()
-            chunk.objects = merge+[root]
-            chunks.append(chunk)
+        chunks = planChunks(todo, context.scene.gflow.mergeUdims)
         # Actually do the merge
         print("GamiFlow: Merge into "+str(len(chunks))+" groups")
         for chunk in chunks:
-            chunk.merge(context, False)
+            with tracing.span("Merge", chunk.objects[-1]): chunk.merge(context, False)
     
     
+    tracing.phase("Cleanup")
+    # Shared meshes must only be touched once
+    meshObjects = list({o.data: o for o in freshObjects() if o.type == 'MESH'}.values())
     if context.scene.gflow.exportFormat == "GLTF" and context.scene.gflow.exportTarget == "SKETCHFAB":
-        for o in collection.all_objects:
-            if o.type == 'MESH': uv.flipUVs(o)
+        for o in meshObjects: uv.flipUVs(o)
 
     # Remove custom gamiflow data
-    for o in collection.all_objects:
-        if o.type=='MESH': geotags.removeObjectLayers(o)                
+    for o in meshObjects: geotags.removeObjectLayers(o)                
 
     # Reset the armatures back to their useful state
     for armature in armatures:
@@ -766,7 +980,7 @@ def generateExport(context):
     if stgs.renameExportMeshes:
         print("GamiFlow: Rename export meshes")
         meshes = []
-        for o in collection.all_objects:
+        for o in freshObjects():
             if o.type == 'MESH' and o.data not in meshes:
                 o.data.name = o.name
                 meshes.append(o.data)
@@ -776,6 +990,8 @@ def generateExport(context):
         for c in context.collection.children_recursive:
             if c.DM.isdecaltypecol: sets.setCollectionVisibility(context, c, False, recursive=True)
 #ENDTRIM -----------------------------------------------------                   
+    tracing.endPhase()
+    return gen
     
     
 
@@ -791,7 +1007,9 @@ class GFLOW_OT_MakeExport(bpy.types.Operator):
             return False
         return True
     def execute(self, context):
-        generateExport(context)
+        with tracing.session(context, "export"):
+            if not workers.generateInWorkers(context, 'EXPORT'):
+                generateExport(context)
         
         return {"FINISHED"} 
 
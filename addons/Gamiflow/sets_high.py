@@ -5,6 +5,10 @@ from . import helpers
 from . import geotags
 from . import sets_cage
 from . import uv
+from . import hashing
+from . import cache
+from . import workers
+from . import tracing
 
 def getCollection(context, createIfNeeded=False):
     c = context.scene.gflow.painterHighCollection
@@ -94,7 +98,7 @@ def processNewObject(context, o, stgs, isBakeObject=False):
             
     helpers.setDeselected(o)
 
-def generatePainterHigh(context):
+def generatePainterHigh(context, roots=None):
     highCollection = getCollection(context, createIfNeeded=False)
     if highCollection: sets.clearCollection(highCollection)
     highCollection = getCollection(context, createIfNeeded=True)
@@ -112,6 +116,31 @@ def generatePainterHigh(context):
 
     # Go through all the objects of the working set
     gen = sets.GeneratorData()
+
+    # Evaluated meshes from previous generations, the modifier stacks of high-polys can be very expensive
+    meshCache = None
+    if context.scene.gflow.useCache:
+        meshCache = cache.MeshCache(context.scene, "HIGH", useFolder=context.scene.gflow.highCacheLocation=='FOLDER')
+    hasher = hashing.ContentHasher()
+    # The ID map and baker settings change the processing too
+    salt = cache.getSalt("HIGH")+"_"+hashing.cacheSettingsHash(context, "HIGH")
+    cacheKeys = {}
+    cacheHits = set()
+
+    # Swaps the mesh of a fresh duplicate with the cached evaluated one if possible
+    def useCachedMesh(source, newobj, isBakeObject=False):
+        if not meshCache or source.type != 'MESH': return False
+        key = hasher.meshKey(source, salt+"_"+str(isBakeObject))
+        cachedMesh = meshCache.fetch(key, source.data.name)
+        if cachedMesh is None:
+            cacheKeys[newobj] = key
+            return False
+        oldMesh = newobj.data
+        newobj.data = cachedMesh
+        newobj.modifiers.clear()
+        cacheHits.add(newobj)
+        if oldMesh.users == 0: bpy.data.meshes.remove(oldMesh)
+        return True
     
     def populateHighList(objectsToDuplicate, namePrefix=""):
         localgen = sets.GeneratorData()
@@ -158,8 +187,11 @@ def generatePainterHigh(context):
             # Standard case: we just duplicate the working object and make minor adjustments
             if o.gflow.includeSelf:
                 if o.gflow.singleSided: suffix += decalsuffix
-                newobj = sets.duplicateObject(o, highCollection, suffix=suffix)
+                newobj = sets.duplicateObject(o, highCollection, suffix=suffix, link=meshCache is not None and o.type=='MESH')
                 newobj.name = namePrefix + newobj.name
+                isCached = useCachedMesh(o, newobj)
+                if not isCached and o.type == 'MESH' and newobj.data == o.data:
+                    newobj.data = o.data.copy() # we need our own copy after all
 
                 sets.setObjectAction(newobj, newobj.gflow.bakeAction, newobj.gflow.bakeActionObjectSlotName)
                 sets.setShapekeyAction(newobj, newobj.gflow.bakeAction, newobj.gflow.bakeActionShapekeySlotName)
@@ -177,8 +209,8 @@ def generatePainterHigh(context):
                 else:
                     roots.append(newobj)
         
-                if o.type == 'MESH':
-                    processNewObject(context, newobj, stgs)
+                if o.type == 'MESH' and not isCached:
+                    with tracing.span("Prepare", newobj): processNewObject(context, newobj, stgs)
                         
             # But we can also have manually-linked high-polys that we have to add and parent
             for hp in o.gflow.highpolys:
@@ -191,7 +223,9 @@ def generatePainterHigh(context):
                 if hp.obj.gflow.objType == 'DECAL' or hp.obj.gflow.singleSided: 
                     hpsuffix = hpsuffix + decalsuffix
                 newhp.name = namePrefix+sets.getNewName(o, "", hpsuffix, "") + "_" + hp.obj.name
-                processNewObject(context, newhp, stgs, isBakeObject=True)
+                # Linked instances are cheap anyway, only the ones with their own mesh are worth caching
+                if canUseLinkedInstance or not useCachedMesh(hp.obj, newhp, isBakeObject=True):
+                    with tracing.span("Prepare", newhp): processNewObject(context, newhp, stgs, isBakeObject=True)
                 gen.register(newhp, hp.obj)
                 localgen.register(newhp, hp.obj)
                 if newobj: 
@@ -209,12 +243,16 @@ def generatePainterHigh(context):
 
         # Now go back through all the objects and deal with their mesh data and modifiers
         # It is crucial to wait until the other objects have been created so that we can e.g. change what object is referenced in mirror or array modifiers
-        for newobj in localgen.generated:
+        toApply = [o for o in localgen.generated if o not in cacheHits] # the others were already evaluated in a previous generation
+        for newobj in toApply:
             sets.updateModifierDependencies(localgen, newobj)
             helpers.setSelected(context, newobj)
             sets.applyPainterModifiers(context, newobj, True)
-            sets.applyModifiers(context, newobj)
             helpers.setDeselected(newobj)
+        with tracing.span("Apply modifiers"):
+            sets.applyModifiersBatch(context, toApply)
+        for newobj in toApply:
+            if newobj in cacheKeys: meshCache.store(cacheKeys[newobj], newobj.data)
         # Now that we have all the objects we can try rebuilding the intended hierarchy
         for newobj in parented:
             localgen.reparent(newobj)
@@ -222,10 +260,12 @@ def generatePainterHigh(context):
 
 
         
-    populateHighList(list(context.scene.gflow.workingCollection.all_objects))
-        
+    tracing.phase("Populate")
+    populateHighList(sets.filterByRoots(context.scene.gflow.workingCollection.all_objects, roots))
+    if meshCache: meshCache.prune()
 
     # Deal with anchors
+    tracing.phase("Anchors", gen.generated)
     for o in gen.generated:
         if o.gflow.bakeAnchor:
             # Leave a ghost behind if need be
@@ -236,10 +276,12 @@ def generatePainterHigh(context):
             o.matrix_world = o.gflow.bakeAnchor.matrix_world.copy()
            
     # Remove cage modifiers in case the user played with them
+    tracing.phase("Cleanup", gen.generated)
     for o in gen.generated:
         sets_cage.removeCageModifier(context, o)
            
-    return
+    tracing.endPhase()
+    return gen
 
 
 class GFLOW_OT_MakeHigh(bpy.types.Operator):
@@ -254,7 +296,9 @@ class GFLOW_OT_MakeHigh(bpy.types.Operator):
             return False
         return True
     def execute(self, context):
-        generatePainterHigh(context)
+        with tracing.session(context, "high"):
+            if not workers.generateInWorkers(context, 'HIGH'):
+                generatePainterHigh(context)
         
         return {"FINISHED"} 
 
@@ -5,6 +5,10 @@ from . import helpers
 from . import uv
 from . import geotags
 from . import sets_cage
+from . import hashing
+from . import cache
+from . import workers
+from . import tracing
 
 def getCollection(context, createIfNeeded=False):
     c = context.scene.gflow.painterLowCollection
@@ -27,7 +31,7 @@ def processModifiers(context, generatorData, obj):
     sets.updateModifierDependencies(generatorData, obj)
            
 
-def generatePainterLow(context):
+def generatePainterLow(context, roots=None):
     lowCollection = getCollection(context, createIfNeeded=False)
     if lowCollection: sets.clearCollection(lowCollection)
     
@@ -45,10 +49,17 @@ def generatePainterLow(context):
     lpsuffix = stgs.lpsuffix
 
     # Go through all the objects of the working set
-    knownMeshes = []
     knownObjectsWithMeshInUvSquare = {}
+    # The UV offsets are only applied once everything is generated, so that the cached meshes never contain them
+    objectsToOffset = set()
     gen = sets.GeneratorData()
     
+    # Reduced meshes from previous generations
+    meshCache = cache.MeshCache(context.scene, "LOW") if context.scene.gflow.useCache else None
+    hasher = hashing.ContentHasher()
+    salt = cache.getSalt("LOW")+"_"+hashing.cacheSettingsHash(context, "LOW")
+    cacheKeys = {}
+    
     def populateLowList(objectsToDuplicate, namePrefix="", allowUvOffset=True):
         localGen = sets.GeneratorData()
         roots = []
@@ -58,31 +69,40 @@ def generatePainterLow(context):
             if not (o.type == 'MESH' or o.type=='EMPTY' or o.type=='ARMATURE'): continue
             if o.gflow.objType != 'STANDARD': continue
             
+            # Check if we already know what this mesh will look like
+            cachedMesh = None
+            if meshCache and o.type == 'MESH':
+                key = hasher.meshKey(o, salt)
+                cachedMesh = meshCache.fetch(key, o.data.name)
+            
             # Make a copy the object
-            newobj = sets.duplicateObject(o, lowCollection, suffix=lpsuffix)
+            newobj = sets.duplicateObject(o, lowCollection, suffix=lpsuffix, link=cachedMesh is not None)
             newobj.name = namePrefix+newobj.name
             gen.register(newobj, o)
             localGen.register(newobj, o)
+            if cachedMesh:
+                newobj.data = cachedMesh
+                newobj.modifiers.clear()
+            elif meshCache and o.type == 'MESH':
+                cacheKeys[newobj] = key
 
             if o.type=='MESH':
                 # Special handling of instanced meshes
                 # Painter doesn't like overlapping UVs when baking so we offset the UVs by 1
-                if o.data in knownMeshes:
+                # Meshes already laid out outside of the UV square can't conflict with anything
+                if not uv.areUVsProbablyInside(o):
+                    pass
+                elif o.data in knownObjectsWithMeshInUvSquare:
                     if allowUvOffset:
                         # So in case of conflict, if we are allowed to, we just offset the UVs by exactly one UV square
                         # NOTE: Don't need to de-instantiate, the lowpoly copy has its own data
-                        uv.offsetCoordinates(newobj)
+                        objectsToOffset.add(newobj)
                     else:
                         # However, there are times we absolutely want one specific instance to be the one staying in the main uv square
                         # So instead we leave the current one where it is, but move whatever instance was there before outside
-                        try:
-                            uv.offsetCoordinates(knownObjectsWithMeshInUvSquare[o.data])
-                            knownObjectsWithMeshInUvSquare[o.data] = newobj
-                        except:
-                            # Turns out there was nothing in the uv square
-                            pass
+                        objectsToOffset.add(knownObjectsWithMeshInUvSquare[o.data])
+                        knownObjectsWithMeshInUvSquare[o.data] = newobj
                 else:
-                    knownMeshes.append(o.data)
                     knownObjectsWithMeshInUvSquare[o.data]= newobj
             
                 # Set the material
@@ -118,14 +138,13 @@ def generatePainterLow(context):
   
         # Now go back through all the objects and deal with their mesh data and modifiers
         # It is crucial to wait until the other objects have been created so that we can e.g. change what object is referenced in mirror or array modifiers
-        for newobj in localGen.generated:
-            if newobj.type == 'MESH':
+        toProcess = [o for o in localGen.generated if o.type == 'MESH' and not (meshCache and o not in cacheKeys)] # the others were already processed in a previous generation
+        for newobj in toProcess:
+            with tracing.span("Process", newobj):
                 helpers.setSelected(context, newobj)
-                sets.collapseEdges(context, newobj)
-                sets.removeEdgesForLevel(context, newobj, 0, keepPainter=True)
-                sets.deleteDetailFaces(context, newobj)
+                sets.ReductionPlan().collapseEdges(0).dissolveEdges(0, keepPainter=True).deleteFaces(0).apply(newobj)
                 sets.generatePartialSymmetryIfNeeded(context, newobj, offsetUvs=True)
-                
+            
                 # Process modifiers
                 processModifiers(context, localGen, newobj)
                 sets.removeLowModifiers(context, newobj)
@@ -134,12 +153,18 @@ def generatePainterLow(context):
                 sets.removePainterModifiers(context, newobj)
                 sets.applyPainterModifiers(context, newobj, False)
                 sets.enforceModifiersOrder(context, newobj)
-                sets.applyModifiers(context, newobj) # needs to be done if we use any shapekeys
-                uv.removeSecondaryUvLayers(newobj)
-                # Apply any shape key there might be (painter doesn't always seem to register them)
-                if newobj.data.shape_keys:
-                    bpy.ops.object.shape_key_remove(all=True, apply_mix=True)                
+                helpers.setDeselected(newobj)
+        # Needs to be done if we use any shapekeys
+        with tracing.span("Apply modifiers"):
+            sets.applyModifiersBatch(context, toProcess)
+        for newobj in toProcess:
+            uv.removeSecondaryUvLayers(newobj)
+            # Apply any shape key there might be (painter doesn't always seem to register them)
+            if newobj.data.shape_keys:
+                helpers.setSelected(context, newobj)
+                bpy.ops.object.shape_key_remove(all=True, apply_mix=True)                
                 helpers.setDeselected(newobj)            
+            if meshCache: meshCache.store(cacheKeys[newobj], newobj.data)
   
         # Now that we have all the objects we can try rebuilding the intended hierarchy
         for newobj in parented:
@@ -147,26 +172,37 @@ def generatePainterLow(context):
                 
         return roots
                 
+ 
     bpy.ops.object.select_all(action='DESELECT')  
-    populateLowList(list(context.scene.gflow.workingCollection.all_objects))
+    tracing.phase("Populate")
+    populateLowList(sets.filterByRoots(context.scene.gflow.workingCollection.all_objects, roots))
+    if meshCache: meshCache.prune()
+    
+    # Move the conflicting instances out of the UV square
+    tracing.phase("UV offsets", objectsToOffset)
+    for o in objectsToOffset:
+        uv.offsetCoordinates(o)
      
     # Deal with anchors
+    tracing.phase("Anchors", gen.generated)
     for o in gen.generated:
         if o.gflow.bakeAnchor:
             o.matrix_world = o.gflow.bakeAnchor.matrix_world.copy()        
 
     # Generate the cage
     if context.scene.gflow.useCage:
+        tracing.phase("Cage")
         sets_cage.generatePainterCage(context)
 
     # Clean up metadata and dissolve geo used to generate the cage
+    tracing.phase("Cleanup", gen.generated)
     for o in gen.generated:
         if o.type == 'MESH': 
-            sets.removeCageEdges(o)
-            geotags.removeObjectLayers(o)
+            sets.ReductionPlan().dissolveCageEdges().removeLayers().apply(o)
             sets_cage.removeCageModifier(context, o)
         
-    return
+    tracing.endPhase()
+    return gen
 
 
 class GFLOW_OT_MakeLow(bpy.types.Operator):
@@ -181,7 +217,9 @@ class GFLOW_OT_MakeLow(bpy.types.Operator):
             return False
         return True
     def execute(self, context):
-        generatePainterLow(context)
+        with tracing.session(context, "low"):
+            if not workers.generateInWorkers(context, 'LOW'):
+                generatePainterLow(context)
         
         return {"FINISHED"} 
 
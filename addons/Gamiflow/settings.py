@@ -41,6 +41,9 @@ class AddonPreferences(bpy.types.AddonPreferences):
     lightmapUVName : bpy.props.StringProperty(name = "Lightmap UV name", default = "UVLightMap")
     lightmapUVIndex : bpy.props.IntProperty(name="Lightmap UV Index", default=1, min=0)
         
+    workerCount : bpy.props.IntProperty(name="Worker processes", default=1, min=1, max=64, description="Unwrap the UDIMs, generate the sets and export kits with several background Blender processes, each taking care of part of the working set. 1 means everything is done in this session")
+    batchModifiers : bpy.props.BoolProperty(name="Batch modifier evaluation", default=True, description="Apply the modifiers of a whole set with as few scene evaluations as possible instead of one per object")
+    
     autoHideLods : bpy.props.BoolProperty(name = "Auto hide LODs", default=True, description="Hide irrelevant LODs when switching level")
     autoHideViewport : bpy.props.BoolProperty(name = "Viewport", default=True, description="Auto-hide will hide in viewport")
     autoHideRender : bpy.props.BoolProperty(name = "Render", default=True, description="Auto-hide will hide in renders")
@@ -181,6 +184,8 @@ class AddonPreferences(bpy.types.AddonPreferences):
 #ENDTRIM -----------------------------------------------------      
 
         layout.label(text="General")
+        layout.prop(self, "workerCount")
+        layout.prop(self, "batchModifiers")
         layout.prop(self, "displayWarning")
         if self.displayWarning:
             layout.prop(self, "warningColorA")
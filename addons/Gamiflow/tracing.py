@@ -0,0 +1,146 @@
+import bpy
+import os
+import json
+import time
+import contextlib
+from . import helpers
+
+# Lightweight tracing of the set generation
+# A session covers one operator, phases follow each other inside it and spans can wrap any smaller piece of work (usually one object).
+# The result is written as a Chrome trace (chrome://tracing or ui.perfetto.dev) and summarised in the sidebar.
+# When no session is running, everything here is a no-op.
+
+TRACE_FOLDER = "//gamiflow_traces"
+SUMMARY_SIZE = 10
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.events = []
+        self.phase = None
+    def now(self):
+        return (time.perf_counter()-self.start)*1000000.0
+    def add(self, name, category, begin, args):
+        self.events.append({"name": name, "cat": category, "ph": "X", "ts": begin, "dur": self.now()-begin, "pid": 1, "tid": 1, "args": args})
+    def counters(self):
+        self.events.append({"name": "datablocks", "ph": "C", "ts": self.now(), "pid": 1, "args": countDatablocks()})
+
+currentTrace = None
+# Summary of the last session, displayed in the UI: {name, seconds, file, phases: [(name, seconds, calls)], objects: [(name, phase, seconds)]}
+lastSummary = None
+
+def isTracing():
+    return currentTrace is not None
+
+def countDatablocks():
+    return {"objects": len(bpy.data.objects), "meshes": len(bpy.data.meshes), "materials": len(bpy.data.materials), "actions": len(bpy.data.actions), "images": len(bpy.data.images)}
+
+def describeObject(obj):
+    args = {"object": obj.name, "type": obj.type}
+    if obj.type == 'MESH':
+        args["vertices"] = len(obj.data.vertices)
+        args["faces"] = len(obj.data.polygons)
+    return args
+
+def getTraceFolder():
+    if bpy.data.is_saved: return bpy.path.abspath(TRACE_FOLDER)
+    return os.path.join(bpy.app.tempdir, "gamiflow_traces")
+
+# Wraps a whole operator
+@contextlib.contextmanager
+def session(context, name):
+    global currentTrace
+    if not context.scene.gflow.traceGeneration or currentTrace is not None:
+        yield
+        return
+    currentTrace = Trace(name)
+    currentTrace.counters()
+    try:
+        yield
+    finally:
+        trace = currentTrace
+        endPhase()
+        trace.counters()
+        trace.add(name, "session", 0.0, countDatablocks())
+        currentTrace = None
+        writeTrace(context, trace)
+
+# Starts a new phase, ending the previous one
+def phase(name, objects=None):
+    if currentTrace is None: return
+    endPhase()
+    args = {"datablocksBefore": countDatablocks()}
+    if objects is not None: args["objects"] = len(objects)
+    currentTrace.phase = (name, currentTrace.now(), args)
+def endPhase():
+    if currentTrace is None or currentTrace.phase is None: return
+    name, begin, args = currentTrace.phase
+    args["datablocksAfter"] = countDatablocks()
+    currentTrace.add(name, "phase", begin, args)
+    currentTrace.counters()
+    currentTrace.phase = None
+
+# Wraps a smaller piece of work, typically what is done to a single object
+@contextlib.contextmanager
+def span(name, obj=None):
+    if currentTrace is None:
+        yield
+        return
+    trace = currentTrace
+    begin = trace.now()
+    try:
+        yield
+    finally:
+        args = {"phase": trace.phase[0] if trace.phase else ""}
+        if obj is not None:
+            try:
+                args.update(describeObject(obj))
+            except ReferenceError:
+                pass # the object was removed in the meantime (e.g. merged)
+        trace.add(name, "object" if obj is not None else "span", begin, args)
+
+def summarise(trace, filepath):
+    phases = {}
+    objects = []
+    for e in trace.events:
+        if e["ph"] != "X": continue
+        if e["cat"] == "phase":
+            total, calls = phases.get(e["name"], (0.0, 0))
+            phases[e["name"]] = (total+e["dur"]/1000000.0, calls+1)
+        elif e["cat"] == "object":
+            objects.append((e["args"].get("object", e["name"]), e["name"], e["dur"]/1000000.0))
+    objects.sort(key=lambda o: -o[2])
+    return {
+        "name": trace.name,
+        "seconds": trace.now()/1000000.0,
+        "file": filepath,
+        "phases": sorted([(n, t, c) for n, (t, c) in phases.items()], key=lambda p: -p[1]),
+        "objects": objects[:SUMMARY_SIZE],
+    }
+
+def writeTrace(context, trace):
+    global lastSummary
+    folder = getTraceFolder()
+    filepath = os.path.join(folder, bpy.path.clean_name(context.scene.name)+"_"+trace.name+"_"+time.strftime("%Y%m%d_%H%M%S")+".json")
+    try:
+        os.makedirs(folder, exist_ok=True)
+        with open(filepath, "w") as f:
+            json.dump({"traceEvents": trace.events, "displayTimeUnit": "ms"}, f)
+        print("GamiFlow: Trace written to "+filepath)
+    except OSError as e:
+        print("GamiFlow: Could not write trace "+filepath+":\n"+repr(e))
+        filepath = ""
+    lastSummary = summarise(trace, filepath)
+
+
+classes = []
+
+def register():
+    for c in classes:
+        bpy.utils.register_class(c)
+    pass
+def unregister():
+    for c in reversed(classes):
+        helpers.safeUnregisterClass(c)
+    pass
@@ -3,6 +3,7 @@ from . import geotags
 from . import sets
 from . import settings
 from . import helpers
+from . import tracing
 from bl_ui import anim
 # Side panel
 class GFLOW_PT_BASE_PANEL(bpy.types.Panel):
@@ -18,7 +19,9 @@ class GFLOW_PT_Panel(GFLOW_PT_BASE_PANEL, bpy.types.Panel):
     bl_idname = "GFLOW_PT_PANEL"
     def draw(self, context):
         layout = self.layout
-        layout.operator("gflow.clear_sets", icon='TRASH')
+        row = layout.row(align=True)
+        row.operator("gflow.clear_sets", icon='TRASH')
+        row.operator("gflow.clear_cache", icon='X', text="")
         
         row = layout.row()
         op = row.operator("gflow.toggle_set_visibility", text="Working", depress=sets.getCollectionVisibility(context, context.scene.gflow.workingCollection))
@@ -71,6 +74,9 @@ class GFLOW_PT_PainterPanel(GFLOW_PT_BASE_PANEL, bpy.types.Panel):
         row = layout.row()
         row.operator("gflow.make_low")
         row.operator("gflow.make_high")
+        row.prop(context.scene.gflow, "useCache", text="", icon='FILE_CACHE')
+        if context.scene.gflow.useCache:
+            layout.prop(context.scene.gflow, "highCacheLocation")
         stgs = settings.getSettings()
         if stgs.baker == 'BLENDER':
             layout.operator("gflow.bake")
@@ -95,7 +101,9 @@ class GFLOW_PT_ExportPanel(GFLOW_PT_BASE_PANEL, bpy.types.Panel):
             row.prop(context.scene.gflow, "vertexChannelR", text="")
             row.prop(context.scene.gflow, "vertexChannelG", text="")
             row.prop(context.scene.gflow, "vertexChannelB", text="")
-        layout.operator("gflow.make_export")
+        row = layout.row(align=True)
+        row.operator("gflow.make_export")
+        row.prop(context.scene.gflow, "incrementalExport", text="", icon='FILE_REFRESH')
         layout.separator()
         row = layout.row()
         
@@ -165,11 +173,41 @@ class GFLOW_UL_lod(bpy.types.UIList):
         row = split.row(align=True)
         if item.decimate:
             row.prop(item, "decimate", text="")
-            row.prop(item, "decimateAmount")
+            row.prop(item, "decimateMode", text="")
+            if item.decimateMode == 'BUDGET': row.prop(item, "triangleBudget")
+            else: row.prop(item, "decimateAmount")
             row.prop(item, "decimatePreserveSeams", text="", icon="STICKY_UVS_VERT")
+            row.prop(item, "decimatePreserveUvBoundaries", text="", icon="UV_ISLANDSEL")
         else:
             row.prop(item, "decimate")
 
+class GFLOW_PT_TracePanel(GFLOW_PT_BASE_PANEL, bpy.types.Panel):
+    bl_label = "Profiling"
+    bl_parent_id = "GFLOW_PT_PANEL"
+    bl_options = {"DEFAULT_CLOSED"} 
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(context.scene.gflow, "traceGeneration")
+        
+        summary = tracing.lastSummary
+        if summary is None: return
+        box = layout.box()
+        box.label(text=summary["name"]+": "+"{:.2f}s".format(summary["seconds"]), icon='TIME')
+        if summary["file"]: box.label(text=bpy.path.basename(summary["file"]), icon='FILE')
+        col = box.column(align=True)
+        for name, seconds, calls in summary["phases"]:
+            row = col.row()
+            row.label(text=name if calls == 1 else name+" (x"+str(calls)+")")
+            row.label(text="{:.3f}s".format(seconds))
+        if summary["objects"]:
+            box.label(text="Slowest objects")
+            col = box.column(align=True)
+            for name, step, seconds in summary["objects"]:
+                row = col.row()
+                row.label(text=name)
+                row.label(text=step)
+                row.label(text="{:.3f}s".format(seconds))
+
 # Object settings
 class GFLOW_PT_OBJ_PANEL(bpy.types.Panel):
     bl_label = "Gamiflow"
@@ -667,7 +705,7 @@ class VIEW3D_OT_PIE_Obj_call(bpy.types.Operator):
 
 classes = [
     GFLOW_OT_ObjectActionSlotPopup,
-    GFLOW_PT_Panel, GFLOW_PT_WorkingSet, GFLOW_PT_PainterPanel, GFLOW_PT_ExportPanel, GFLOW_PT_UdimsPanel, GFLOW_PT_LodsPanel,
+    GFLOW_PT_Panel, GFLOW_PT_WorkingSet, GFLOW_PT_PainterPanel, GFLOW_PT_ExportPanel, GFLOW_PT_UdimsPanel, GFLOW_PT_LodsPanel, GFLOW_PT_TracePanel,
     GFLOW_UL_highpolies, GFLOW_UL_exportAnchors, GFLOW_UL_udims, GFLOW_UL_lod,
     GFLOW_PT_OBJ_PANEL, GamiflowObjPanel_UV, GamiflowObjPanel_Bake, GamiflowObjPanel_Export,
     GFLOW_PT_OBJ_EDIT_PANEL,
@@ -6,7 +6,7 @@ import addon_utils
 import importlib  
 import platform, os, subprocess, queue
 import time
-from bpy_extras.bmesh_utils import bmesh_linked_uv_islands
+import numpy as np
 from . import geotags
 from . import helpers
 from . import sets
@@ -51,13 +51,12 @@ def copyUvLayerToEnd(obj, uvLayerName):
     mesh.uv_layers[uvLayerName].name = tempName
     mesh.uv_layers.new(name=uvLayerName)
     # Copy the uvs
-    with helpers.objectModeBmesh(obj) as bm:
-        ouv = bm.loops.layers.uv[tempName]
-        nuv = bm.loops.layers.uv[uvLayerName]
-        for f in bm.faces:
-            for loop in f.loops:
-                loop[nuv].uv = loop[ouv].uv
+    uvs = np.empty(len(mesh.loops)*2, dtype=np.float32)
+    mesh.uv_layers[tempName].data.foreach_get("uv", uvs)
+    mesh.uv_layers[uvLayerName].data.foreach_set("uv", uvs)
     mesh.uv_layers.remove(mesh.uv_layers[tempName])
+    invalidateIslandIndex(obj)
+    invalidateUvBounds(mesh)
 
 def removeSecondaryUvLayers(obj):
     # need to do it this way because deleting layers seems to invalidate the array
@@ -85,79 +84,162 @@ def unhardenNonSeams(context, obj):
     return
 
 def flipUVs(obj):
-    with helpers.objectModeBmesh(obj) as bm:
-        for face in bm.faces:
-            for loop in face.loops:
-                for layer in bm.loops.layers.uv:
-                    loop[layer].uv[1] = 1.0-loop[layer].uv[1]
+    mesh = obj.data
+    uvs = np.empty(len(mesh.loops)*2, dtype=np.float32)
+    for layer in mesh.uv_layers:
+        layer.data.foreach_get("uv", uvs)
+        uvs[1::2] = 1.0-uvs[1::2]
+        layer.data.foreach_set("uv", uvs)
+    invalidateIslandIndex(obj)
+    invalidateUvBounds(mesh)
+    mesh.update()
+
+# UV bounds
+# Bounding box of every UV layer of a mesh as (min u, min v, max u, max v), keyed by the mesh's session id
+# Dropped whenever the mesh geometry changes (see onDepsgraphUpdate) or the UVs are written from here
+uvBounds = {}
+
+def getUvBounds(mesh):
+    bounds = uvBounds.get(mesh.session_uid)
+    if bounds is None:
+        bounds = {}
+        uvs = np.empty(len(mesh.loops)*2, dtype=np.float32)
+        for layer in mesh.uv_layers:
+            if len(uvs) == 0: continue
+            layer.data.foreach_get("uv", uvs)
+            uvs2d = uvs.reshape(-1, 2)
+            bounds[layer.name] = np.concatenate([uvs2d.min(axis=0), uvs2d.max(axis=0)])
+        uvBounds[mesh.session_uid] = bounds
+    return bounds
+def invalidateUvBounds(mesh=None):
+    if mesh is None: uvBounds.clear()
+    else: uvBounds.pop(mesh.session_uid, None)
+
+# True if the active UVs overlap the main UV square
+# Instances moved out of it by the low set generation are not, and don't need to be baked
+def areUVsProbablyInside(obj):
+    layer = obj.data.uv_layers.active
+    if not layer: return True
+    bounds = getUvBounds(obj.data).get(layer.name)
+    if bounds is None: return True
+    return bool(bounds[0] < 1.0 and bounds[1] < 1.0 and bounds[2] > 0.0 and bounds[3] > 0.0)
+# UV island index
+# Built once per object from the loop and UV arrays and shared by all the UV post-processing steps of an unwrap/pack pass
+# Array-based edits keep it up to date, anything going through an operator has to call invalidateIslandIndex()
+class UvIslandIndex:
+    def __init__(self, mesh):
+        self.layerName = mesh.uv_layers.active.name
+        faceCount, loopCount = len(mesh.polygons), len(mesh.loops)
+        loopStarts = np.empty(faceCount, dtype=np.int64)
+        mesh.polygons.foreach_get("loop_start", loopStarts)
+        loopTotals = np.empty(faceCount, dtype=np.int64)
+        mesh.polygons.foreach_get("loop_total", loopTotals)
+        self.loopFaces = np.repeat(np.arange(faceCount), loopTotals)
+        self.nextCorners = np.arange(1, loopCount+1)
+        self.nextCorners[loopStarts+loopTotals-1] = loopStarts
+        vertices = np.empty(loopCount, dtype=np.int64)
+        mesh.loops.foreach_get("vertex_index", vertices)
+        uvs = readUvs(mesh)
+        
+        # Two faces are in the same island if they share an edge with the same UVs on both ends
+        v0, v1 = vertices, vertices[self.nextCorners]
+        uv0, uv1 = uvs, uvs[self.nextCorners]
+        swap = v0 > v1
+        keys = np.column_stack([np.where(swap, v1, v0), np.where(swap, v0, v1), np.where(swap[:, None], uv1, uv0), np.where(swap[:, None], uv0, uv1)]).astype(np.float64)
+        _, groups = np.unique(keys, axis=0, return_inverse=True)
+        order = np.argsort(groups.ravel(), kind='stable')
+        sortedGroups = groups.ravel()[order]
+        same = sortedGroups[1:] == sortedGroups[:-1]
+        self.count, self.faceIslands = helpers.labelComponents(faceCount, self.loopFaces[order][:-1][same], self.loopFaces[order][1:][same])
+        self.loopIslands = self.faceIslands[self.loopFaces]
         
+        # Faces of island i are islandFaces[islandStarts[i]:islandStarts[i+1]]
+        self.islandFaces = np.argsort(self.faceIslands, kind='stable')
+        self.islandStarts = np.searchsorted(self.faceIslands[self.islandFaces], np.arange(self.count+1))
+        self.updateBounds(uvs)
+    def faces(self, island):
+        return self.islandFaces[self.islandStarts[island]:self.islandStarts[island+1]]
+    # Bounding box of every island as (min u, min v, max u, max v)
+    def updateBounds(self, uvs):
+        self.bounds = np.empty((self.count, 4), dtype=np.float32)
+        self.bounds[:, :2] = np.inf
+        self.bounds[:, 2:] = -np.inf
+        np.minimum.at(self.bounds[:, :2], self.loopIslands, uvs)
+        np.maximum.at(self.bounds[:, 2:], self.loopIslands, uvs)
+
+islandIndices = {}
+
+def getIslandIndex(obj):
+    index = islandIndices.get(obj.data.as_pointer())
+    if index is None or index.layerName != obj.data.uv_layers.active.name:
+        index = UvIslandIndex(obj.data)
+        islandIndices[obj.data.as_pointer()] = index
+    return index
+def invalidateIslandIndex(obj=None):
+    if obj is None: islandIndices.clear()
+    else: islandIndices.pop(obj.data.as_pointer(), None)
+    # Whatever made the index stale also moved the UVs
+    invalidateUvBounds(obj.data if obj else None)
+
+def readUvs(mesh):
+    uvs = np.empty(len(mesh.loops)*2, dtype=np.float32)
+    mesh.uv_layers.active.data.foreach_get("uv", uvs)
+    return uvs.reshape(-1, 2)
+# Writes the UVs of the active layer, keeping the island index in sync
+def writeUvs(obj, uvs):
+    obj.data.uv_layers.active.data.foreach_set("uv", uvs.ravel())
+    index = islandIndices.get(obj.data.as_pointer())
+    if index: index.updateBounds(uvs)
+    invalidateUvBounds(obj.data)
+    obj.data.update()
 
-def areUVsProbablyInside(obj):
-    with helpers.objectModeBmesh(obj) as bm:
-        uv_layer = bm.loops.layers.uv.active
-        for f in bm.faces:
-            for l in f.loops:
-                uv = l[uv_layer].uv
-                if uv[0] < 1.0 or uv[1]<1.0: return True
-    return True
-def findOrientationEdgeInIsland(faces, layer):
-    for face in faces:
-        for edge in face.edges:
-            if edge[layer] != geotags.GEO_EDGE_UV_ROTATION_NEUTRAL: return edge
-    return None
-def make_rotation_transformation(angle, origin=(0, 0)):
-    cos_theta, sin_theta = math.cos(angle), math.sin(angle)
-    x0, y0 = origin    
-    def xform(point):
-        x, y = point[0] - x0, point[1] - y0
-        return (x * cos_theta - y * sin_theta + x0,
-                x * sin_theta + y * cos_theta + y0)
-    return xform
-    
 # Potentially orients UV islands based on a tagged edge
+# Works in object mode
 def orientUv(context, obj):
-    orientLayer = None
-    with helpers.editModeObserverBmesh(obj) as bm:
-        orientLayer = geotags.getUvOrientationLayer(bm, forceCreation=False)
-    if not orientLayer: return
-
+    mesh = obj.data
+    orientLayer = mesh.attributes.get(geotags.GEO_EDGE_UV_ROTATION_NAME)
+    if not orientLayer or not mesh.uv_layers.active: return False
+    
+    tags = np.empty(len(mesh.edges), dtype=np.int32)
+    orientLayer.data.foreach_get("value", tags)
+    loopEdges = np.empty(len(mesh.loops), dtype=np.int64)
+    mesh.loops.foreach_get("edge_index", loopEdges)
+    taggedCorners = np.flatnonzero(tags[loopEdges] != geotags.GEO_EDGE_UV_ROTATION_NEUTRAL)
+    
     anythingRotated = False
-    with helpers.editModeBmesh(obj, loop_triangles=False, destructive=False) as bm:
-        uv_layer = bm.loops.layers.uv.active  
-
-        # Clean slate
-        bpy.ops.mesh.select_mode(type='FACE')
-        bpy.ops.mesh.select_all(action='DESELECT')  
+    if len(taggedCorners) > 0:
+        index = getIslandIndex(obj)
+        uvs = readUvs(mesh)
+        # The first tagged edge of every island, measured from its first corner like BMEdge.link_loops[0]
+        islands, first = np.unique(index.loopIslands[taggedCorners], return_index=True)
+        edges = loopEdges[taggedCorners[first]]
+        edgeCorners = np.full(len(mesh.edges), -1, dtype=np.int64)
+        uniqueEdges, firstCorners = np.unique(loopEdges, return_index=True)
+        edgeCorners[uniqueEdges] = firstCorners
+        corners = edgeCorners[edges]
+        pt0 = uvs[corners]
+        v = pt0 - uvs[index.nextCorners[corners]]
         
-        # Check every island for tagged edge
-        islands = bmesh_linked_uv_islands(bm, uv_layer)
-        for island in islands:
-            rotatorEdge = findOrientationEdgeInIsland(island, orientLayer)
-            if not rotatorEdge: continue
-            
-            # Find by how much we need to rotate the current edge
-            pt0 = rotatorEdge.link_loops[0][uv_layer].uv
-            pt1 = rotatorEdge.link_loops[0].link_loop_next[uv_layer].uv 
-            v = (pt0-pt1).normalized()
-            targetAngle = math.radians((rotatorEdge[orientLayer]-1)*90.0)                
-            currentAngle = math.atan2(v.x, v.y)
-            rotationAngle = currentAngle-targetAngle
-
-            # Perform the UV rotation
-            if rotationAngle != 0:
-                anythingRotated = True
-                rotationMatrix = make_rotation_transformation(rotationAngle, pt0)
-                for f in island:
-                    for l in f.loops:
-                        l[uv_layer].uv = rotationMatrix(l[uv_layer].uv)
-        #endfor islands
-
-        # Delete the ortientation layer if it was empty
-        if not anythingRotated: geotags.removeUvOrientationLayer(bm)
-            
-    # Upload the mesh changes
-    if anythingRotated: bmesh.update_edit_mesh(obj.data, loop_triangles=False, destructive=False) 
-                
+        # Find by how much we need to rotate each island
+        targetAngles = np.radians((tags[edges]-1)*90.0)
+        currentAngles = np.arctan2(v[:, 0], v[:, 1])
+        rotations = np.zeros(index.count)
+        rotations[islands] = currentAngles-targetAngles
+        origins = np.zeros((index.count, 2), dtype=np.float32)
+        origins[islands] = pt0
+        
+        # Perform the UV rotation
+        anythingRotated = bool((rotations != 0).any())
+        if anythingRotated:
+            angles = rotations[index.loopIslands]
+            origin = origins[index.loopIslands]
+            cosTheta, sinTheta = np.cos(angles), np.sin(angles)
+            x, y = uvs[:, 0]-origin[:, 0], uvs[:, 1]-origin[:, 1]
+            rotated = np.column_stack([x*cosTheta - y*sinTheta + origin[:, 0], x*sinTheta + y*cosTheta + origin[:, 1]]).astype(np.float32)
+            writeUvs(obj, rotated)
+    
+    # Delete the ortientation layer if it was empty
+    if not anythingRotated: mesh.attributes.remove(mesh.attributes[geotags.GEO_EDGE_UV_ROTATION_NAME])
     return anythingRotated
      
 # Makes a nice UV grid from tagged faces if any in individual UV islands (supports non-grid bits too)
@@ -167,6 +249,15 @@ def straightenUv(context, obj):
         gridifyLayer = geotags.getGridifyLayer(bm, forceCreation=False)
     if not gridifyLayer: return
     
+    # The islands are found from the mesh arrays, so they have to be synced with the edit mesh first
+    obj.update_from_editmode()
+    invalidateIslandIndex(obj)
+    islandIndex = getIslandIndex(obj)
+    gridify = np.empty(len(obj.data.polygons), dtype=np.int32)
+    obj.data.attributes[geotags.GEO_FACE_GRIDIFY_NAME].data.foreach_get("value", gridify)
+    loopTotals = np.empty(len(obj.data.polygons), dtype=np.int32)
+    obj.data.polygons.foreach_get("loop_total", loopTotals)
+    
     with helpers.editModeBmesh(obj, loop_triangles=False, destructive=False) as bm:
         uv_layer = bm.loops.layers.uv.active
 
@@ -174,28 +265,20 @@ def straightenUv(context, obj):
         bpy.ops.mesh.select_mode(type='FACE')
         bpy.ops.mesh.select_all(action='DESELECT')     
         
-        somethingFound = False
+        somethingFound = bool((gridify == geotags.GEO_FACE_GRIDIFY_INCLUDE).any())
         
-        islands = bmesh_linked_uv_islands(bm, uv_layer)
-        for island in islands:
-            # Explore the mesh and select the reference face
-            mainFace = None
-            gridFaces = []
-            forbiddenFaces = []
-            for f in island:
-                if f[gridifyLayer] == geotags.GEO_FACE_GRIDIFY_INCLUDE: 
-                    gridFaces.append(f)
-                    somethingFound = True
-                    # Use the first quad as our starting point
-                    if mainFace is None and len(f.edges) == 4:
-                        mainFace = f
-                        mainFace.select = True
-                        bm.faces.active = mainFace
-                elif f[gridifyLayer] == geotags.GEO_FACE_GRIDIFY_EXCLUDE: 
-                    forbiddenFaces.append(f)
-            
+        for island in range(islandIndex.count if somethingFound else 0):
+            faces = islandIndex.faces(island)
+            included = gridify[faces] == geotags.GEO_FACE_GRIDIFY_INCLUDE
+            # Use the first quad as our starting point
+            quads = faces[included & (loopTotals[faces] == 4)]
             # No relevant quad found, we can ignore the island
-            if mainFace is None: continue
+            if len(quads) == 0: continue
+            mainFace = bm.faces[quads[0]]
+            mainFace.select = True
+            bm.faces.active = mainFace
+            gridFaces = [bm.faces[f] for f in faces[included]]
+            forbiddenFaces = faces[gridify[faces] == geotags.GEO_FACE_GRIDIFY_EXCLUDE]
                 
             # Find the side lengths
             points = []
@@ -252,6 +335,7 @@ def straightenUv(context, obj):
         
         # Remove unused gridify layer if need be
         if not somethingFound: geotags.removeGridifyLayer(bm)
+    invalidateIslandIndex(obj)
     return
 
 def _filterUnwrappableOrPackableObjectsRecurs(all_objects, knownMeshes, acceptedTypes=['STANDARD']):
@@ -362,6 +446,19 @@ def lightmapPack(context, objectGroups):
             o.data.uv_layers[stgs.lightmapUVName].active = True
         pack(context, objects, context.scene.gflow.uvPackSettings)
 
+# Objects with the same settings give the same result whether they are unwrapped alone or together
+def getUnwrapSettingsKey(o):
+    return (o.gflow.unwrap_method, o.gflow.unwrap_fillHoles, o.gflow.unwrap_extraParameter, o.gflow.unwrap_smooth_iterations, o.gflow.unwrap_smooth_strength)
+def hasGridifyTags(o):
+    attribute = o.data.attributes.get(geotags.GEO_FACE_GRIDIFY_NAME)
+    if attribute is None: return False
+    values = np.empty(len(attribute.data), dtype=np.int32)
+    attribute.data.foreach_get("value", values)
+    if (values == geotags.GEO_FACE_GRIDIFY_INCLUDE).any(): return True
+    # Same as straightenUv: an unused gridify layer is removed
+    o.data.attributes.remove(attribute)
+    return False
+
 def unwrap(context, objects):
     bpy.ops.object.select_all(action='DESELECT')
     
@@ -369,6 +466,8 @@ def unwrap(context, objects):
     view = helpers.findActive3dView(context)
     if view and view.local_view: bpy.ops.view3d.localview()
 
+    groups = {}
+    individuals = []
     for o in objects:
         if not o.gflow.unwrap: continue
         
@@ -378,6 +477,29 @@ def unwrap(context, objects):
                 uv.active = True
                 break
         
+        # Gridified objects need operators on their own islands, so they are done one by one
+        if hasGridifyTags(o): individuals.append(o)
+        else: groups.setdefault(getUnwrapSettingsKey(o), []).append(o)
+    
+    # Everything else is unwrapped in one edit session per group of settings
+    for objs in groups.values():
+        for o in objs: o.select_set(True)
+        context.view_layer.objects.active = objs[0]
+        
+        bpy.ops.object.mode_set(mode='EDIT')
+        bpy.ops.mesh.select_all(action='SELECT')
+        bpy.ops.uv.select_all(action='SELECT')
+        bpy.ops.mesh.reveal(select=False)
+
+        safeUnwrap(context, objs[0])
+        if objs[0].gflow.unwrap_smooth_iterations>0:
+            bpy.ops.uv.minimize_stretch(blend=1.0-objs[0].gflow.unwrap_smooth_strength, iterations=objs[0].gflow.unwrap_smooth_iterations)
+        invalidateIslandIndex()
+        
+        bpy.ops.object.mode_set(mode='OBJECT')
+        bpy.ops.object.select_all(action='DESELECT')
+
+    for o in individuals:
         o.select_set(True)
         context.view_layer.objects.active = o
         
@@ -411,6 +533,7 @@ def safeUnwrap(context, o):
         bpy.ops.uv.unwrap(method=method, fill_holes=o.gflow.unwrap_fillHoles, margin=0.001)
     else:
         bpy.ops.uv.unwrap(method=method, fill_holes=o.gflow.unwrap_fillHoles, margin=0.001, iterations=o.gflow.unwrap_extraParameter)
+    invalidateIslandIndex(o)
     
 
 def pack(context, objects, packMethod = 'FAST'):
@@ -443,36 +566,38 @@ def pack(context, objects, packMethod = 'FAST'):
     # Deal with the scale
     ## First average everything
     bpy.ops.uv.average_islands_scale()
+    invalidateIslandIndex()
     ## Then rescale individual islands based on user values
+    # The UV post-processing works on the mesh arrays, so it happens in object mode
+    bpy.ops.object.mode_set(mode='OBJECT')
     for o in objects:
         rescaleIslandsIfNeeded(o)
-    bpy.ops.object.mode_set(mode='OBJECT')
 
     # Actual packing
     bpy.ops.object.mode_set(mode='EDIT')
     ## Pack into [0,1]
     generic_pack_island(context, margin=margin, shape_method=shapeMethod, rotate=True, rotate_method=rotateMethod)
+    bpy.ops.object.mode_set(mode='OBJECT')
     ## Go through individual objects and orient the islands
     anythingRotated = False
     for o in objects:
-        o.select_set(True)
-        context.view_layer.objects.active = o
         anythingRotated = orientUv(context, o) or anythingRotated
     ## Repack but without allowing rotation if anything has been manually rotated
     if anythingRotated:
+        bpy.ops.object.mode_set(mode='EDIT')
         bpy.ops.mesh.select_all(action='SELECT')
         bpy.ops.uv.select_all(action='SELECT')
         generic_pack_island(context, margin=margin, shape_method=shapeMethod, rotate=False, rotate_method=rotateMethod)
+        bpy.ops.object.mode_set(mode='OBJECT')
 
     # Snap UVs to pixels
     if context.scene.gflow.uvSnap:
         for o in objects:
             snapUv(o, resolution)
-    
-    # Exit
-    bpy.ops.object.mode_set(mode='OBJECT')
+    invalidateIslandIndex()
     pass
 def generic_pack_island(context, margin, shape_method, rotate, rotate_method):
+    invalidateIslandIndex()
     #BEGINTRIM --------------------------------------------------
     stgs = settings.getSettings()
     if stgs.uvPacker == "UVPACKER" and isUvPackerAvailable():
@@ -527,40 +652,27 @@ def packerio_pack_island(context, margin, rotate, rotate_method):
     return
     
 #ENDTRIM -----------------------------------------------------
+# Works in object mode
 def snapUv(obj, resolution):
-    with helpers.editModeBmesh(obj, loop_triangles=False, destructive=False) as bm:
-        uv_layer = bm.loops.layers.uv.active
-        for face in bm.faces:
-            for loop in face.loops:
-                uv = loop[uv_layer].uv
-                pixel = uv * resolution
-                pixel[0] = round(pixel[0])
-                pixel[1] = round(pixel[1])
-                uv = pixel / resolution
-                loop[uv_layer].uv = uv
+    if not obj.data.uv_layers.active: return
+    uvs = readUvs(obj.data)
+    writeUvs(obj, np.round(uvs*resolution)/resolution)
     return     
 
+# Works in object mode
 def rescaleIslandsIfNeeded(obj):
-    uvScaleLayer = None
-    with helpers.editModeObserverBmesh(obj) as bm:
-        uvScaleLayer = geotags.getUvScaleLayer(bm, forceCreation=False)
-    if not uvScaleLayer: return
+    uvScaleLayer = obj.data.attributes.get(geotags.GEO_FACE_UV_SCALE_NAME)
+    if not uvScaleLayer or not obj.data.uv_layers.active: return
     
-    with helpers.editModeBmesh(obj, loop_triangles=False, destructive=False) as bm:
-        uv_layer = bm.loops.layers.uv.active
-        neutralCode = geotags.getUvScaleCode(1.0)
-        for face in bm.faces:
-            if face[uvScaleLayer] == neutralCode: continue
-            scale = geotags.getUvScaleFromCode(face[uvScaleLayer])
-            for loop in face.loops:
-                loop[uv_layer].uv = loop[uv_layer].uv * scale    
+    codes = np.empty(len(obj.data.polygons), dtype=np.float32)
+    uvScaleLayer.data.foreach_get("value", codes)
+    if (codes == geotags.getUvScaleCode(1.0)).all(): return
+    scales = geotags.getUvScaleFromCode(codes)[getIslandIndex(obj).loopFaces]
+    writeUvs(obj, readUvs(obj.data)*scales[:, None])
 
 def offsetCoordinates(obj, offset=mathutils.Vector((1.0,1.0))):
-    with helpers.objectModeBmesh(obj) as bm:
-        uv_layer = bm.loops.layers.uv.active
-        for face in bm.faces:
-            for loop in face.loops:
-                loop[uv_layer].uv = loop[uv_layer].uv + offset    
+    if not obj.data.uv_layers.active: return
+    writeUvs(obj, readUvs(obj.data)+np.array(offset, dtype=np.float32))
 
 class GFLOW_OT_AutoUnwrap(bpy.types.Operator):
     bl_idname      = "gflow.auto_unwrap"
@@ -591,7 +703,9 @@ class GFLOW_OT_AutoUnwrap(bpy.types.Operator):
             udims = range(0, len(context.scene.gflow.udims))
         if event.shift: doUnwrap=False
             
-        autoUnwrap(context, udims, doUnwrap=doUnwrap)
+        from . import workers
+        if not workers.unwrapInWorkers(context, udims, doUnwrap=doUnwrap):
+            autoUnwrap(context, udims, doUnwrap=doUnwrap)
         
         return {'FINISHED'}
     def execute(self, context):
@@ -1308,6 +1422,14 @@ def onLoad(dummy):
     if len(bpy.context.scene.gflow.udims) == 0:
         bpy.context.scene.gflow.udims.add()
         bpy.context.scene.gflow.udims[0].name = "UDIM_0"
+    invalidateUvBounds()
+
+@bpy.app.handlers.persistent
+def onDepsgraphUpdate(scene, depsgraph):
+    if not uvBounds: return
+    for update in depsgraph.updates:
+        if isinstance(update.id, bpy.types.Mesh) and update.is_updated_geometry:
+            invalidateUvBounds(update.id.original)
 
 
 
@@ -1329,10 +1451,12 @@ def register():
     for c in classes: 
         bpy.utils.register_class(c)
     bpy.app.handlers.load_post.append(onLoad) # Make sure we have an udim whenever we load a new scene
+    bpy.app.handlers.depsgraph_update_post.append(onDepsgraphUpdate)
     
     pass
 def unregister():
     bpy.app.handlers.load_post.remove(onLoad)
+    bpy.app.handlers.depsgraph_update_post.remove(onDepsgraphUpdate)
     for c in reversed(classes): 
         helpers.safeUnregisterClass(c)
     pass
\ No newline at end of file
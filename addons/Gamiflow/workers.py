@@ -0,0 +1,576 @@
+import bpy
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from . import sets
+from . import sets_low
+from . import sets_high
+from . import sets_cage
+from . import sets_export
+from . import uv
+from . import settings
+from . import helpers
+from . import hashing
+from . import cache
+from . import tracing
+
+# Generation of the sets with several background Blender processes
+# The working set hierarchies are split in shards, each worker opens a snapshot of the file, generates its shard
+# and writes the result in a small library that gets appended back here.
+# Anything the workers reference that already existed in the snapshot (materials, anchors, node groups, etc.) is written by name only
+# and reconnected to the real data once appended, so the result is the same as a serial generation.
+# Kit exports work the same way except that the workers write their files directly and only send back a small JSON report.
+# Unwraps are split by UDIM instead of hierarchy, and the workers only send back the UV arrays of the meshes they unwrapped.
+
+SHARD_PREFIX = "GFLOW_SHARD_"
+ROLE_PROPERTY = "gflow_worker_role"
+NAME_PROPERTY = "gflow_worker_name"
+ROOT_PROPERTY = "gflow_worker_root"
+INDEX_PROPERTY = "gflow_worker_index"
+REFERENCES_PROPERTY = "gflow_worker_references"
+CACHE_PROPERTY = "gflow_worker_cache"
+
+# bpy.data collections for the ID types that can be referenced by name
+ID_COLLECTIONS = {
+    'OBJECT': "objects", 'MESH': "meshes", 'MATERIAL': "materials", 'NODETREE': "node_groups",
+    'ACTION': "actions", 'ARMATURE': "armatures", 'IMAGE': "images", 'COLLECTION': "collections",
+    'CURVE': "curves", 'TEXTURE': "textures", 'LATTICE': "lattices",
+}
+
+# Which set collections are generated by each kind of job
+def getTargets(context, kind, createIfNeeded=False):
+    if kind == 'LOW':
+        targets = {"low": sets_low.getCollection(context, createIfNeeded)}
+        if context.scene.gflow.useCage: targets["cage"] = sets_cage.getCollection(context, createIfNeeded)
+        return targets
+    if kind == 'HIGH': return {"high": sets_high.getCollection(context, createIfNeeded)}
+    return {"export": sets_export.getCollection(context, createIfNeeded)}
+
+def showSets(context, kind):
+    gflow = context.scene.gflow
+    visible = {
+        'LOW': [gflow.painterLowCollection, gflow.painterCageCollection],
+        'HIGH': [gflow.painterHighCollection],
+        'EXPORT': [gflow.exportCollection],
+    }[kind]
+    for c in [gflow.workingCollection, gflow.painterLowCollection, gflow.painterHighCollection, gflow.painterCageCollection, gflow.exportCollection]:
+        if c: sets.setCollectionVisibility(context, c, c in visible)
+
+#
+# Sharding
+#
+
+class ShardGroup:
+    def __init__(self):
+        self.roots = []
+        self.cost = 0
+
+# Hierarchies sharing data (meshes, instanced collections, modifier targets) must be generated by the same worker
+# otherwise things like the UV offset of instanced meshes or the collection instance templates would differ from a serial run
+def findShardGroups(context):
+    objectsPerRoot = {}
+    for o in context.scene.gflow.workingCollection.all_objects:
+        root = hashing.findHierarchyRoot(o)
+        if root not in objectsPerRoot: objectsPerRoot[root] = []
+        objectsPerRoot[root].append(o)
+    roots = list(objectsPerRoot.keys())
+
+    leader = {r: r for r in roots}
+    def find(r):
+        while leader[r] != r:
+            leader[r] = leader[leader[r]]
+            r = leader[r]
+        return r
+    def union(a, b):
+        a, b = find(a), find(b)
+        if a != b: leader[b] = a
+
+    owners = {}
+    cost = {r: 0 for r in roots}
+    for r in roots:
+        for o in objectsPerRoot[r]:
+            shared = []
+            if o.type == 'MESH':
+                shared.append(o.data)
+                cost[r] += len(o.data.polygons)
+            if helpers.isObjectCollectionInstancer(o) and o.instance_collection:
+                shared.append(o.instance_collection)
+                if o.instance_collection not in owners:
+                    cost[r] += sum(len(io.data.polygons) for io in o.instance_collection.all_objects if io.type == 'MESH')
+            for hp in o.gflow.highpolys:
+                if hp.obj and hp.obj.data: shared.append(hp.obj.data)
+            for m in o.modifiers:
+                for p in m.bl_rna.properties:
+                    if p.type != 'POINTER' or p.fixed_type is None or p.fixed_type.identifier != 'Object': continue
+                    referenced = getattr(m, p.identifier, None)
+                    if referenced: shared.append(hashing.findHierarchyRoot(referenced))
+            for s in shared:
+                if s in leader: union(s, r)
+                elif s in owners: union(owners[s], r)
+                else: owners[s] = r
+
+    groups = {}
+    for r in roots:
+        g = find(r)
+        if g not in groups: groups[g] = ShardGroup()
+        groups[g].roots.append(r.name)
+        groups[g].cost += cost[r] + 1
+    return list(groups.values())
+
+# Greedy balancing, biggest groups first
+def makeShards(groups, workerCount):
+    shards = [ShardGroup() for i in range(min(workerCount, len(groups)))]
+    for g in sorted(groups, key=lambda g: (-g.cost, g.roots[0])):
+        shard = min(shards, key=lambda s: s.cost)
+        shard.roots += g.roots
+        shard.cost += g.cost
+    return [s for s in shards if len(s.roots)>0]
+
+#
+# Worker side
+#
+
+def collectSnapshotIds():
+    ids = set()
+    for idType, attr in ID_COLLECTIONS.items():
+        for i in getattr(bpy.data, attr): ids.add((idType, i.name))
+    return ids
+
+def isSnapshotId(value, snapshotIds):
+    return isinstance(value, bpy.types.ID) and value.id_type in ID_COLLECTIONS and (value.id_type, value.name) in snapshotIds
+
+# Replaces every reference to the snapshot data by its name so that the library only contains what was generated
+def detachReferences(obj, snapshotIds):
+    references = []
+    def detachPointers(struct, path, depth=0, followCollections=False):
+        if struct is None or depth > 4: return
+        for p in struct.bl_rna.properties:
+            if p.is_readonly and p.type != 'COLLECTION': continue
+            if p.type == 'POINTER':
+                value = getattr(struct, p.identifier, None)
+                if isSnapshotId(value, snapshotIds):
+                    references.append(["attr", path, p.identifier, value.id_type, value.name])
+                    setattr(struct, p.identifier, None)
+            elif p.type == 'COLLECTION' and followCollections:
+                for index, item in enumerate(getattr(struct, p.identifier)):
+                    detachPointers(item, path+"."+p.identifier+"["+str(index)+"]", depth+1, followCollections)
+
+    detachPointers(obj.gflow, "gflow", followCollections=True)
+    for m in obj.modifiers:
+        path = 'modifiers["'+m.name+'"]'
+        detachPointers(m, path)
+        # Geometry node inputs are stored as custom properties
+        for k in m.keys():
+            if isSnapshotId(m[k], snapshotIds):
+                references.append(["idprop", path, k, m[k].id_type, m[k].name])
+                m[k] = None
+    for c in obj.constraints:
+        detachPointers(c, 'constraints["'+c.name+'"]')
+    if isSnapshotId(obj.parent, snapshotIds):
+        references.append(["attr", "", "parent", 'OBJECT', obj.parent.name])
+        matrix = obj.matrix_world.copy()
+        obj.parent = None
+        obj.matrix_world = matrix
+    if obj.animation_data and isSnapshotId(obj.animation_data.action, snapshotIds):
+        references.append(["attr", "animation_data", "action", 'ACTION', obj.animation_data.action.name])
+        obj.animation_data.action = None
+    for index, slot in enumerate(obj.material_slots):
+        if slot.link == 'OBJECT' and isSnapshotId(slot.material, snapshotIds):
+            references.append(["item", "", "material_slots", index, 'MATERIAL', slot.material.name])
+            slot.material = None
+
+    # Object data can't be removed, so we give the object its own copy and swap it back later
+    if isSnapshotId(obj.data, snapshotIds):
+        references.append(["attr", "", "data", obj.data.id_type, obj.data.name])
+        obj.data = obj.data.copy()
+    if obj.type == 'MESH':
+        for index, material in enumerate(obj.data.materials):
+            if isSnapshotId(material, snapshotIds):
+                references.append(["item", "data", "materials", index, 'MATERIAL', material.name])
+                obj.data.materials[index] = None
+    obj[REFERENCES_PROPERTY] = json.dumps(references)
+
+def runGenerator(context, kind, roots):
+    if kind == 'LOW': return sets_low.generatePainterLow(context, roots=roots)
+    if kind == 'HIGH': return sets_high.generatePainterHigh(context, roots=roots)
+    return sets_export.generateExport(context, incremental=False, roots=roots)
+
+def findSourceRootName(obj, gen):
+    if obj.gflow.exportSourceRoot: return obj.gflow.exportSourceRoot.name
+    top = obj
+    while top.parent and top not in gen.generatedToOriginal: top = top.parent
+    source = gen.findSource(top)
+    if source is None: return ""
+    return hashing.findHierarchyRoot(source).name
+
+def writeShard(context, kind, gen, snapshotIds, filepath):
+    datablocks = set()
+    for role, collection in getTargets(context, kind).items():
+        if collection is None: continue
+        shard = bpy.data.collections.new(SHARD_PREFIX+role)
+        shard[ROLE_PROPERTY] = role
+        for index, o in enumerate(collection.all_objects):
+            o[NAME_PROPERTY] = o.name
+            o[ROOT_PROPERTY] = findSourceRootName(o, gen)
+            o[INDEX_PROPERTY] = index
+            shard.objects.link(o)
+        datablocks.add(shard)
+    # Pointers have to be cleared once all the names are known
+    for shard in datablocks:
+        for o in shard.objects: detachReferences(o, snapshotIds)
+
+    # Send back the cache entries that were used so that the main file can keep them
+    report = cache.deferredReports.get(kind)
+    if report:
+        used = set(report["used"])
+        for m in bpy.data.meshes:
+            if cache.isCachedMesh(m) and m.get(cache.CACHE_KIND_PROPERTY) == kind and m[cache.CACHE_KEY_PROPERTY] in used: datablocks.add(m)
+        for shard in [d for d in datablocks if isinstance(d, bpy.types.Collection)]:
+            shard[CACHE_PROPERTY] = json.dumps(report)
+            break
+    bpy.data.libraries.write(filepath, datablocks, fake_user=True)
+
+def workerMain(argv=None):
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--")+1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(prog="gamiflow-worker")
+    parser.add_argument("--kind", required=True, choices=['LOW', 'HIGH', 'EXPORT', 'KIT', 'UNWRAP'])
+    parser.add_argument("--scene", required=True)
+    parser.add_argument("--roots", nargs="+", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--cache-folder", dest="cacheFolder", default="")
+    parser.add_argument("--export-folder", dest="exportFolder", default="")
+    parser.add_argument("--pack-only", dest="packOnly", action="store_true")
+    args = parser.parse_args(argv)
+
+    from . import batch
+    batch.ensureRegistered()
+    # The snapshot doesn't live next to the real file
+    cache.CACHE_FOLDER = args.cacheFolder if args.cacheFolder else None
+    cache.deferPruning = True
+
+    try:
+        scene = bpy.data.scenes[args.scene]
+        snapshotIds = collectSnapshotIds()
+        with bpy.context.temp_override(scene=scene, view_layer=scene.view_layers[0]):
+            if args.kind == 'KIT':
+                from . import export
+                results = export.exportKitRoots(bpy.context, args.exportFolder, [bpy.data.objects[n] for n in args.roots])
+                with open(args.output, "w") as f: json.dump(results, f)
+                sys.exit(0)
+            if args.kind == 'UNWRAP':
+                # The roots are UDIM indices here
+                udimIDs = [int(r) for r in args.roots]
+                uv.autoUnwrap(bpy.context, udimIDs, doUnwrap=not args.packOnly)
+                writeUvs(bpy.context, udimIDs, args.output)
+                sys.exit(0)
+            gen = runGenerator(bpy.context, args.kind, set(args.roots))
+            writeShard(bpy.context, args.kind, gen, snapshotIds, args.output)
+    except Exception as e:
+        print("GamiFlow: Worker failed:\n"+repr(e))
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+    sys.exit(0)
+
+# Active UV layer of every unwrapped mesh: a JSON list of {mesh, layer} and the matching arrays next to it
+def writeUvs(context, udimIDs, filepath):
+    unwrappables, collections = uv.filterUnwrappableOrPackableObjects(context.scene.gflow.workingCollection.all_objects)
+    meshes = []
+    arrays = {}
+    for o in unwrappables:
+        if o.gflow.textureSet not in udimIDs or not o.data.uv_layers.active: continue
+        arrays["uv_"+str(len(meshes))] = uv.readUvs(o.data)
+        meshes.append({"mesh": o.data.name, "layer": o.data.uv_layers.active.name})
+    np.savez(filepath+".npz", **arrays)
+    with open(filepath, "w") as f: json.dump(meshes, f)
+
+#
+# Main session side
+#
+
+def reattachReferences(obj, replacedData):
+    references = json.loads(obj.get(REFERENCES_PROPERTY, "[]"))
+    for r in references:
+        kind, path = r[0], r[1]
+        owner = obj.path_resolve(path) if path else obj
+        idType, name = r[-2], r[-1]
+        value = getattr(bpy.data, ID_COLLECTIONS[idType]).get(name)
+        if value is None:
+            print("GamiFlow: Could not find "+name+" referenced by "+obj.name)
+            continue
+        if kind == "attr":
+            if r[2] == "data": replacedData.append(obj.data)
+            if r[2] == "parent":
+                matrix = obj.matrix_world.copy()
+                obj.parent = value
+                obj.matrix_world = matrix
+            else:
+                setattr(owner, r[2], value)
+        elif kind == "item":
+            collection = getattr(owner, r[2])
+            if r[2] == "material_slots": collection[r[3]].material = value
+            else: collection[r[3]] = value
+        elif kind == "idprop":
+            owner[r[2]] = value
+
+def mergeShards(context, kind, shardFiles, rootOrder):
+    targets = getTargets(context, kind, createIfNeeded=True)
+    appended = []
+    shardCollections = []
+    cacheReports = []
+    for shardIndex, path in enumerate(shardFiles):
+        with bpy.data.libraries.load(path, link=False) as (dataFrom, dataTo):
+            dataTo.collections = [n for n in dataFrom.collections if n.startswith(SHARD_PREFIX)]
+            dataTo.meshes = [n for n in dataFrom.meshes if n.startswith("GFLOW_")]
+        for shard in dataTo.collections:
+            if shard is None: continue
+            shardCollections.append(shard)
+            if CACHE_PROPERTY in shard.keys(): cacheReports.append(json.loads(shard[CACHE_PROPERTY]))
+            for o in shard.objects: appended.append((shard[ROLE_PROPERTY], shardIndex, o))
+
+    # Link everything in the same order as a serial run would have created them
+    def sortKey(item):
+        role, shardIndex, o = item
+        return (rootOrder.get(o[ROOT_PROPERTY], len(rootOrder)), shardIndex, o[INDEX_PROPERTY])
+    appended.sort(key=sortKey)
+    replacedData = []
+    for role, shardIndex, o in appended:
+        targets[role].objects.link(o)
+    for shard in shardCollections:
+        bpy.data.collections.remove(shard)
+    for role, shardIndex, o in appended:
+        reattachReferences(o, replacedData)
+        o.name = o[NAME_PROPERTY]
+        o.use_fake_user = False
+        for p in [NAME_PROPERTY, ROOT_PROPERTY, INDEX_PROPERTY, REFERENCES_PROPERTY]:
+            if p in o.keys(): del o[p]
+    for d in replacedData:
+        if d.users == 0: getattr(bpy.data, ID_COLLECTIONS[d.id_type]).remove(d)
+
+    if kind == 'EXPORT' and settings.getSettings().renameExportMeshes:
+        for role, shardIndex, o in appended:
+            if o.type == 'MESH' and o.data.users == 1: o.data.name = o.name
+
+    if context.scene.gflow.useCache and kind != 'EXPORT':
+        cache.mergeDeferredReports(context.scene, kind, cacheReports, useFolder=kind == 'HIGH' and context.scene.gflow.highCacheLocation == 'FOLDER')
+    return len(appended)
+
+# Returns False if the job wasn't worth splitting or couldn't be done, in which case it should be done the usual way
+def generateInWorkers(context, kind, workerCount=None):
+    if workerCount is None: workerCount = settings.getSettings().workerCount
+    if workerCount <= 1: return False
+
+    working = context.scene.gflow.workingCollection
+    tracing.phase("Sharding")
+    rootOrder = {}
+    for o in working.all_objects:
+        root = hashing.findHierarchyRoot(o)
+        if root.name not in rootOrder: rootOrder[root.name] = len(rootOrder)
+
+    # Only the outdated hierarchies need to be generated again
+    keptRoots = set()
+    if kind == 'EXPORT':
+        collection = sets_export.getCollection(context, createIfNeeded=False)
+        if collection and context.scene.gflow.incrementalExport:
+            hasher = hashing.ContentHasher()
+            salt = hashing.settingsHash(context)
+            rootHashes = {}
+            for o in working.all_objects:
+                root = hashing.findHierarchyRoot(o)
+                if root not in rootHashes: rootHashes[root] = hasher.hierarchy(root, salt)
+            keptRoots = set(r.name for r in sets_export.findReusableRoots(collection, rootHashes))
+    groups = [g for g in findShardGroups(context) if not all(r in keptRoots for r in g.roots)]
+    shards = makeShards(groups, workerCount)
+    if len(shards) == 0 and len(keptRoots) > 0: return True # nothing changed
+    if len(shards) <= 1: return False
+    if len(keptRoots) > 0:
+        # A group is always generated as a whole, even if only part of it changed
+        regenerated = set(r for s in shards for r in s.roots)
+        for o in list(sets_export.getCollection(context).all_objects):
+            root = o.gflow.exportSourceRoot
+            if root and root.name in regenerated: sets.deleteObject(o)
+
+    # The workers would otherwise each create their own copy of the missing texture set materials
+    for i in range(len(context.scene.gflow.udims)):
+        sets.getTextureSetMaterial(i)
+
+    folder = tempfile.mkdtemp(prefix="gamiflow_")
+    try:
+        tracing.phase("Snapshot")
+        snapshot = os.path.join(folder, "snapshot.blend")
+        bpy.ops.wm.save_as_mainfile(filepath=snapshot, copy=True)
+        cacheFolder = cache.getCacheFolder() or ""
+        expression = "import importlib; importlib.import_module('"+__package__+".workers').workerMain()"
+
+        print("GamiFlow: Generating "+kind+" set with "+str(len(shards))+" workers")
+        tracing.phase("Workers")
+        processes = []
+        shardFiles = []
+        for index, shard in enumerate(shards):
+            output = os.path.join(folder, "shard_"+str(index)+".blend")
+            log = open(os.path.join(folder, "shard_"+str(index)+".log"), "w")
+            command = [bpy.app.binary_path, "--background", snapshot, "--python-expr", expression, "--",
+                "--kind", kind, "--scene", context.scene.name, "--output", output, "--cache-folder", cacheFolder, "--roots"] + shard.roots
+            processes.append((subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT), log))
+            shardFiles.append(output)
+
+        failed = False
+        for index, (process, log) in enumerate(processes):
+            with tracing.span("Worker "+str(index)): process.wait()
+            log.close()
+            if process.returncode != 0 or not os.path.exists(shardFiles[index]):
+                failed = True
+                with open(log.name) as f:
+                    print("GamiFlow: Worker "+str(index)+" failed:\n"+f.read()[-4000:])
+        if failed: return False
+
+        # Only now can we replace the current set
+        tracing.phase("Merge shards")
+        targets = getTargets(context, kind, createIfNeeded=False)
+        for role, collection in targets.items():
+            if collection is None: continue
+            if kind == 'EXPORT' and len(keptRoots) > 0: continue # the outdated objects are already gone
+            sets.clearCollection(collection)
+        count = mergeShards(context, kind, shardFiles, rootOrder)
+        showSets(context, kind)
+        print("GamiFlow: Merged "+str(count)+" objects from "+str(len(shards))+" workers")
+        return True
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+# Exports the roots of a kit with background workers
+# Returns the per-root results in the order of the roots, or None if it should be done in this session
+def exportKitInWorkers(context, folder, roots, workerCount=None):
+    if workerCount is None: workerCount = settings.getSettings().workerCount
+    if workerCount <= 1 or len(roots) <= 1: return None
+
+    groups = []
+    for r in roots:
+        g = ShardGroup()
+        g.roots.append(r.name)
+        g.cost = 1 + sum(len(o.data.polygons) for o in [r]+list(r.children_recursive) if o.type == 'MESH')
+        groups.append(g)
+    shards = makeShards(groups, workerCount)
+    if len(shards) <= 1: return None
+
+    tempFolder = tempfile.mkdtemp(prefix="gamiflow_")
+    try:
+        tracing.phase("Snapshot")
+        snapshot = os.path.join(tempFolder, "snapshot.blend")
+        bpy.ops.wm.save_as_mainfile(filepath=snapshot, copy=True)
+        expression = "import importlib; importlib.import_module('"+__package__+".workers').workerMain()"
+
+        print("GamiFlow: Exporting "+str(len(roots))+" kit files with "+str(len(shards))+" workers")
+        tracing.phase("Workers")
+        processes = []
+        for index, shard in enumerate(shards):
+            output = os.path.join(tempFolder, "kit_"+str(index)+".json")
+            log = open(os.path.join(tempFolder, "kit_"+str(index)+".log"), "w")
+            command = [bpy.app.binary_path, "--background", snapshot, "--python-expr", expression, "--",
+                "--kind", 'KIT', "--scene", context.scene.name, "--output", output, "--export-folder", folder, "--roots"] + shard.roots
+            processes.append((subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT), log, output))
+
+        results = {}
+        for index, (process, log, output) in enumerate(processes):
+            with tracing.span("Worker "+str(index)): process.wait()
+            log.close()
+            if process.returncode == 0 and os.path.exists(output):
+                with open(output) as f:
+                    for r in json.load(f): results[r["root"]] = r
+            else:
+                with open(log.name) as f:
+                    print("GamiFlow: Kit worker "+str(index)+" failed:\n"+f.read()[-4000:])
+        # Whatever a crashed worker didn't report is a failure too
+        return [results.get(r.name, {"root": r.name, "file": "", "seconds": 0.0, "error": "Worker failed"}) for r in roots]
+    finally:
+        shutil.rmtree(tempFolder, ignore_errors=True)
+
+# Unwraps and packs the UDIMs with background workers, the UDIMs being balanced between them by polygon count
+# Returns False if it should be done in this session
+def unwrapInWorkers(context, udimIDs, doUnwrap=True, workerCount=None):
+    if workerCount is None: workerCount = settings.getSettings().workerCount
+    if workerCount <= 1 or context.scene.gflow.mergeUdims: return False
+
+    unwrappables, collections = uv.filterUnwrappableOrPackableObjects(context.scene.gflow.workingCollection.all_objects)
+    groups = []
+    for texset in udimIDs:
+        if context.scene.gflow.udims[texset].locked: continue
+        objects = [o for o in unwrappables if o.gflow.textureSet == texset]
+        if len(objects) == 0: continue
+        g = ShardGroup()
+        g.roots.append(str(texset))
+        g.cost = sum(len(o.data.polygons) for o in objects)
+        groups.append(g)
+    shards = makeShards(groups, workerCount)
+    if len(shards) <= 1: return False
+
+    folder = tempfile.mkdtemp(prefix="gamiflow_")
+    try:
+        tracing.phase("Snapshot")
+        snapshot = os.path.join(folder, "snapshot.blend")
+        bpy.ops.wm.save_as_mainfile(filepath=snapshot, copy=True)
+        expression = "import importlib; importlib.import_module('"+__package__+".workers').workerMain()"
+
+        print("GamiFlow: Unwrapping "+str(len(groups))+" UDIMs with "+str(len(shards))+" workers")
+        tracing.phase("Workers")
+        processes = []
+        for index, shard in enumerate(shards):
+            output = os.path.join(folder, "uv_"+str(index)+".json")
+            log = open(os.path.join(folder, "uv_"+str(index)+".log"), "w")
+            command = [bpy.app.binary_path, "--background", snapshot, "--python-expr", expression, "--",
+                "--kind", 'UNWRAP', "--scene", context.scene.name, "--output", output, "--roots"] + shard.roots
+            if not doUnwrap: command.append("--pack-only")
+            processes.append((subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT), log, output))
+
+        # Nothing is written back unless every worker succeeded, so that a failure leaves the UVs as they were
+        # All the workers are waited for either way, the snapshot can't be deleted while they use it
+        results = []
+        failed = False
+        for index, (process, log, output) in enumerate(processes):
+            with tracing.span("Worker "+str(index)): process.wait()
+            log.close()
+            if process.returncode != 0 or not os.path.exists(output):
+                failed = True
+                with open(log.name) as f:
+                    print("GamiFlow: Unwrap worker "+str(index)+" failed:\n"+f.read()[-4000:])
+                continue
+            if failed: continue
+            with open(output) as f: meshes = json.load(f)
+            with np.load(output+".npz") as arrays:
+                results += [(m["mesh"], m["layer"], arrays["uv_"+str(i)]) for i, m in enumerate(meshes)]
+        if failed: return False
+
+        tracing.phase("Write UVs")
+        for meshName, layerName, uvs in results:
+            mesh = bpy.data.meshes.get(meshName)
+            if mesh is None or len(mesh.loops) != len(uvs):
+                print("GamiFlow: Could not write back the UVs of "+meshName)
+                continue
+            layer = mesh.uv_layers.get(layerName)
+            if layer is None: layer = mesh.uv_layers.new(name=layerName)
+            layer.active = True
+            layer.data.foreach_set("uv", uvs.ravel())
+            mesh.update()
+        uv.invalidateIslandIndex()
+        print("GamiFlow: Unwrapped "+str(len(results))+" meshes with "+str(len(shards))+" workers")
+        return True
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+classes = []
+
+def register():
+    for c in classes:
+        bpy.utils.register_class(c)
+    pass
+def unregister():
+    for c in reversed(classes):
+        helpers.safeUnregisterClass(c)
+    pass
@@ -0,0 +1,132 @@
+import bpy
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import tomllib
+import addon_utils
+
+# Usage:
+#   blender --background --python benchmarks/run_benchmarks.py -- --sizes 10 100 1000 10000 --output results.json
+# Builds a synthetic scene for every size and times each GamiFlow stage on it.
+# The results are written as JSON so that they can be compared between versions.
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import synthetic_scene
+
+STAGES = ["unwrap", "low", "high", "export", "bake", "painter_export", "final_export"]
+
+def runStage(addon, context, stage, outputFolder):
+    gflow = context.scene.gflow
+    if stage == "unwrap":
+        addon.uv.autoUnwrap(context, range(0, len(gflow.udims)))
+        return {}
+    if stage == "low":
+        addon.sets_low.generatePainterLow(context)
+        return {"objects": len(gflow.painterLowCollection.all_objects), "polygons": synthetic_scene.countPolygons(gflow.painterLowCollection),
+            "cageObjects": len(gflow.painterCageCollection.all_objects) if gflow.painterCageCollection else 0}
+    if stage == "high":
+        addon.sets_high.generatePainterHigh(context)
+        return {"objects": len(gflow.painterHighCollection.all_objects), "polygons": synthetic_scene.countPolygons(gflow.painterHighCollection)}
+    if stage == "export":
+        addon.sets_export.generateExport(context, incremental=False)
+        return {"objects": len(gflow.exportCollection.all_objects), "polygons": synthetic_scene.countPolygons(gflow.exportCollection)}
+    if stage == "bake":
+        addon.baker.bake(context)
+        return {}
+    if stage == "painter_export":
+        return {"files": len(addon.export.exportPainter(context, outputFolder))}
+    if stage == "final_export":
+        return {"files": len(addon.export.exportFinal(context, outputFolder))}
+
+# Extensions keep their version in the manifest, legacy add-ons in bl_info
+def getAddonVersion(addon):
+    manifest = os.path.join(os.path.dirname(addon.__file__), "blender_manifest.toml")
+    if os.path.exists(manifest):
+        with open(manifest, "rb") as f: return tomllib.load(f)["version"]
+    return ".".join(str(v) for v in addon.bl_info["version"])
+
+def runSize(addon, config, stages, repeat):
+    samples = {stage: [] for stage in stages}
+    counts = {}
+    for r in range(repeat):
+        # Start from an empty file every time so that nothing is cached between runs
+        bpy.ops.wm.read_homefile(use_empty=True)
+        start = time.perf_counter()
+        scene = synthetic_scene.buildScene(addon, config)
+        buildTime = time.perf_counter()-start
+
+        with tempfile.TemporaryDirectory() as outputFolder, bpy.context.temp_override(scene=scene, view_layer=scene.view_layers[0]):
+            context = bpy.context
+            for stage in stages:
+                start = time.perf_counter()
+                counts[stage] = runStage(addon, context, stage, outputFolder)
+                samples[stage].append(time.perf_counter()-start)
+                print("Benchmark: "+str(config.objectCount)+" objects, "+stage+": "+str(round(samples[stage][-1], 3))+"s")
+
+    result = {
+        "objects": config.objectCount,
+        "workingPolygons": synthetic_scene.countPolygons(scene.gflow.workingCollection),
+        "buildSeconds": round(buildTime, 4),
+        "stages": {},
+    }
+    for stage in stages:
+        result["stages"][stage] = {
+            "median": round(statistics.median(samples[stage]), 4),
+            "min": round(min(samples[stage]), 4),
+            "samples": [round(s, 4) for s in samples[stage]],
+            "counts": counts[stage],
+        }
+    return result
+
+def main():
+    argv = sys.argv[sys.argv.index("--")+1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(prog="run_benchmarks")
+    parser.add_argument("--addon", default="bl_ext.user_default.gamiflow_full", help="Module name of the add-on: bl_ext.<repository>.gamiflow_full for an extension, Gamiflow for a legacy add-on")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100, 1000, 10000])
+    parser.add_argument("--stages", nargs="+", default=[s for s in STAGES if s != "bake"], choices=STAGES, help="Baking is slow and needs Cycles so it is not run by default")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--subdivisions", type=int, default=2)
+    parser.add_argument("--edge-tags", dest="edgeTags", type=float, default=0.05)
+    parser.add_argument("--face-tags", dest="faceTags", type=float, default=0.02)
+    parser.add_argument("--mirrors", type=float, default=0.1)
+    parser.add_argument("--shape-keys", dest="shapeKeys", type=float, default=0.05)
+    parser.add_argument("--udims", type=int, default=2)
+    parser.add_argument("--lods", type=int, default=2)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args(argv)
+
+    addon_utils.enable(args.addon, default_set=False)
+    addon = synthetic_scene.getAddon(args.addon)
+
+    report = {
+        "blender": ".".join(str(v) for v in bpy.app.version),
+        "addonVersion": getAddonVersion(addon),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "runs": [],
+    }
+    for size in args.sizes:
+        config = synthetic_scene.SceneConfig(objectCount=size, seed=args.seed)
+        config.subdivisions = args.subdivisions
+        config.edgeTagDensity = args.edgeTags
+        config.faceTagDensity = args.faceTags
+        config.mirrorRatio = args.mirrors
+        config.shapeKeyRatio = args.shapeKeys
+        config.udimCount = args.udims
+        config.lodCount = args.lods
+        result = runSize(addon, config, args.stages, args.repeat)
+        result["config"] = config.toDict()
+        report["runs"].append(result)
+        # Written after every size so that a crash on the largest scenes doesn't lose everything
+        with open(args.output, "w") as f: json.dump(report, f, indent=2)
+    print("Benchmark: results written to "+os.path.abspath(args.output))
+
+if __name__ == "__main__":
+    main()
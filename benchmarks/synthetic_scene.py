@@ -0,0 +1,174 @@
+import bpy
+import bmesh
+import math
+import random
+import importlib
+
+# Procedural GamiFlow scenes for benchmarking
+# Everything is driven by a seeded random generator so that the same configuration always gives the exact same scene
+
+class SceneConfig:
+    def __init__(self, objectCount=100, seed=0):
+        self.objectCount = objectCount
+        self.seed = seed
+        self.subdivisions = 2          # cuts on each side of the base cube
+        self.hierarchyDepth = 3        # objects are parented in chains of up to this many objects
+        self.edgeTagDensity = 0.05     # fraction of edges tagged as detail edges
+        self.collapseTagDensity = 0.02 # fraction of edges tagged for collapsing
+        self.faceTagDensity = 0.02     # fraction of faces tagged as detail faces
+        self.mirrorRatio = 0.1         # fraction of objects with partial symmetry
+        self.shapeKeyRatio = 0.05      # fraction of objects with shape keys
+        self.bevelRatio = 0.25         # fraction of objects with a high-poly only bevel
+        self.instanceTemplates = 2     # number of collections used as instances
+        self.instanceDepth = 2         # how deeply the instanced collections nest into each other
+        self.instanceRatio = 0.05      # fraction of the objects that are collection instances
+        self.udimCount = 2
+        self.lodCount = 2
+        self.useCage = True
+    def toDict(self):
+        return dict(self.__dict__)
+
+def getAddon(addonName):
+    return importlib.import_module(addonName)
+
+def createMesh(name, config, rng):
+    mesh = bpy.data.meshes.new(name)
+    bm = bmesh.new()
+    bmesh.ops.create_cube(bm, size=1.0)
+    if config.subdivisions > 0:
+        bmesh.ops.subdivide_edges(bm, edges=bm.edges[:], cuts=config.subdivisions, use_grid_fill=True)
+    # Mark a few seams so that the unwrap has something to do
+    for e in bm.edges:
+        if abs(e.verts[0].co.z-e.verts[1].co.z) > 0.0 and abs(e.verts[0].co.x) > 0.49 and abs(e.verts[0].co.y) > 0.49: e.seam = True
+    bm.to_mesh(mesh)
+    bm.free()
+    return mesh
+
+def tagMesh(addon, obj, config, rng, mirror):
+    geotags = addon.geotags
+    bm = bmesh.new()
+    bm.from_mesh(obj.data)
+    if config.edgeTagDensity > 0:
+        layer = geotags.getDetailEdgesLayer(bm, forceCreation=True)
+        for e in bm.edges:
+            if rng.random() < config.edgeTagDensity:
+                e[layer] = rng.choice([geotags.GEO_EDGE_LEVEL_PAINTER, geotags.GEO_EDGE_LEVEL_LOD0, geotags.GEO_EDGE_LEVEL_LOD0+1])
+    if config.collapseTagDensity > 0:
+        layer = geotags.getCollapseEdgesLayer(bm, forceCreation=True)
+        for e in bm.edges:
+            if rng.random() < config.collapseTagDensity: e[layer] = geotags.GEO_EDGE_COLLAPSE_LOD0+rng.randint(0, 1)
+    if config.faceTagDensity > 0:
+        layer = geotags.getDetailFacesLayer(bm, forceCreation=True)
+        for f in bm.faces:
+            if rng.random() < config.faceTagDensity: f[layer] = geotags.GEO_FACE_LEVEL_LOD0+rng.randint(0, 1)
+    if mirror:
+        # Only keep one half and tag it for mirroring
+        bmesh.ops.delete(bm, geom=[f for f in bm.faces if f.calc_center_median().x < 0.0], context="FACES")
+        layer = geotags.getMirrorLayer(bm, forceCreation=True)
+        for f in bm.faces: f[layer] = geotags.GEO_FACE_MIRROR_X
+    bm.to_mesh(obj.data)
+    bm.free()
+
+def addShapeKeys(obj, rng):
+    obj.shape_key_add(name="Basis", from_mix=False)
+    key = obj.shape_key_add(name="Bulge", from_mix=False)
+    for point in key.data:
+        point.co = point.co*(1.0+0.1*rng.random())
+    key.value = 0.5
+
+def createObject(addon, config, rng, collection, name, index):
+    obj = bpy.data.objects.new(name, createMesh(name, config, rng))
+    collection.objects.link(obj)
+    obj.gflow.registered = True
+    obj.gflow.textureSet = index % max(config.udimCount, 1)
+    tagMesh(addon, obj, config, rng, mirror=rng.random() < config.mirrorRatio)
+    if rng.random() < config.shapeKeyRatio: addShapeKeys(obj, rng)
+    if rng.random() < config.bevelRatio:
+        bevel = obj.modifiers.new(type="BEVEL", name="GFLOW Bevel")
+        bevel.segments = 2
+        bevel.width = 0.02
+        bevel.show_render = False
+    return obj
+
+# Collections used as instances, each one can instance the previous one
+def createTemplates(addon, config, rng, root):
+    templates = []
+    for t in range(config.instanceTemplates):
+        previous = None
+        for depth in range(max(config.instanceDepth, 1)):
+            c = bpy.data.collections.new("Template_"+str(t)+"_"+str(depth))
+            root.children.link(c)
+            for i in range(3):
+                o = createObject(addon, config, rng, c, c.name+"_part"+str(i), i)
+                o.location = (i*1.5, 0.0, 0.0)
+            if previous:
+                empty = bpy.data.objects.new(c.name+"_nested", None)
+                empty.instance_type = 'COLLECTION'
+                empty.instance_collection = previous
+                empty.location = (0.0, 2.0, 0.0)
+                c.objects.link(empty)
+            previous = c
+        templates.append(previous)
+    return templates
+
+def buildScene(addon, config, sceneName="Benchmark"):
+    rng = random.Random(config.seed)
+    scene = bpy.data.scenes.new(sceneName)
+    if bpy.context.window: bpy.context.window.scene = scene
+
+    # The templates live outside of the working set and are excluded from the view layer
+    templateRoot = bpy.data.collections.new("Templates")
+    scene.collection.children.link(templateRoot)
+    working = bpy.data.collections.new("Working")
+    scene.collection.children.link(working)
+
+    gflow = scene.gflow
+    gflow.version = 3
+    gflow.udims.clear()
+    for i in range(max(config.udimCount, 1)):
+        gflow.udims.add()
+        gflow.udims[-1].name = "UDIM_"+str(i)
+    gflow.lod.lods.clear()
+    for i in range(max(config.lodCount, 1)):
+        gflow.lod.lods.add()
+        if i > 0:
+            gflow.lod.lods[-1].decimate = True
+            gflow.lod.lods[-1].decimateAmount = 0.5**i
+    gflow.useCage = config.useCage
+    gflow.uvResolution = '512'
+    gflow.workingCollection = working
+
+    templates = createTemplates(addon, config, rng, templateRoot)
+
+    gridSize = math.ceil(math.sqrt(config.objectCount))
+    parent = None
+    chainLength = 0
+    for index in range(config.objectCount):
+        location = ((index % gridSize)*3.0, (index // gridSize)*3.0, 0.0)
+        name = "Object_"+str(index).zfill(5)
+        if templates and rng.random() < config.instanceRatio:
+            obj = bpy.data.objects.new(name, None)
+            obj.instance_type = 'COLLECTION'
+            obj.instance_collection = rng.choice(templates)
+            working.objects.link(obj)
+        else:
+            obj = createObject(addon, config, rng, working, name, index)
+        obj.location = location
+
+        # Build small hierarchies
+        if parent and chainLength < config.hierarchyDepth:
+            obj.parent = parent
+            obj.location = (0.0, 0.0, 1.5)
+            chainLength += 1
+        else:
+            parent = obj
+            chainLength = 1
+
+    layer = scene.view_layers[0].layer_collection
+    for c in layer.children:
+        if c.collection == templateRoot: c.exclude = True
+    return scene
+
+def countPolygons(collection):
+    if collection is None: return 0
+    return sum(len(o.data.polygons) for o in collection.all_objects if o.type == 'MESH')